@@ -0,0 +1,63 @@
+"""
+Compares two benchmark result files (benchmarks/pipeline.py output) and flags regressions.
+
+Usage (from the project root):
+    python benchmarks/compare.py benchmarks/results/<old>.json benchmarks/results/<new>.json [--threshold 1.2]
+
+Exits with status 1 when a benchmark got slower than threshold x its old median.
+"""
+import argparse
+import json
+import sys
+
+
+def _load(path):
+    with open(path) as f:
+        data = json.load(f)
+    results = {
+        (row['benchmark'], row['document']): row
+        for row in data['results'] if 'median_seconds' in row
+    }
+    return data.get('meta', {}), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=1.2, help="new/old ratio reported as a regression.")
+    parser.add_argument('--min-seconds', type=float, default=0.001,
+                        help="Ignore benchmarks faster than this in both runs (timer noise).")
+    args = parser.parse_args()
+
+    old_meta, old = _load(args.old)
+    new_meta, new = _load(args.new)
+    print(f"old: {old_meta.get('git_commit')} ({old_meta.get('created_at')})")
+    print(f"new: {new_meta.get('git_commit')} ({new_meta.get('created_at')})")
+    print(f"{'benchmark':<58} {'document':<28} {'old (s)':>10} {'new (s)':>10} {'ratio':>7}")
+
+    regressions = 0
+    for key in sorted(old.keys() & new.keys()):
+        old_seconds, new_seconds = old[key]['median_seconds'], new[key]['median_seconds']
+        if max(old_seconds, new_seconds) < args.min_seconds:
+            continue
+        ratio = new_seconds / old_seconds if old_seconds > 0 else float('inf')
+        flag = ''
+        if ratio > args.threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        elif ratio < 1 / args.threshold:
+            flag = '  faster'
+        print(f"{key[0]:<58} {key[1]:<28} {old_seconds:10.4f} {new_seconds:10.4f} {ratio:7.2f}{flag}")
+
+    for key in sorted(old.keys() - new.keys()):
+        print(f"{key[0]:<58} {key[1]:<28} only in old")
+    for key in sorted(new.keys() - old.keys()):
+        print(f"{key[0]:<58} {key[1]:<28} only in new")
+
+    print(f"{regressions} regressions (threshold {args.threshold}x).")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Embedding backend benchmark: throughput of the same model on PyTorch (HuggingFaceEmbedding) and
+on ONNX Runtime (fp32 and int8 graphs, one session per thread count), and cosine similarity of
+the ONNX vectors to the PyTorch ones on the same texts. Each backend embeds the texts in fixed
+batches in input order and in length-sorted batches under a token budget (as embed_texts does),
+with their padding ratio.
+
+Needs the real model (downloaded on first use) and, for the ONNX backends, onnxruntime and
+tokenizers; graphs missing from settings.ONNX_MODEL_ROOT are exported first, which needs torch.
+NDCG parity on the stored analyses is checked with `python manage.py check_embedding_parity`.
+
+Usage (from the project root):
+    python benchmarks/embedding_backends.py [--model BAAI/bge-small-en-v1.5] [--backends torch onnx onnx-int8]
+                                            [--threads 1 2 4 8] [--texts 512] [--chars 800] [--runs 3]
+                                            [--batching fixed bucketed] [--output backends.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+
+import django  # noqa: E402
+
+django.setup()
+
+import numpy as np  # noqa: E402
+
+from benchmarks import synthetic  # noqa: E402
+from experiments.service import embedding_registry, onnx_embedding  # noqa: E402
+
+
+def _texts(n_texts: int, max_chars: int):
+    """Texts of 50 to max_chars characters, like the chunks of strategies of different sizes."""
+    rng = random.Random(0)
+    sizes = [rng.randint(min(50, max_chars), max_chars) for _ in range(n_texts)]
+    document = synthetic.make_document(sum(sizes) + 1)
+    offsets = [0]
+    for size in sizes:
+        offsets.append(offsets[-1] + size)
+    return [document[start: end] for start, end in zip(offsets, offsets[1:])]
+
+
+def _batches(model, texts, batching: str, batch_size: int, token_budget: int):
+    """Index batches and padded tokens: fixed-size batches in input order, or embed_texts' plan."""
+    lengths = embedding_registry.token_lengths(model, texts)
+    if batching == 'fixed':
+        batches = [list(range(i, min(i + batch_size, len(texts)))) for i in range(0, len(texts), batch_size)]
+    else:
+        batches = embedding_registry.plan_batches(lengths, token_budget, embedding_registry.get_batch_size())
+    padded = sum(len(batch) * max(lengths[i] for i in batch) for batch in batches)
+    return batches, sum(lengths), padded
+
+
+def _load(model_name: str, backend: str, threads: int, batch_size: int):
+    if backend == embedding_registry.BACKEND_TORCH:
+        return embedding_registry.get_embed_model(model_name)
+    onnx_embedding.ensure_exported(model_name, backend)
+    return onnx_embedding.OnnxEmbedding(model_name, backend=backend, threads=threads, embed_batch_size=batch_size)
+
+
+def _measure(model, texts, batches, runs: int):
+    model.get_text_embedding_batch(texts[:8])  # Warm-up: first run allocations, lazy init
+    seconds, vectors = [], [None] * len(texts)
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        for batch in batches:
+            for index, vector in zip(batch, model.get_text_embedding_batch([texts[i] for i in batch])):
+                vectors[index] = vector
+        seconds.append(time.perf_counter() - t0)
+    return statistics.median(seconds), np.asarray(vectors, dtype=np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='BAAI/bge-small-en-v1.5')
+    parser.add_argument('--backends', nargs='+', default=list(embedding_registry.BACKENDS),
+                        choices=embedding_registry.BACKENDS)
+    parser.add_argument('--threads', nargs='+', type=int, default=[0],
+                        help="ONNX Runtime intra-op threads to try (0: ONNX Runtime default).")
+    parser.add_argument('--texts', type=int, default=512)
+    parser.add_argument('--chars', type=int, default=2000, help="Maximum characters per text.")
+    parser.add_argument('--batch-size', type=int, default=32, help="Texts per batch of the fixed batching.")
+    parser.add_argument('--token-budget', type=int, default=embedding_registry.get_token_budget(),
+                        help="Padded tokens per batch of the bucketed batching.")
+    parser.add_argument('--batching', nargs='+', default=['fixed', 'bucketed'], choices=['fixed', 'bucketed'])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--output', default=None, help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    texts = _texts(args.texts, args.chars)
+    reference = None
+    rows = []
+    for backend in args.backends:
+        for threads in ([0] if backend == embedding_registry.BACKEND_TORCH else args.threads):
+            t0 = time.perf_counter()
+            model = _load(args.model, backend, threads, embedding_registry.get_batch_size())
+            load_seconds = time.perf_counter() - t0
+            for batching in args.batching:
+                batches, tokens, padded = _batches(model, texts, batching, args.batch_size, args.token_budget)
+                seconds, vectors = _measure(model, texts, batches, args.runs)
+                row = {'backend': backend, 'threads': threads, 'batching': batching, 'batches': len(batches),
+                       'load_seconds': load_seconds, 'seconds': seconds, 'tokens': tokens,
+                       'padding_ratio': padded / max(1, tokens),
+                       'texts_per_second': len(texts) / seconds if seconds else None,
+                       'tokens_per_second': tokens / seconds if seconds else None}
+                if backend == embedding_registry.BACKEND_TORCH:
+                    reference = vectors
+                elif reference is not None:
+                    cosines = np.sum(reference * vectors, axis=1) / (
+                        np.linalg.norm(reference, axis=1) * np.linalg.norm(vectors, axis=1))
+                    row['cosine_to_torch'] = {'mean': float(cosines.mean()), 'min': float(cosines.min())}
+                rows.append(row)
+                parity = row.get('cosine_to_torch')
+                print(f"{backend:<10} threads={threads:<3} {batching:<9} {row['texts_per_second']:>9.1f} texts/s "
+                      f"{row['tokens_per_second']:>10.0f} tokens/s  padding {row['padding_ratio']:.2f}x  "
+                      f"load {load_seconds:.2f}s"
+                      + (f"  cosine to torch: mean {parity['mean']:.5f}, min {parity['min']:.5f}" if parity else ''))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': sys.version.split()[0],
+                'machine': platform.machine(),
+                'cpu_count': os.cpu_count(),
+                'model': args.model,
+                'texts': len(texts),
+                'max_chars_per_text': args.chars,
+                'batch_size': args.batch_size,
+                'token_budget': args.token_budget,
+                'results': rows,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
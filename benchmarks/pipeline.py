@@ -0,0 +1,320 @@
+"""
+Benchmark suite for the chunking -> analysis -> retrieval -> NDCG pipeline.
+
+Runs every structure_utils chunker, apply_chunking_strategy for every method_type,
+initialize_analysis, calculate_chunk_properties, the retrievers and calculate_rdsg_and_ndcg (and its bulk version)
+over synthetic documents of increasing size and over the media/source_texts corpus.
+Embeddings come from a tiny local stand-in (benchmarks/stand_in_embedding.py), so the suite
+runs offline; the DB, media and caches live in a throw-away directory (benchmarks/settings.py).
+
+Results are written as JSON (default: benchmarks/results/<git commit>.json); compare two runs
+with benchmarks/compare.py.
+
+Usage (from the project root):
+    python benchmarks/pipeline.py [--sizes 10KB 100KB 1MB 10MB 50MB] [--runs 3] [--no-corpus]
+                                  [--llama-max-size 1MB] [--only chunker] [--output results.json]
+"""
+import argparse
+import contextlib
+import glob
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+
+import django  # noqa: E402
+
+django.setup()
+
+import numpy as np  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+
+from benchmarks import stand_in_embedding, synthetic  # noqa: E402
+from corpus.models import Question, SourceText  # noqa: E402
+from evaluation.models import ExperimentChunkAnalysis, RankedRelevantChunk  # noqa: E402
+from evaluation.service import (  # noqa: E402
+    bulk_scoring, chunk_properties, embedding_store, relevant_chunks, retrieval_simulation, screening,
+)
+from experiments.models import ChunkingStrategy, ChunkSet, Experiment, RelevantSentence  # noqa: E402
+from experiments.service import (  # noqa: E402
+    chunk_implementations, chunk_storage, chunking_pipeline, semantic_chunking, sentence_segmentation, structure_utils,
+)
+
+DEFAULT_SIZES = ['10KB', '100KB', '1MB', '10MB', '50MB']
+STAND_IN_MODEL = 'benchmark-hashing-embedding'
+# Documents above this size are timed once, whatever --runs says
+SINGLE_RUN_BYTES = 5 * 1024 ** 2
+
+# Unsaved strategies, one per method_type / structure_type / engine
+STRATEGIES = [
+    ('length', {'chunk_size': 256, 'chunk_overlap': 20}),
+    ('structure', {'structure_type': 'pure_paragraph', 'paragraph_separator': '\n\n'}),
+    ('structure', {'structure_type': 'n_sentence_chunking', 'sentences_per_chunk': 5, 'sentence_overlap': 1}),
+    ('structure', {'structure_type': 'sentence_window', 'min_chars_per_chunk': 200, 'max_chars_per_chunk': 500,
+                   'sentence_overlap_chars': 50}),
+    ('structure', {'chunk_size': 1024, 'chunk_overlap': 200}),  # LlamaIndex SentenceSplitter fallback
+    ('semantic', {'embed_model_name': STAND_IN_MODEL, 'buffer_size': 1, 'breakpoint_percentile_threshold': 95}),
+    ('semantic', {'embed_model_name': STAND_IN_MODEL, 'buffer_size': 1, 'breakpoint_percentile_threshold': 95,
+                  'engine': 'native'}),
+]
+
+
+def _uses_llama_index(method_type, params):
+    return method_type == 'length' or (method_type == 'semantic' and params.get('engine') != 'native') or (
+        method_type == 'structure' and 'structure_type' not in params)
+
+
+def _strategy_label(method_type, params):
+    variant = params.get('structure_type') or params.get('engine') or (
+        'sentence_splitter' if method_type == 'structure' else 'llama_index')
+    return f'apply_chunking_strategy[{method_type}:{variant}]'
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _clear_derived_caches():
+    """Forgets the cached sentence spans and embeddings, so each document is measured cold."""
+    sentence_segmentation._spans_by_hash.clear()
+    semantic_chunking._sentence_embeddings.clear()
+    screening._pools.clear()
+    shutil.rmtree(settings.CACHE_ROOT, ignore_errors=True)
+
+
+class Recorder:
+    def __init__(self, runs, only):
+        self.runs = runs
+        self.only = only
+        self.results = []
+        self.out = sys.stdout  # The services' prints are silenced, the results are not
+
+    def wanted(self, name):
+        return not self.only or any(pattern in name for pattern in self.only)
+
+    def skip(self, name, document, reason):
+        if self.wanted(name):
+            self.results.append({'benchmark': name, **document, 'skipped': reason})
+            print(f"  {name:<58} skipped ({reason})", file=self.out)
+
+    def measure(self, name, document, fn, runs=None, count=len):
+        """Times fn (median of the runs); returns its last result, None when filtered out."""
+        if not self.wanted(name):
+            return None
+        runs = runs or (1 if document['size_bytes'] > SINGLE_RUN_BYTES else self.runs)
+        timings, result = [], None
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            result = fn()
+            timings.append(time.perf_counter() - t0)
+        n_items = count(result) if count and result is not None else None
+        self.results.append({
+            'benchmark': name, **document,
+            'median_seconds': statistics.median(timings), 'min_seconds': min(timings), 'runs': runs,
+            'items': n_items,
+        })
+        print(f"  {name:<58} {statistics.median(timings):9.4f}s" + (f"  ({n_items} items)" if n_items is not None else ''),
+              file=self.out, flush=True)
+        return result
+
+
+def bench_chunkers(recorder, document, content, llama_max_bytes):
+    """Sentence segmentation, the structure_utils chunkers and apply_chunking_strategy."""
+    _clear_derived_caches()
+    recorder.measure('sentence_segmentation.get_sentence_spans[cold]', document,
+                     lambda: sentence_segmentation.get_sentence_spans(content), runs=1)
+
+    # Warm spans from here on, as in a real run after the first sentence-based strategy
+    sentence_segmentation.get_sentence_spans(content)
+    recorder.measure('structure_utils._pure_paragraph_split', document,
+                     lambda: structure_utils._pure_paragraph_split(content, '\n\n'))
+    recorder.measure('structure_utils._n_sentence_chunking', document,
+                     lambda: structure_utils._n_sentence_chunking(content, 5, 1))
+    recorder.measure('structure_utils._sentence_window_chunking', document,
+                     lambda: structure_utils._sentence_window_chunking(content, 200, 500, 50))
+
+    for method_type, params in STRATEGIES:
+        name = _strategy_label(method_type, params)
+        if _uses_llama_index(method_type, params) and document['size_bytes'] > llama_max_bytes:
+            recorder.skip(name, document, "LlamaIndex parser above --llama-max-size")
+            continue
+        strategy = ChunkingStrategy(name=name, method_type=method_type, parameters=params)
+        recorder.measure(name, document, lambda: chunk_implementations.apply_chunking_strategy(strategy, content))
+
+
+def bench_analysis_and_retrieval(recorder, document, content, llama_max_bytes):
+    """DB pipeline on the 5-sentence chunks: save, initialise, properties, retrieval, NDCG."""
+    spans = sentence_segmentation.get_sentence_spans(content)
+    if not len(spans):
+        return
+
+    source_text = SourceText.objects.create(title=document['document'], file=f"source_texts/{document['document']}.txt")
+    # The file is only read back by the offsets chunk storage (memory-mapped copy of the source)
+    source_path = os.path.join(settings.MEDIA_ROOT, source_text.file.name)
+    os.makedirs(os.path.dirname(source_path), exist_ok=True)
+    with open(source_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    # The question is a sentence of the document, so the retrievers have something to find
+    question_text = content[spans[len(spans) // 2][0]:spans[len(spans) // 2][1]]
+    question = Question.objects.create(source_text=source_text, text=question_text)
+    experiment = Experiment.objects.create(source_text=source_text, question=question)
+
+    # One relevant sentence every 25, at most 200 (typical annotation density)
+    relevant_spans = spans[::25][:200]
+    RelevantSentence.objects.bulk_create([
+        RelevantSentence(experiment=experiment, text=content[start:end], start_char=start, end_char=end)
+        for start, end in relevant_spans.tolist()
+    ])
+
+    strategy = ChunkingStrategy.objects.create(
+        name=f"bench 5 sentences {document['document']}", method_type='structure',
+        parameters={'structure_type': 'n_sentence_chunking', 'sentences_per_chunk': 5, 'sentence_overlap': 1},
+    )
+    chunks_data = structure_utils._n_sentence_chunking(content, 5, 1)
+    chunk_set = recorder.measure('chunking_pipeline.save_chunk_set', document,
+                                 lambda: chunking_pipeline.save_chunk_set(source_text, strategy, chunks_data),
+                                 runs=1, count=lambda cs: cs.chunks.count())
+    if chunk_set is None:
+        return
+
+    offsets_strategy = ChunkingStrategy.objects.create(
+        name=f"bench 5 sentences offsets {document['document']}", method_type='structure',
+        parameters=strategy.parameters,
+    )
+    offsets_chunk_set = recorder.measure(
+        'chunking_pipeline.save_chunk_set[offsets]', document,
+        lambda: chunking_pipeline.save_chunk_set(source_text, offsets_strategy, chunks_data,
+                                                 storage_mode=ChunkSet.STORAGE_OFFSETS),
+        runs=1, count=lambda cs: cs.chunks.count(),
+    )
+    if offsets_chunk_set is not None:
+        recorder.measure('chunk_storage.chunk_texts[offsets]', document,
+                         lambda: chunk_storage.chunk_texts(offsets_chunk_set.pk))
+
+    analysis = ExperimentChunkAnalysis.objects.create(experiment=experiment, chunk_set=chunk_set)
+    recorder.measure('relevant_chunks.initialize_analysis', document,
+                     lambda: relevant_chunks.initialize_analysis(analysis), count=None)
+    analysis.refresh_from_db()
+
+    # Ideal ranking: document order (the manual step of the real workflow)
+    ranked = list(RankedRelevantChunk.objects.filter(analysis=analysis).order_by('chunk__chunk_index'))
+    for rank, rrc in enumerate(ranked, start=1):
+        rrc.ideal_rank = rank
+    RankedRelevantChunk.objects.bulk_update(ranked, ['ideal_rank'])
+
+    recorder.measure('chunk_properties.calculate_chunk_properties', document,
+                     lambda: chunk_properties.calculate_chunk_properties(analysis), count=None)
+
+    chunk_texts = [text for _, text in chunk_storage.chunk_texts(chunk_set.pk)]
+    model_name = retrieval_simulation.GLOBAL_EMBED_MODEL_NAME
+    recorder.measure('embedding_store.get_embeddings[cold]', document,
+                     lambda: embedding_store.get_embeddings(
+                         chunk_texts, model_name,
+                         lambda texts: stand_in_embedding.HashingEmbedding().get_text_embedding_batch(texts)),
+                     runs=1)
+
+    simulation = None
+    for retriever_name in retrieval_simulation.RETRIEVER_NAMES:
+        name = f'retrieval_simulation.run_retrieval_simulation[{retriever_name}]'
+        if retriever_name == retrieval_simulation.LLAMA_INDEX_RETRIEVER_NAME and document['size_bytes'] > llama_max_bytes:
+            recorder.skip(name, document, "LlamaIndex retriever above --llama-max-size")
+            continue
+        simulation = recorder.measure(name, document,
+                                      lambda: retrieval_simulation.run_retrieval_simulation(analysis, retriever_name),
+                                      count=lambda sim: sim.k_retrieved) or simulation
+
+    if simulation is not None:
+        recorder.measure('retrieval_simulation.calculate_rdsg_and_ndcg', document,
+                         lambda: retrieval_simulation.calculate_rdsg_and_ndcg(simulation), count=None)
+        recorder.measure('bulk_scoring.rescore_simulations', document,
+                         lambda: bulk_scoring.rescore_simulations([simulation]), count=None)
+
+    # Approximate screening: sentences embedded once, then chunk vectors pooled from them
+    recorder.measure('screening.get_sentence_pool[cold]', document,
+                     lambda: screening.get_sentence_pool(source_text, model_name), runs=1)
+    recorder.measure('screening.estimate_ndcg', document, lambda: screening.estimate_ndcg([analysis], model_name))
+
+
+def load_documents(sizes, corpus_dir, use_corpus):
+    documents = []
+    for size in sizes:
+        n_bytes = synthetic.parse_size(size)
+        documents.append(({'document': f'synthetic-{synthetic.format_size(n_bytes)}', 'source': 'synthetic'},
+                          lambda n_bytes=n_bytes: synthetic.make_document(n_bytes)))
+    if use_corpus:
+        for path in sorted(glob.glob(os.path.join(corpus_dir, '*.txt'))):
+            documents.append(({'document': os.path.splitext(os.path.basename(path))[0], 'source': 'corpus'},
+                              lambda path=path: open(path, encoding='utf-8').read()))
+    return documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='*', default=DEFAULT_SIZES, help="Synthetic document sizes.")
+    parser.add_argument('--runs', type=int, default=3, help="Timed runs per benchmark (median reported).")
+    parser.add_argument('--no-corpus', action='store_true', help="Skip the media/source_texts documents.")
+    parser.add_argument('--corpus-dir', default=os.path.join(PROJECT_ROOT, 'media', 'source_texts'))
+    parser.add_argument('--llama-max-size', default='1MB',
+                        help="Largest document given to the (pure Python) LlamaIndex parsers and retriever.")
+    parser.add_argument('--only', nargs='*', default=None, help="Only benchmarks whose name contains one of these.")
+    parser.add_argument('--output', default=None, help="JSON output path (default: benchmarks/results/<commit>.json).")
+    parser.add_argument('--verbose', action='store_true', help="Show the output and logs of the benchmarked services.")
+    args = parser.parse_args()
+    if args.verbose:
+        for name in settings.LOGGING['loggers']:
+            logging.getLogger(name).setLevel(logging.INFO)
+
+    call_command('migrate', verbosity=0)
+    stand_in_embedding.register_stand_in([STAND_IN_MODEL, retrieval_simulation.GLOBAL_EMBED_MODEL_NAME])
+    llama_max_bytes = synthetic.parse_size(args.llama_max_size)
+    recorder = Recorder(args.runs, args.only)
+    sentence_segmentation._get_tokenizer()  # Loaded once per process: not part of any measurement
+
+    for document, load in load_documents(args.sizes, args.corpus_dir, not args.no_corpus):
+        content = load()
+        document['size_bytes'] = len(content.encode('utf-8'))
+        print(f"{document['document']} ({document['size_bytes']} bytes)", flush=True)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+            bench_chunkers(recorder, document, content, llama_max_bytes)
+            bench_analysis_and_retrieval(recorder, document, content, llama_max_bytes)
+
+    commit = _git_commit()
+    output = args.output or os.path.join(PROJECT_ROOT, 'benchmarks', 'results', f"{commit or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'meta': {
+                'git_commit': commit,
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                'python': sys.version.split()[0],
+                'numpy': np.__version__,
+                'django': django.get_version(),
+                'platform': platform.platform(),
+                'runs': args.runs,
+                'llama_max_size': args.llama_max_size,
+                'embedding': 'HashingEmbedding stand-in',
+            },
+            'results': recorder.results,
+        }, f, indent=2)
+    print(f"Results written to {output}")
+    if settings.BENCHMARK_WORKDIR_IS_TEMPORARY:
+        shutil.rmtree(settings.BENCHMARK_WORKDIR, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+"""Settings for the benchmark suite: the project settings with a throw-away DB, media and cache."""
+import os
+import tempfile
+
+from chunking_thesis.settings import *  # noqa: F401,F403
+from chunking_thesis.settings import DATABASES, LOGGING
+
+# A directory given with the BENCHMARK_WORKDIR env var is kept; the temporary one is removed after the run
+BENCHMARK_WORKDIR_IS_TEMPORARY = not os.environ.get('BENCHMARK_WORKDIR')
+BENCHMARK_WORKDIR = os.environ.get('BENCHMARK_WORKDIR') or tempfile.mkdtemp(prefix='chunking-bench-')
+
+DATABASES = {'default': {**DATABASES['default'], 'NAME': os.path.join(BENCHMARK_WORKDIR, 'db.sqlite3')}}
+MEDIA_ROOT = os.path.join(BENCHMARK_WORKDIR, 'media')
+CACHE_ROOT = os.path.join(BENCHMARK_WORKDIR, 'cache')
+
+# Service progress logs would interleave with the benchmark table: warnings only
+LOGGING = {**LOGGING, 'loggers': {name: {**logger, 'level': 'WARNING'} for name, logger in LOGGING['loggers'].items()}}
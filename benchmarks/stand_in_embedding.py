@@ -0,0 +1,44 @@
+"""
+Tiny deterministic embedding used by the benchmarks in place of the HuggingFace models, so the
+suite runs offline and measures the pipeline rather than the model. Each text is a signed,
+hashed bag of words (feature hashing) in a small float vector.
+"""
+import re
+import zlib
+from typing import List
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+class HashingEmbedding(BaseEmbedding):
+    dimension: int = 64
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in TOKEN_RE.findall(text.lower()):
+            h = zlib.crc32(token.encode('utf-8'))
+            vector[h % self.dimension] += 1.0 if (h >> 16) & 1 else -1.0
+        return vector.tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+
+def register_stand_in(model_names) -> None:
+    """Registers the stand-in under the given model names in the process-wide embedding registry."""
+    from experiments.service import embedding_registry
+
+    for model_name in model_names:
+        embedding_registry.register_model(model_name, HashingEmbedding(model_name=model_name))
@@ -0,0 +1,114 @@
+"""
+Startup-time benchmark: wall time of `manage.py check` and of the first request served by a
+fresh process, plus which heavy libraries had been imported by then.
+
+Usage (from the project root):
+    python benchmarks/startup.py [--runs 5] [--url /experiments/strategies/] [--output startup.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Libraries that should only be imported when a strategy or retriever actually needs them
+HEAVY_MODULES = [
+    'llama_index.core',
+    'llama_index.embeddings.huggingface',
+    'nltk',
+    'scipy.stats',
+    'torch',
+    'transformers',
+]
+
+
+def _first_request_in_child(url: str) -> None:
+    """Runs in a fresh interpreter: Django setup, then one request; prints the timings as JSON."""
+    sys.path.insert(0, PROJECT_ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chunking_thesis.settings')
+
+    t0 = time.perf_counter()
+    import django
+    django.setup()
+    t_setup = time.perf_counter() - t0
+
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    setup_test_environment()  # Allows the 'testserver' host
+
+    t1 = time.perf_counter()
+    response = Client().get(url)
+    t_request = time.perf_counter() - t1
+
+    print(json.dumps({
+        'setup_seconds': t_setup,
+        'first_request_seconds': t_request,
+        'status_code': response.status_code,
+        'heavy_modules_loaded': [name for name in HEAVY_MODULES if name in sys.modules],
+    }))
+
+
+def _timed_run(args):
+    t0 = time.perf_counter()
+    completed = subprocess.run(args, cwd=PROJECT_ROOT, capture_output=True, text=True)
+    elapsed = time.perf_counter() - t0
+    if completed.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed:\n{completed.stderr}")
+    return elapsed, completed.stdout
+
+
+def _summary(values):
+    return {'median': statistics.median(values), 'min': min(values), 'max': max(values), 'runs': len(values)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--url', default='/experiments/strategies/', help="URL of the first request.")
+    parser.add_argument('--output', default=None, help="Also write the results to this JSON file.")
+    parser.add_argument('--child-first-request', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_first_request:
+        _first_request_in_child(args.child_first_request)
+        return
+
+    check_times = [_timed_run([sys.executable, 'manage.py', 'check'])[0] for _ in range(args.runs)]
+
+    process_times, setup_times, request_times, child = [], [], [], {}
+    for _ in range(args.runs):
+        elapsed, stdout = _timed_run([sys.executable, os.path.abspath(__file__), '--child-first-request', args.url])
+        child = json.loads(stdout.strip().splitlines()[-1])
+        process_times.append(elapsed)
+        setup_times.append(child['setup_seconds'])
+        request_times.append(child['first_request_seconds'])
+
+    results = {
+        'python': sys.version.split()[0],
+        'url': args.url,
+        'manage_py_check_seconds': _summary(check_times),
+        'first_request_process_seconds': _summary(process_times),
+        'django_setup_seconds': _summary(setup_times),
+        'first_request_seconds': _summary(request_times),
+        'first_request_status_code': child.get('status_code'),
+        'heavy_modules_loaded_after_first_request': child.get('heavy_modules_loaded', []),
+    }
+
+    print(f"manage.py check:          median {results['manage_py_check_seconds']['median']:.3f}s")
+    print(f"django.setup():           median {results['django_setup_seconds']['median']:.3f}s")
+    print(f"first request ({args.url}): median {results['first_request_seconds']['median']:.3f}s "
+          f"(status {results['first_request_status_code']})")
+    print(f"process to first response: median {results['first_request_process_seconds']['median']:.3f}s")
+    print(f"heavy modules loaded:     {', '.join(results['heavy_modules_loaded_after_first_request']) or 'none'}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""Deterministic synthetic documents (sentences grouped in paragraphs) of a requested size."""
+import random
+import re
+from typing import List
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ren', 'sa', 'to', 'vel', 'dor', 'an', 'is', 'um', 'pre', 'qua', 'ti', 'nor', 'bel']
+SIZE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*(B|KB|MB|GB)?\s*$', re.IGNORECASE)
+UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+
+
+def parse_size(text: str) -> int:
+    """'10KB' -> 10240, '50MB' -> 52428800."""
+    match = SIZE_RE.match(text)
+    if not match:
+        raise ValueError(f"Invalid size '{text}' (expected e.g. 10KB, 1MB).")
+    return int(float(match.group(1)) * UNITS[(match.group(2) or 'B').upper()])
+
+
+def format_size(n_bytes: int) -> str:
+    for unit in ('GB', 'MB', 'KB'):
+        if n_bytes >= UNITS[unit] and n_bytes % UNITS[unit] == 0:
+            return f'{n_bytes // UNITS[unit]}{unit}'
+    return f'{n_bytes}B'
+
+
+def _sentence_pool(rng: random.Random, n_words: int = 600, n_sentences: int = 3000) -> List[str]:
+    vocabulary = [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))) for _ in range(n_words)]
+    pool = []
+    for _ in range(n_sentences):
+        words = [rng.choice(vocabulary) for _ in range(rng.randint(6, 24))]
+        words[0] = words[0].capitalize()
+        pool.append(' '.join(words) + rng.choice('..........?!'))
+    return pool
+
+
+def make_document(n_bytes: int, seed: int = 0) -> str:
+    """A text of about n_bytes characters: paragraphs of 2-8 sentences separated by blank lines."""
+    rng = random.Random(seed)
+    pool = _sentence_pool(rng)
+    paragraphs, size = [], 0
+    while size < n_bytes:
+        paragraph = ' '.join(rng.choice(pool) for _ in range(rng.randint(2, 8)))
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return '\n\n'.join(paragraphs)[:n_bytes].rstrip() + '.'
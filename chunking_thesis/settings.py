@@ -18,6 +18,34 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Derived artifacts (sentence spans, embeddings...) that can be regenerated at any time
+CACHE_ROOT = os.path.join(BASE_DIR, 'cache')
+
+# How new ChunkSets store their chunks: 'inline' (text in every row) or 'offsets' (only start/end
+# when the text is the exact source slice, read back from a memory-mapped copy of the source).
+# Existing sets are converted with `python manage.py convert_chunk_storage`.
+CHUNK_STORAGE_MODE = 'inline'
+# Memory-mapped source copies kept open per process; the least recently used one is closed beyond it
+MAPPED_TEXT_CACHE_SIZE = 64
+
+# Batches of the shared embedding models (experiments/service/embedding_registry.py): texts are
+# sorted by token length and grouped while (texts x longest text) stays within the token budget,
+# with at most EMBEDDING_BATCH_SIZE texts per forward pass
+EMBEDDING_BATCH_SIZE = 256
+EMBEDDING_TOKEN_BUDGET = 16384
+
+# ONNX Runtime embedding backends, selected by suffixing the model name with '@onnx' or '@onnx-int8'
+# (e.g. 'BAAI/bge-small-en-v1.5@onnx-int8'). Graphs are exported there on first use or with
+# `python manage.py export_onnx_model`; threads per session (0: ONNX Runtime picks the physical
+# cores), tune it with `python benchmarks/embedding_backends.py --threads 1 2 4 8`
+ONNX_MODEL_ROOT = os.path.join(CACHE_ROOT, 'onnx_models')
+ONNX_INTRA_OP_THREADS = 0
+
+# NLTK data directory (Punkt models), searched before the default NLTK paths. It is not part of
+# the repository: nothing is downloaded at import time, `python manage.py download_nltk_data`
+# fetches the data into it once (needs network)
+NLTK_DATA_DIR = os.path.join(BASE_DIR, 'nltk_data')
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -37,6 +65,7 @@ INSTALLED_APPS = [
     'corpus.apps.CorpusConfig',
     'experiments.apps.ExperimentsConfig',
     'evaluation.apps.EvaluationConfig',
+    'jobs.apps.JobsConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -82,6 +111,13 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Web requests and job workers write concurrently: wait for the lock instead of failing at once,
+        # take it at BEGIN (no deadlocking lock upgrades) and use WAL so readers are never blocked.
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': 'PRAGMA journal_mode=WAL;',
+        },
     }
 }
 
@@ -126,3 +162,23 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Logging
+# https://docs.djangoproject.com/en/5.2/topics/logging/
+# Pipeline services log their progress and per-stage timings (experiments.service.instrumentation) at INFO.
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {'format': '{asctime} {levelname} {name}: {message}', 'style': '{'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'},
+    },
+    'loggers': {
+        app: {'handlers': ['console'], 'level': 'INFO'}
+        for app in ('corpus', 'experiments', 'evaluation', 'jobs')
+    },
+}
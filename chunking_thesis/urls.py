@@ -28,6 +28,7 @@ urlpatterns = [
     path('corpus/', include('corpus.urls', namespace='corpus')),
     path('experiments/', include('experiments.urls', namespace='experiments')), # Da aggiungere
     path('evaluation/', include('evaluation.urls', namespace='evaluation')), # Da aggiungere
+    path('jobs/', include('jobs.urls', namespace='jobs')),
 ]
 
 if settings.DEBUG:
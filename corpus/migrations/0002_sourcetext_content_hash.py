@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corpus', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sourcetext',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+    ]
@@ -39,6 +39,9 @@ class SourceText(models.Model):
         help_text='Opzionale: metadati come fonte, autore, ecc. in formato JSON.'
     )
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # SHA-256 del contenuto (vedi source_text_service.get_content_hash), calcolato al primo uso:
+    # due upload dello stesso file hanno lo stesso hash e condividono i ChunkSet
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
 
     # Metodo helper per leggere il contenuto del file facilmente
     def read_content(self):
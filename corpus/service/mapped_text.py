@@ -0,0 +1,119 @@
+# corpus/service/mapped_text.py
+import glob
+import mmap
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from corpus.models import SourceText
+from corpus.service import source_text_service
+
+MAPPED_TEXT_SUBDIR = 'source_texts'
+# Fixed-size header of the cache file: the SHA-256 hex digest of the UTF-8 text
+HEADER_SIZE = 64
+BYTES_PER_CHAR = 4  # UTF-32: character offsets map to byte offsets without decoding the prefix
+
+# Mappings cached per process: beyond it the least recently used one is dropped (unmapped once unused)
+DEFAULT_CACHE_SIZE = 64
+
+# In-process LRU cache: {SourceText pk: MappedText}, most recently used last
+_mapped_texts: 'OrderedDict[int, MappedText]' = OrderedDict()
+_mapped_texts_lock = threading.Lock()
+
+
+class MappedText:
+    """
+    Read-only, memory-mapped UTF-32-LE copy of a source text. Slicing by character offsets
+    reads only the requested bytes, so chunks can be materialised from their offsets without
+    loading the document in memory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path  # Names the size and mtime of the file it was copied from
+        with open(path, 'rb') as f:
+            self.content_hash = f.read(HEADER_SIZE).decode('ascii')
+            size = os.fstat(f.fileno()).st_size
+            # mmap cannot map an empty file: an empty document has nothing to slice anyway
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size > HEADER_SIZE else b''
+        self._length = (size - HEADER_SIZE) // BYTES_PER_CHAR
+
+    def __len__(self) -> int:
+        return self._length
+
+    def close(self) -> None:
+        """
+        Unmaps the file; the object must not be sliced afterwards. The cache never calls it on
+        the mappings it drops, which other threads may still be slicing: they are unmapped when
+        the last reference goes away.
+        """
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+
+    def slice(self, start: int, end: int) -> str:
+        """Equivalent of content[start:end] on the original text."""
+        start, end = max(0, start), min(end, self._length)
+        if start >= end:
+            return ''
+        return self._map[HEADER_SIZE + start * BYTES_PER_CHAR: HEADER_SIZE + end * BYTES_PER_CHAR].decode('utf-32-le')
+
+
+def _cache_path(source_text: SourceText) -> str:
+    """The copy is keyed by file size and mtime, so an edited file gets a new copy."""
+    stat = os.stat(os.path.join(source_text_service.get_media_dir(), source_text.file.name))
+    key = f'{source_text.pk}_{stat.st_size}_{stat.st_mtime_ns}'
+    return os.path.join(settings.CACHE_ROOT, MAPPED_TEXT_SUBDIR, f'{key}.utf32')
+
+
+def get_cache_size() -> int:
+    """Mappings kept open at once: settings.MAPPED_TEXT_CACHE_SIZE (default DEFAULT_CACHE_SIZE)."""
+    return max(1, getattr(settings, 'MAPPED_TEXT_CACHE_SIZE', DEFAULT_CACHE_SIZE))
+
+
+def _write_copy(content: str, path: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(source_text_service.hash_content(content).encode('ascii'))
+        f.write(content.encode('utf-32-le'))
+    os.replace(tmp_path, path)
+
+
+def _remove_superseded_copies(source_text_id: int, path: str) -> None:
+    """Deletes the copies of earlier versions of the file (other size or mtime) of the same source text."""
+    for old_path in glob.glob(os.path.join(os.path.dirname(path), f'{source_text_id}_*.utf32')):
+        if old_path != path:
+            try:
+                os.remove(old_path)
+            except OSError:  # Already removed by another process, or still mapped on Windows
+                pass
+
+
+def get_mapped_text(source_text: SourceText) -> MappedText:
+    """
+    Returns the memory-mapped copy of the source text, writing it under
+    CACHE_ROOT/source_texts the first time the file is seen. The file is stat-ed on every
+    call, so a mapping kept in memory is replaced as soon as the file is edited.
+    """
+    path = _cache_path(source_text)
+    with _mapped_texts_lock:
+        mapped = _mapped_texts.get(source_text.pk)
+        if mapped is not None and mapped.path == path:
+            _mapped_texts.move_to_end(source_text.pk)
+            return mapped
+
+        if not os.path.exists(path):
+            _write_copy(source_text_service.get_full_text(source_text), path)
+            _remove_superseded_copies(source_text.pk, path)
+        mapped = MappedText(path)
+        _mapped_texts[source_text.pk] = mapped
+        while len(_mapped_texts) > get_cache_size():
+            _mapped_texts.popitem(last=False)  # Not closed: a reader may still be slicing it
+    return mapped
+
+
+def forget(source_text_id: int) -> None:
+    """Drops the in-process mapping of a source text (e.g. after its file was replaced)."""
+    with _mapped_texts_lock:
+        _mapped_texts.pop(source_text_id, None)
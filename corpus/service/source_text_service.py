@@ -1,7 +1,9 @@
+import hashlib
+
 from corpus.models import SourceText
 
-# recupero MEDIA DIR
-from chunking_thesis import settings
+# recupero MEDIA DIR (dalle settings attive, non dal modulo chunking_thesis.settings)
+from django.conf import settings
 
 import os
 
@@ -19,3 +21,24 @@ def get_full_text(source_text: SourceText) -> str:
     with open(full_path, 'r', encoding='utf-8') as file:
         content = file.read()
     return content
+
+
+def hash_content(content: str) -> str:
+    """SHA-256 del testo (uguale all'hash dei byte di un file UTF-8)."""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def get_content_hash(source_text: SourceText, content: str = None, refresh: bool = False) -> str:
+    """
+    Restituisce l'hash del contenuto del SourceText, calcolandolo (dal contenuto passato o
+    leggendo il file) e salvandolo la prima volta.
+    Con refresh=True il file viene riletto e l'hash salvato aggiornato se il file è cambiato.
+    """
+    if not source_text.content_hash or refresh:
+        if content is None:
+            content = get_full_text(source_text)
+        content_hash = hash_content(content)
+        if content_hash != source_text.content_hash:
+            source_text.content_hash = content_hash
+            SourceText.objects.filter(pk=source_text.pk).update(content_hash=content_hash)
+    return source_text.content_hash
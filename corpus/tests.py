@@ -1,3 +1,72 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+
+from corpus.models import SourceText
+from corpus.service import mapped_text
+
+
+class MappedTextTests(TestCase):
+
+    def setUp(self):
+        self.media_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_dir, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_dir,
+                                              CACHE_ROOT=os.path.join(self.media_dir, 'cache'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(mapped_text._mapped_texts.clear)
+
+    def create_source_text(self, content, title='Test document'):
+        source_text = SourceText.objects.create(title=title, file=f'source_texts/{title}.txt')
+        self.write(source_text, content)
+        return source_text
+
+    def write(self, source_text, content):
+        path = os.path.join(self.media_dir, source_text.file.name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def copies(self):
+        return sorted(os.listdir(os.path.join(self.media_dir, 'cache', mapped_text.MAPPED_TEXT_SUBDIR)))
+
+    def test_slices_are_string_slices(self):
+        content = "Caffè ☕ naïve — 𝔘𝔫𝔦𝔠𝔬𝔡𝔢\nsecond line"
+        mapped = mapped_text.get_mapped_text(self.create_source_text(content))
+        self.assertEqual(len(mapped), len(content))
+        for start, end in [(0, 5), (6, 7), (8, 25), (20, 40), (-3, 4), (30, 1000), (7, 7)]:
+            self.assertEqual(mapped.slice(start, end), content[max(0, start):end])
+
+    def test_edited_file_is_mapped_again_without_forget(self):
+        source_text = self.create_source_text("Old text.")
+        old = mapped_text.get_mapped_text(source_text)
+        self.assertIs(mapped_text.get_mapped_text(source_text), old)
+
+        self.write(source_text, "New, longer text.")
+        new = mapped_text.get_mapped_text(source_text)
+        self.assertIsNot(new, old)
+        self.assertEqual(new.slice(0, 100), "New, longer text.")
+        self.assertEqual(len(self.copies()), 1)  # The copy of the old version is deleted
+
+    def test_edit_with_same_size_is_detected_by_mtime(self):
+        source_text = self.create_source_text("aaaa")
+        old = mapped_text.get_mapped_text(source_text)
+        path = os.path.join(self.media_dir, source_text.file.name)
+        self.write(source_text, "bbbb")
+        os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10 ** 9))
+        self.assertEqual(mapped_text.get_mapped_text(source_text).slice(0, 4), "bbbb")
+        self.assertEqual(old.slice(0, 4), "aaaa")  # Readers of the old mapping are not cut off
+
+    @override_settings(MAPPED_TEXT_CACHE_SIZE=1)
+    def test_evicted_mapping_stays_readable(self):
+        first = mapped_text.get_mapped_text(self.create_source_text("First text.", 'First'))
+        mapped_text.get_mapped_text(self.create_source_text("Second text.", 'Second'))
+        self.assertEqual(list(mapped_text._mapped_texts), [SourceText.objects.get(title='Second').pk])
+        self.assertEqual(first.slice(0, 5), "First")  # Still held by a reader: not closed
+
+    def test_empty_text(self):
+        mapped = mapped_text.get_mapped_text(self.create_source_text(""))
+        self.assertEqual((len(mapped), mapped.slice(0, 10)), (0, ''))
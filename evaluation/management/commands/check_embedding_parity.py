@@ -0,0 +1,89 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from evaluation.service import batch_simulation, retrieval_simulation
+from experiments.models import Chunk
+from experiments.service import embedding_registry
+from experiments.service.instrumentation import StageTimings
+
+
+class Command(BaseCommand):
+    help = ("Compares an embedding backend (e.g. ONNX int8) with the PyTorch model: cosine similarity of the "
+            "chunk vectors, embedding throughput and the NDCG of every ready analysis (nothing is saved).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=retrieval_simulation.GLOBAL_EMBED_MODEL_NAME,
+                            help="Reference model (PyTorch backend).")
+        parser.add_argument('--backend', default='onnx-int8',
+                            choices=[b for b in embedding_registry.BACKENDS if b != embedding_registry.BACKEND_TORCH])
+        parser.add_argument(
+            '--chunk-set', type=int, action='append', dest='chunk_set_ids',
+            help="Restrict to the given ChunkSet id (repeatable).",
+        )
+        parser.add_argument('--sample', type=int, default=512,
+                            help="Chunks embedded directly by both backends for the vector comparison and throughput.")
+        parser.add_argument('--min-cosine', type=float, default=0.99,
+                            help="Fail when a chunk vector is less similar than this to the PyTorch one.")
+        parser.add_argument('--max-ndcg-diff', type=float, default=0.01,
+                            help="Fail when the NDCG of an analysis differs by more than this.")
+
+    def handle(self, *args, **options):
+        reference = embedding_registry.with_backend(options['model'], embedding_registry.BACKEND_TORCH)
+        candidate = embedding_registry.with_backend(options['model'], options['backend'])
+
+        chunks = Chunk.objects.select_related('chunk_set__source_text').order_by('pk')
+        if options['chunk_set_ids']:
+            chunks = chunks.filter(chunk_set_id__in=options['chunk_set_ids'])
+        texts = [chunk.text for chunk in chunks[:options['sample']]]
+        if not texts:
+            raise CommandError("No chunks to compare.")
+
+        # Vectors and throughput: both backends embed the same texts directly, bypassing the embedding store
+        vectors, throughput = {}, {}
+        for model_name in (reference, candidate):
+            embedding_registry.get_embed_model(model_name)
+            t0 = time.perf_counter()
+            vectors[model_name] = embedding_registry.embed_texts(model_name, texts)
+            throughput[model_name] = len(texts) / (time.perf_counter() - t0)
+        cosines = np.sum(vectors[reference] * vectors[candidate], axis=1) / (
+            np.linalg.norm(vectors[reference], axis=1) * np.linalg.norm(vectors[candidate], axis=1)
+        )
+        self.stdout.write(f"Vectors of {len(texts)} chunks: cosine mean {cosines.mean():.5f}, min {cosines.min():.5f}.")
+        for model_name in (reference, candidate):
+            self.stdout.write(f"  {model_name}: {throughput[model_name]:.1f} texts/s")
+        self.stdout.write(f"  speed-up: {throughput[candidate] / throughput[reference]:.2f}x")
+
+        # NDCG: every ready analysis scored with both backends, without writing simulations
+        analyses = batch_simulation.find_pending_analyses(force=True, chunk_set_ids=options['chunk_set_ids'])
+        by_chunk_set = {}
+        for analysis in analyses:
+            by_chunk_set.setdefault(analysis.chunk_set_id, []).append(analysis)
+        diffs, same_top = [], 0
+        for chunk_set_id, group in by_chunk_set.items():
+            runs = {
+                model_name: batch_simulation.compute_chunk_set(
+                    chunk_set_id, group, model_name, StageTimings(f"Parity of ChunkSet {chunk_set_id}")
+                )
+                for model_name in (reference, candidate)
+            }
+            for i, analysis in enumerate(group):
+                ndcg_reference = runs[reference][1][i][2]
+                ndcg_candidate = runs[candidate][1][i][2]
+                diffs.append(abs(ndcg_candidate - ndcg_reference))
+                top_reference = [chunk_pk for chunk_pk, _, _ in runs[reference][0][i]]
+                top_candidate = [chunk_pk for chunk_pk, _, _ in runs[candidate][0][i]]
+                same_top += top_reference == top_candidate
+                if diffs[-1] > options['max_ndcg_diff']:
+                    self.stderr.write(f"Analysis {analysis.pk}: NDCG {ndcg_reference:.4f} -> {ndcg_candidate:.4f}")
+
+        if diffs:
+            self.stdout.write(f"NDCG of {len(diffs)} analyses: mean |diff| {np.mean(diffs):.5f}, "
+                              f"max |diff| {max(diffs):.5f}, identical rankings {same_top}/{len(diffs)}.")
+        else:
+            self.stdout.write("No ready analyses: NDCG not compared.")
+
+        if cosines.min() < options['min_cosine'] or (diffs and max(diffs) > options['max_ndcg_diff']):
+            raise CommandError(f"'{candidate}' is not equivalent to '{reference}' within the given tolerances.")
+        self.stdout.write(self.style.SUCCESS(f"'{candidate}' matches '{reference}'."))
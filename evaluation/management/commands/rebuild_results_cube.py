@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from evaluation.service import results_cube
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the latest-NDCG results cube (experiments x strategies) from the stored simulations."
+
+    def handle(self, *args, **options):
+        n_cells = results_cube.rebuild_results_cube()
+        self.stdout.write(self.style.SUCCESS(f"{n_cells} cells written."))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from evaluation.service import invalidation
+
+
+class Command(BaseCommand):
+    help = ("Finds the chunk sets, analyses and simulations made stale by changed source files, strategy "
+            "parameters or annotations, and recomputes only those.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only list the stale objects.")
+
+    def handle(self, *args, **options):
+        summary = invalidation.recompute_stale(dry_run=options['dry_run'])
+
+        for kind, label in (('chunk_sets', 'ChunkSet'), ('analyses', 'Analysis'), ('simulations', 'Simulation')):
+            stale = summary['stale'][kind]
+            self.stdout.write(f"Stale {kind}: {len(stale)}")
+            for pk, reason in sorted(stale.items()):
+                self.stdout.write(f"  {label} {pk}: {reason}")
+        if options['dry_run']:
+            return
+
+        self.stdout.write(
+            f"{len(summary['rechunked'])} chunk sets rechunked, {len(summary['restamped'])} unchanged, "
+            f"{len(summary['reinitialised'])} analyses initialised again, "
+            f"{summary['deleted_simulations']} simulations of replaced chunks deleted, "
+            f"{len(summary['simulations'])} simulations run again."
+        )
+        if summary['awaiting_ranking']:
+            ids = ', '.join(str(pk) for pk in sorted(summary['awaiting_ranking']))
+            self.stdout.write(self.style.WARNING(
+                f"Relevant chunks changed, a new ranking is needed before simulating analyses: {ids}"
+            ))
+        for error in summary['errors']:
+            self.stderr.write(self.style.ERROR(error))
+        if summary['errors']:
+            raise CommandError(f"{len(summary['errors'])} recomputations failed.")
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from evaluation.models import RetrievalSimulation
+from evaluation.service import bulk_scoring, invalidation
+
+
+class Command(BaseCommand):
+    help = ("Scores again the stored simulations (RDSG, Ideal RDSG, NDCG) on the current ranked relevant chunks, "
+            "in bulk, without running the retrieval again.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-set', type=int, action='append', dest='chunk_set_ids',
+            help="Restrict to the simulations of the given ChunkSet id (repeatable).",
+        )
+        parser.add_argument(
+            '--latest', action='store_true',
+            help="Only the most recent simulation of each analysis, retriever and embedding model.",
+        )
+
+    def handle(self, *args, **options):
+        if options['latest']:
+            simulations = invalidation.latest_simulations()
+            if options['chunk_set_ids']:
+                pks = set(RetrievalSimulation.objects.filter(
+                    analysis__chunk_set_id__in=options['chunk_set_ids']
+                ).values_list('pk', flat=True))
+                simulations = [simulation for simulation in simulations if simulation.pk in pks]
+        else:
+            simulations = RetrievalSimulation.objects.all()
+            if options['chunk_set_ids']:
+                simulations = simulations.filter(analysis__chunk_set_id__in=options['chunk_set_ids'])
+        count = bulk_scoring.rescore_simulations(simulations)
+        self.stdout.write(self.style.SUCCESS(f"{count} simulations scored."))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from evaluation.service import batch_simulation, retrieval_simulation
+
+
+class Command(BaseCommand):
+    help = "Runs the retrieval simulation and NDCG scoring for every ready and stale ExperimentChunkAnalysis."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Also re-simulate analyses that already have a scored simulation.",
+        )
+        parser.add_argument(
+            '--chunk-set', type=int, action='append', dest='chunk_set_ids',
+            help="Restrict to the given ChunkSet id (repeatable).",
+        )
+        parser.add_argument(
+            '--embedding-model', default=retrieval_simulation.GLOBAL_EMBED_MODEL_NAME,
+            help="Embedding model, optionally with its backend (e.g. 'BAAI/bge-small-en-v1.5@onnx-int8').",
+        )
+
+    def handle(self, *args, **options):
+        simulations = batch_simulation.run_all_simulations(
+            force=options['force'], chunk_set_ids=options['chunk_set_ids'], model_name=options['embedding_model']
+        )
+        self.stdout.write(self.style.SUCCESS(f"{len(simulations)} simulations created and scored."))
@@ -0,0 +1,48 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from evaluation.service import batch_simulation, screening
+
+
+class Command(BaseCommand):
+    help = ("Estimates the NDCG of every strategy and question from pooled sentence embeddings (no chunk "
+            "is embedded) and reports how closely the estimate tracks the exact NDCG of the latest simulations "
+            "run with the same model.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-set', type=int, action='append', dest='chunk_set_ids',
+            help="Restrict to the given ChunkSet id (repeatable).",
+        )
+        parser.add_argument('--model', help="Embedding model (default: the simulation model).")
+        parser.add_argument('--output', help="Also write the full report (with per-analysis rows) to this JSON file.")
+
+    def handle(self, *args, **options):
+        analyses = batch_simulation.find_pending_analyses(force=True, chunk_set_ids=options['chunk_set_ids'])
+        report = screening.screening_report(analyses, options['model'])
+
+        self.stdout.write(f"Screened {len(report['rows'])} analyses in {report['seconds']:.2f}s "
+                          f"with '{report['model_name']}'.")
+        self.stdout.write(f"{'Strategy':<40} {'Analyses':>8} {'Estimated':>10} {'Exact':>10}")
+        for row in report['strategies']:
+            exact = '-' if row['mean_exact_ndcg'] is None else f"{row['mean_exact_ndcg']:.4f}"
+            self.stdout.write(f"{row['strategy']:<40} {row['analyses']:>8} {row['mean_estimated_ndcg']:>10.4f} {exact:>10}")
+
+        agreement = report['agreement']
+        self.stdout.write(f"Compared with exact NDCG on {agreement['pairs']} analyses:")
+        for key, label in (
+            ('mean_abs_error', "mean absolute error"),
+            ('max_abs_error', "max absolute error"),
+            ('pearson', "Pearson r"),
+            ('spearman', "Spearman rho"),
+            ('best_strategy_agreement', "same best strategy per experiment"),
+            ('strategy_order_spearman', "strategy ordering Spearman rho"),
+        ):
+            value = agreement[key]
+            self.stdout.write(f"  {label}: {'-' if value is None else f'{value:.4f}'}")
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('evaluation', '0002_alter_rankedrelevantchunk_ideal_rank'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='retrievalsimulation',
+            name='ideal_rdsg_score',
+            field=models.FloatField(blank=True, help_text='Ideal RDSG score for normalization', null=True),
+        ),
+        migrations.AddField(
+            model_name='retrievalsimulation',
+            name='ndcg_score',
+            field=models.FloatField(blank=True, help_text='Normalized DCG score (NDCG)', null=True),
+        ),
+        migrations.CreateModel(
+            name='CachedEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(help_text='Embedding model that produced the vector', max_length=150)),
+                ('text_hash', models.CharField(help_text='SHA-256 hex digest of the embedded text', max_length=64)),
+                ('dimension', models.PositiveIntegerField()),
+                ('vector', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('model_name', 'text_hash')},
+            },
+        ),
+    ]
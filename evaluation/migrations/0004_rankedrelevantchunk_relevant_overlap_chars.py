@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('evaluation', '0003_retrievalsimulation_ideal_rdsg_score_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rankedrelevantchunk',
+            name='relevant_overlap_chars',
+            field=models.PositiveIntegerField(blank=True, help_text='Numerator of Density(c)', null=True),
+        ),
+    ]
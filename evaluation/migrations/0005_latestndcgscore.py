@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_results_cube(apps, schema_editor):
+    """Backfills the cube with the latest simulation of every existing analysis."""
+    RetrievalSimulation = apps.get_model('evaluation', 'RetrievalSimulation')
+    LatestNdcgScore = apps.get_model('evaluation', 'LatestNdcgScore')
+    cells = {}
+    for simulation in RetrievalSimulation.objects.select_related('analysis__chunk_set').order_by(
+            'analysis_id', '-ran_at', '-pk'):
+        key = (simulation.analysis.experiment_id, simulation.analysis.chunk_set.strategy_id)
+        if key not in cells:
+            cells[key] = LatestNdcgScore(experiment_id=key[0], strategy_id=key[1], simulation=simulation,
+                                         ndcg_score=simulation.ndcg_score, ran_at=simulation.ran_at)
+    LatestNdcgScore.objects.bulk_create(cells.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('evaluation', '0004_rankedrelevantchunk_relevant_overlap_chars'),
+        ('experiments', '0002_rename_document_chunkset_source_text_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestNdcgScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ndcg_score', models.FloatField(blank=True, help_text='NDCG of the latest simulation', null=True)),
+                ('ran_at', models.DateTimeField(help_text='ran_at of the latest simulation')),
+                ('experiment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='experiments.experiment')),
+                ('simulation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='evaluation.retrievalsimulation')),
+                ('strategy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='experiments.chunkingstrategy')),
+            ],
+            options={
+                'unique_together': {('experiment', 'strategy')},
+            },
+        ),
+        migrations.RunPython(fill_results_cube, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('evaluation', '0005_latestndcgscore'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='retrievalsimulation',
+            name='timings',
+            field=models.JSONField(blank=True, help_text='Per-stage durations and item counts of the run', null=True),
+        ),
+    ]
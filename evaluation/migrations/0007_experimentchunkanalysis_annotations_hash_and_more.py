@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('evaluation', '0006_retrievalsimulation_timings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='experimentchunkanalysis',
+            name='annotations_hash',
+            field=models.CharField(blank=True, default='', help_text='SHA-256 of the relevant sentence offsets', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='experimentchunkanalysis',
+            name='chunk_set_version',
+            field=models.PositiveIntegerField(blank=True, help_text='ChunkSet.version at initialisation', null=True),
+        ),
+        migrations.AddField(
+            model_name='retrievalsimulation',
+            name='inputs_hash',
+            field=models.CharField(blank=True, default='', help_text='Stale when the inputs change', max_length=64),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('evaluation', '0007_experimentchunkanalysis_annotations_hash_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='retrievalsimulation',
+            name='ranking_chunk_ids',
+            field=models.BinaryField(blank=True, help_text='Chunk ids by descending similarity', null=True),
+        ),
+        migrations.AddField(
+            model_name='retrievalsimulation',
+            name='ranking_scores',
+            field=models.BinaryField(blank=True, help_text='Similarity of each ranked chunk', null=True),
+        ),
+    ]
@@ -1,6 +1,6 @@
 from django.db import models
 
-from experiments.models import Chunk, ChunkSet, Experiment
+from experiments.models import Chunk, ChunkingStrategy, ChunkSet, Experiment
 
 
 class ExperimentChunkAnalysis(models.Model):
@@ -10,6 +10,9 @@ class ExperimentChunkAnalysis(models.Model):
     # Calculated number of relevant chunks for this experiment/chunkset combo
     k_relevant = models.PositiveIntegerField(null=True, blank=True, help_text="|C_relevant|")
     analysis_time = models.DateTimeField(auto_now_add=True)
+    # Inputs the relevant chunks were computed from: stale when either no longer matches
+    annotations_hash = models.CharField(max_length=64, blank=True, default='', help_text="SHA-256 of the relevant sentence offsets")
+    chunk_set_version = models.PositiveIntegerField(null=True, blank=True, help_text="ChunkSet.version at initialisation")
 
     class Meta:
         unique_together = ('experiment', 'chunk_set')
@@ -26,6 +29,8 @@ class RankedRelevantChunk(models.Model):
     intrinsic_importance_w = models.FloatField(null=True, blank=True, help_text="w(c)")
     relevance_density = models.FloatField(null=True, blank=True, help_text="Density(c)")
     effective_relevance_w_prime = models.FloatField(null=True, blank=True, help_text="w'(c) = w(c) * sqrt(Density(c))")
+    # Cached at initialisation: characters of relevant sentences falling inside the chunk
+    relevant_overlap_chars = models.PositiveIntegerField(null=True, blank=True, help_text="Numerator of Density(c)")
 
     class Meta:
         unique_together = ('analysis', 'chunk') # A chunk can only be relevant once per analysis
@@ -46,6 +51,14 @@ class RetrievalSimulation(models.Model):
     ran_at = models.DateTimeField(auto_now_add=True)
     ideal_rdsg_score = models.FloatField(null=True, blank=True, help_text="Ideal RDSG score for normalization")
     ndcg_score = models.FloatField(null=True, blank=True, help_text="Normalized DCG score (NDCG)")
+    # {'stages': {stage: seconds}, 'counts': {...}, 'total_seconds': ...} of the simulation run
+    timings = models.JSONField(null=True, blank=True, help_text="Per-stage durations and item counts of the run")
+    # SHA-256 of the question, chunk set version and ranked relevant chunks (w, w') the simulation was scored on
+    inputs_hash = models.CharField(max_length=64, blank=True, default='', help_text="Stale when the inputs change")
+    # Full similarity ranking of the chunk set (raw int64 chunk ids / float32 scores, decoded with
+    # numpy.frombuffer): NDCG@k for any k is computed from it without retrieving again
+    ranking_chunk_ids = models.BinaryField(null=True, blank=True, help_text="Chunk ids by descending similarity")
+    ranking_scores = models.BinaryField(null=True, blank=True, help_text="Similarity of each ranked chunk")
 
 
 class RetrievedChunk(models.Model):
@@ -58,3 +71,31 @@ class RetrievedChunk(models.Model):
     class Meta:
         unique_together = ('simulation', 'retrieved_rank') # Rank must be unique per simulation
         ordering = ['retrieved_rank']
+
+
+class CachedEmbedding(models.Model):
+    """Content-addressed embedding vector, shared by every chunk whose text hashes to the same key."""
+    model_name = models.CharField(max_length=150, help_text="Embedding model that produced the vector")
+    text_hash = models.CharField(max_length=64, help_text="SHA-256 hex digest of the embedded text")
+    dimension = models.PositiveIntegerField()
+    # Raw float32 bytes, decoded with numpy.frombuffer
+    vector = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('model_name', 'text_hash')
+
+
+class LatestNdcgScore(models.Model):
+    """
+    Materialised results cube: the NDCG of the most recent simulation for each
+    (Experiment, ChunkingStrategy) pair, kept up to date whenever a simulation is scored.
+    """
+    experiment = models.ForeignKey(Experiment, on_delete=models.CASCADE)
+    strategy = models.ForeignKey(ChunkingStrategy, on_delete=models.CASCADE)
+    simulation = models.ForeignKey(RetrievalSimulation, on_delete=models.CASCADE)
+    ndcg_score = models.FloatField(null=True, blank=True, help_text="NDCG of the latest simulation")
+    ran_at = models.DateTimeField(help_text="ran_at of the latest simulation")
+
+    class Meta:
+        unique_together = ('experiment', 'strategy')
@@ -0,0 +1,177 @@
+# evaluation/service/batch_simulation.py
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Count, Q
+
+from evaluation.models import ExperimentChunkAnalysis, RankedRelevantChunk, RetrievalSimulation, RetrievedChunk
+from evaluation.service import numpy_retriever, results_cube, retrieval_simulation
+from experiments.service import embedding_registry
+from experiments.service.instrumentation import StageTimings
+
+logger = logging.getLogger(__name__)
+
+
+def find_pending_analyses(force: bool = False, chunk_set_ids: Optional[List[int]] = None,
+                          model_name: str = retrieval_simulation.GLOBAL_EMBED_MODEL_NAME):
+    """
+    Returns the analyses that are ready for a simulation and stale.
+    Ready: k_relevant is known and, if k_relevant > 0, every relevant chunk has w' computed.
+    Stale: no simulation with an NDCG score exists yet for model_name (ignored when force=True).
+    """
+    analyses = ExperimentChunkAnalysis.objects.filter(k_relevant__isnull=False).annotate(
+        n_w_prime=Count(
+            'ranked_relevant_chunks',
+            filter=Q(ranked_relevant_chunks__effective_relevance_w_prime__isnull=False),
+            distinct=True,
+        ),
+        n_scored_simulations=Count(
+            'simulations',
+            filter=Q(simulations__ndcg_score__isnull=False, simulations__embedding_model_name=model_name),
+            distinct=True,
+        ),
+    ).select_related('experiment__question', 'chunk_set')
+
+    if chunk_set_ids:
+        analyses = analyses.filter(chunk_set_id__in=chunk_set_ids)
+
+    pending = []
+    for analysis in analyses:
+        if analysis.k_relevant > 0 and analysis.n_w_prime < analysis.k_relevant:
+            continue  # Ranking not saved yet, w' missing
+        if not force and analysis.n_scored_simulations > 0:
+            continue  # Already simulated
+        pending.append(analysis)
+    return pending
+
+
+def ranked_relevant_snapshots(analyses: List[ExperimentChunkAnalysis]) -> Dict[int, List]:
+    """{analysis_id: [(chunk_id, w, w'), ...] ordered by ideal rank}, read with a single query."""
+    snapshots: Dict[int, List] = defaultdict(list)
+    rows = RankedRelevantChunk.objects.filter(
+        analysis__in=analyses, ideal_rank__isnull=False, effective_relevance_w_prime__isnull=False
+    ).order_by('analysis_id', 'ideal_rank').values_list(
+        'analysis_id', 'chunk_id', 'intrinsic_importance_w', 'effective_relevance_w_prime'
+    )
+    for analysis_id, chunk_id, w, w_prime in rows:
+        snapshots[analysis_id].append((chunk_id, w, w_prime))
+    return snapshots
+
+
+def compute_chunk_set(chunk_set_id: int, analyses: List[ExperimentChunkAnalysis], model_name: str,
+                      timings: StageTimings) -> Tuple[List[List], List[Tuple[float, float, float]], Dict[int, List],
+                                                      List[numpy_retriever.Ranking]]:
+    """
+    Compute phase of the simulations of all analyses sharing a ChunkSet: the chunk matrix is
+    embedded once and every question is ranked against it with a single matrix multiplication.
+    Returns (retrieved results, (RDSG, Ideal RDSG, NDCG) per analysis, ranked relevant snapshots,
+    full rankings); nothing is written.
+    """
+    with timings.stage('model_load'):
+        embedding_registry.get_embed_model(model_name)
+    # Reads the chunks and embeds them through the embedding store; normalising the matrix is negligible
+    with timings.stage('embedding'):
+        retriever = numpy_retriever.ExactTopKRetriever.for_chunk_set(chunk_set_id, model_name)
+    timings.count(chunks=len(retriever), queries=len(analyses))
+
+    if not len(retriever):
+        logger.warning("ChunkSet %d has no chunks, empty results.", chunk_set_id)
+    with timings.stage('query'):
+        rankings = retriever.rank_questions([analysis.experiment.question.text for analysis in analyses], model_name)
+        results_per_analysis = [
+            numpy_retriever.top_k_from_ranking(ranking, retrieval_simulation.get_k_retrieved_target(analysis.k_relevant))
+            for analysis, ranking in zip(analyses, rankings)
+        ]
+
+    with timings.stage('scoring'):
+        snapshots = ranked_relevant_snapshots(analyses)
+        scores_per_analysis = [
+            retrieval_simulation.compute_rdsg_and_ndcg(results, snapshots.get(analysis.pk, []))
+            for analysis, results in zip(analyses, results_per_analysis)
+        ]
+    return results_per_analysis, scores_per_analysis, snapshots, rankings
+
+
+def _simulate_chunk_set(chunk_set_id: int, analyses: List[ExperimentChunkAnalysis],
+                        model_name: str = retrieval_simulation.GLOBAL_EMBED_MODEL_NAME) -> List[RetrievalSimulation]:
+    """
+    Runs and scores the simulations of all analyses sharing a ChunkSet (compute_chunk_set), then
+    stores them in a single write transaction.
+    Each simulation records an even share of the stage timings of the whole group.
+    """
+    timings = StageTimings(f"Batch simulation of ChunkSet {chunk_set_id}")
+    results_per_analysis, scores_per_analysis, snapshots, rankings = compute_chunk_set(
+        chunk_set_id, analyses, model_name, timings
+    )
+
+    with transaction.atomic():
+        with timings.stage('db_write'):
+            simulations = RetrievalSimulation.objects.bulk_create([
+                RetrievalSimulation(
+                    analysis=analysis,
+                    retriever_name=numpy_retriever.RETRIEVER_NAME,
+                    embedding_model_name=model_name,
+                    k_retrieved=len(results),
+                    rdsg_score=rdsg_score,
+                    ideal_rdsg_score=ideal_rdsg_score,
+                    ndcg_score=ndcg_score,
+                    inputs_hash=retrieval_simulation.analysis_inputs_hash(analysis, snapshots.get(analysis.pk, [])),
+                    ranking_chunk_ids=ranking_chunk_ids,
+                    ranking_scores=ranking_scores,
+                )
+                for analysis, results, (rdsg_score, ideal_rdsg_score, ndcg_score), (ranking_chunk_ids, ranking_scores)
+                in zip(analyses, results_per_analysis, scores_per_analysis, map(numpy_retriever.encode_ranking, rankings))
+            ])
+            RetrievedChunk.objects.bulk_create([
+                RetrievedChunk(
+                    simulation=simulation,
+                    chunk_id=chunk_pk,
+                    retrieved_rank=rank,
+                    similarity_score_s=score,
+                )
+                for simulation, results in zip(simulations, results_per_analysis)
+                for chunk_pk, score, rank in results
+            ])
+            for simulation in simulations:
+                results_cube.record_simulation_score(simulation)
+        # Each simulation gets its share of the group's stages, so reports average comparable runs
+        timings_data = timings.share(len(simulations)).as_dict()
+        for simulation in simulations:
+            simulation.timings = timings_data
+        RetrievalSimulation.objects.filter(pk__in=[simulation.pk for simulation in simulations]).update(
+            timings=timings_data
+        )
+    timings.log_summary()
+    return simulations
+
+
+def run_all_simulations(force: bool = False, chunk_set_ids: Optional[List[int]] = None,
+                        model_name: str = retrieval_simulation.GLOBAL_EMBED_MODEL_NAME) -> List[RetrievalSimulation]:
+    """
+    Simulates and scores (RDSG/NDCG) every ready and stale analysis with the embedding model
+    model_name, grouped by ChunkSet. Returns the created RetrievalSimulation objects.
+    """
+    pending = find_pending_analyses(force=force, chunk_set_ids=chunk_set_ids, model_name=model_name)
+    if not pending:
+        logger.info("No pending analyses to simulate.")
+        return []
+    return simulate_analyses(pending, model_name)
+
+
+def simulate_analyses(analyses: List[ExperimentChunkAnalysis],
+                      model_name: str = retrieval_simulation.GLOBAL_EMBED_MODEL_NAME) -> List[RetrievalSimulation]:
+    """
+    Simulates and scores the given ready analyses (loaded with experiment__question and chunk_set)
+    with the embedding model model_name, grouped by ChunkSet. Returns the created RetrievalSimulation objects.
+    """
+    analyses_by_chunk_set: Dict[int, List[ExperimentChunkAnalysis]] = defaultdict(list)
+    for analysis in analyses:
+        analyses_by_chunk_set[analysis.chunk_set_id].append(analysis)
+    logger.info("Simulating %d analyses over %d chunk sets.", len(analyses), len(analyses_by_chunk_set))
+
+    created = []
+    for chunk_set_id, group in analyses_by_chunk_set.items():
+        created.extend(_simulate_chunk_set(chunk_set_id, group, model_name))
+    return created
@@ -0,0 +1,129 @@
+# evaluation/service/bulk_scoring.py
+"""
+RDSG / Ideal RDSG / NDCG of many stored simulations at once, e.g. after the w' formula or the
+rank weights changed: the RetrievedChunk and RankedRelevantChunk rows of a batch of simulations
+are read with one query each, scored with NumPy (a discount table indexed by rank and segmented
+sums with bincount) and written back with one bulk_update.
+The scores are the ones compute_rdsg_and_ndcg gives for each simulation alone.
+"""
+import logging
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from django.db import transaction
+
+from evaluation.models import RetrievalSimulation, RetrievedChunk
+from evaluation.service import batch_simulation, results_cube, retrieval_simulation
+
+logger = logging.getLogger(__name__)
+
+# Simulations scored per round: bounds memory and the bound parameters of each query
+SCORING_BATCH_SIZE = 500
+
+
+def discount_table(max_rank: int) -> np.ndarray:
+    """1 / log2(rank + 1) for rank = 1..max_rank, at index rank - 1."""
+    return 1.0 / np.log2(np.arange(1, max_rank + 1) + 1.0)
+
+
+def score_arrays(simulation_analysis: np.ndarray, retrieved: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+                 snapshots: Dict[int, List[Tuple[int, float, float]]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (RDSG, Ideal RDSG, NDCG) arrays, one entry per simulation.
+
+    simulation_analysis[i] is the analysis id of simulation i; retrieved holds the
+    (simulation index, chunk id, similarity s, rank) columns of all their retrieved chunks, in any
+    order; snapshots are the (chunk_id, w, w') lists of the analyses ordered by ideal rank.
+    """
+    n_simulations = simulation_analysis.shape[0]
+    simulation_index, chunk_ids, similarities, ranks = retrieved
+
+    # Ideal RDSG per analysis: w / log2(i + 1) over its ideal ranking, summed per analysis
+    analysis_ids = np.asarray(sorted(snapshots), dtype=np.int64)
+    lengths = np.asarray([len(snapshots[analysis_id]) for analysis_id in analysis_ids], dtype=np.int64)
+    rows = [row for analysis_id in analysis_ids for row in snapshots[analysis_id]]
+    relevant_segment = np.repeat(np.arange(analysis_ids.shape[0]), lengths)
+    ideal_positions = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    relevant_w = np.asarray([w for _, w, _ in rows], dtype=np.float64)
+    relevant_w_prime = np.asarray([w_prime for _, _, w_prime in rows], dtype=np.float64)
+    max_rank = max(int(ranks.max()) if ranks.shape[0] else 0, int(lengths.max()) if lengths.shape[0] else 0)
+    discounts = discount_table(max_rank)
+    ideal_per_analysis = np.bincount(relevant_segment, weights=relevant_w * discounts[ideal_positions],
+                                     minlength=analysis_ids.shape[0])
+
+    # w' of each retrieved chunk: the relevant and retrieved (analysis, chunk) pairs are grouped
+    # together, so a retrieved chunk takes the w' of the relevant row in its group (0 if none)
+    relevant_pairs = np.column_stack((analysis_ids[relevant_segment],
+                                      np.asarray([c for c, _, _ in rows], dtype=np.int64).reshape(-1)))
+    retrieved_pairs = np.column_stack((simulation_analysis[simulation_index], chunk_ids))
+    pairs = np.concatenate((relevant_pairs, retrieved_pairs)).astype(np.int64, copy=False)
+    _, pair_group = np.unique(pairs, axis=0, return_inverse=True)
+    pair_group = pair_group.reshape(-1)
+    w_prime_by_group = np.zeros(pairs.shape[0])
+    w_prime_by_group[pair_group[:len(rows)]] = relevant_w_prime
+    w_prime = w_prime_by_group[pair_group[len(rows):]]
+
+    rdsg = np.bincount(simulation_index, weights=w_prime * similarities * discounts[ranks - 1],
+                       minlength=n_simulations)
+    ideal_by_analysis = dict(zip(analysis_ids.tolist(), ideal_per_analysis.tolist()))
+    ideal = np.fromiter((ideal_by_analysis.get(analysis_id, 0.0) for analysis_id in simulation_analysis.tolist()),
+                        dtype=np.float64, count=n_simulations)
+    ndcg = np.divide(rdsg, ideal, out=np.zeros(n_simulations), where=ideal > 0)
+    return rdsg, ideal, ndcg
+
+
+def _retrieved_columns(simulation_ids: Sequence[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """(simulation index, chunk id, similarity, rank) columns of the RetrievedChunks of the simulations, one query."""
+    index_by_pk = {pk: i for i, pk in enumerate(simulation_ids)}
+    rows = list(RetrievedChunk.objects.filter(simulation_id__in=simulation_ids).values_list(
+        'simulation_id', 'chunk_id', 'similarity_score_s', 'retrieved_rank'
+    ))
+    return (
+        np.fromiter((index_by_pk[row[0]] for row in rows), dtype=np.int64, count=len(rows)),
+        np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows)),
+        np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows)),
+        np.fromiter((row[3] for row in rows), dtype=np.int64, count=len(rows)),
+    )
+
+
+def _score_batch(simulations: List[RetrievalSimulation]) -> None:
+    simulation_ids = [simulation.pk for simulation in simulations]
+    retrieved = _retrieved_columns(simulation_ids)
+    analyses = list({simulation.analysis_id: simulation.analysis for simulation in simulations}.values())
+    snapshots = batch_simulation.ranked_relevant_snapshots(analyses)
+    rdsg, ideal, ndcg = score_arrays(
+        np.asarray([simulation.analysis_id for simulation in simulations], dtype=np.int64), retrieved, snapshots
+    )
+
+    for i, simulation in enumerate(simulations):
+        simulation.rdsg_score = float(rdsg[i])
+        simulation.ideal_rdsg_score = float(ideal[i])
+        simulation.ndcg_score = float(ndcg[i])
+        simulation.inputs_hash = retrieval_simulation.analysis_inputs_hash(
+            simulation.analysis, snapshots.get(simulation.analysis_id, [])
+        )
+    with transaction.atomic():
+        RetrievalSimulation.objects.bulk_update(
+            simulations, ['rdsg_score', 'ideal_rdsg_score', 'ndcg_score', 'inputs_hash']
+        )
+        results_cube.record_simulation_scores(simulations)
+
+
+def rescore_simulations(simulations=None) -> int:
+    """
+    Scores again the given simulations (a queryset or list; default: all of them) on the current
+    ranked relevant chunks, SCORING_BATCH_SIZE at a time. Returns the number of simulations scored.
+    """
+    if simulations is None:
+        simulations = RetrievalSimulation.objects.all()
+    simulation_ids = sorted(simulation.pk for simulation in simulations) if isinstance(simulations, list) else list(
+        simulations.order_by('pk').values_list('pk', flat=True)
+    )
+    for start in range(0, len(simulation_ids), SCORING_BATCH_SIZE):
+        batch = list(RetrievalSimulation.objects.filter(
+            pk__in=simulation_ids[start: start + SCORING_BATCH_SIZE]
+        ).select_related('analysis__experiment__question', 'analysis__chunk_set').order_by('pk'))
+        _score_batch(batch)
+        logger.info("BulkScoring: %d/%d simulations scored.", min(start + SCORING_BATCH_SIZE, len(simulation_ids)),
+                    len(simulation_ids))
+    return len(simulation_ids)
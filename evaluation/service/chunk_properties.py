@@ -1,7 +1,39 @@
+import logging
+
 from django.db import transaction
-import math
+import numpy as np
 
 from evaluation.models import RankedRelevantChunk, ExperimentChunkAnalysis
+from evaluation.service.interval_index import IntervalIndex
+
+logger = logging.getLogger(__name__)
+
+
+def _fill_missing_overlaps(analysis: ExperimentChunkAnalysis, rrc_pks, overlaps, chunk_starts, chunk_ends):
+    """
+    Computes (and caches) relevant_overlap_chars for the rows initialised before the
+    overlap cache existed. Modifies `overlaps` in place.
+    """
+    missing = np.isnan(overlaps)
+    if not missing.any():
+        return
+
+    logger.info("Overlap non in cache per %d chunk, calcolo dalle frasi rilevanti.", int(missing.sum()))
+    sentence_spans = list(analysis.experiment.relevant_sentences.values_list('start_char', 'end_char'))
+    if sentence_spans:
+        sentence_starts, sentence_ends = zip(*sentence_spans)
+        index = IntervalIndex(sentence_starts, sentence_ends)
+        overlaps[missing] = index.overlap_lengths(chunk_starts[missing], chunk_ends[missing])
+    else:
+        overlaps[missing] = 0
+
+    RankedRelevantChunk.objects.bulk_update(
+        [
+            RankedRelevantChunk(pk=int(pk), relevant_overlap_chars=int(overlap))
+            for pk, overlap in zip(rrc_pks[missing], overlaps[missing])
+        ],
+        ['relevant_overlap_chars'],
+    )
 
 
 @transaction.atomic
@@ -9,75 +41,58 @@ def calculate_chunk_properties(analysis: ExperimentChunkAnalysis):
     """
     Calcola e salva w, Density, e w' per tutti i RankedRelevantChunk
     associati a questa analisi, assumendo che ideal_rank sia già impostato.
+    Le sovrapposizioni con le frasi rilevanti sono già in cache (relevant_overlap_chars,
+    salvate da initialize_analysis), quindi il calcolo è O(k) e vettoriale.
     """
-    print(f"Calcolo proprietà per Analysis ID: {analysis.id}") # Log
+    logger.info("Calcolo proprietà per Analysis ID: %d", analysis.id)
 
-    ranked_chunks = analysis.ranked_relevant_chunks.select_related('chunk').filter(ideal_rank__isnull=False)
-    relevant_sentences = analysis.experiment.relevant_sentences.all()
     k_relevant = analysis.k_relevant
 
     if k_relevant is None or k_relevant == 0:
-        print("k_relevant non definito o zero, nessun calcolo necessario.")
+        logger.info("k_relevant non definito o zero, nessun calcolo necessario.")
         return # Non c'è nulla da calcolare
 
-    if not ranked_chunks.exists():
-        print("Nessun chunk rilevante rankato trovato per l'analisi.")
+    rows = list(
+        analysis.ranked_relevant_chunks.filter(ideal_rank__isnull=False).values_list(
+            'pk', 'ideal_rank', 'relevant_overlap_chars', 'chunk__start_char', 'chunk__end_char'
+        )
+    )
+    if not rows:
+        logger.info("Nessun chunk rilevante rankato trovato per l'analisi.")
         return
 
-    if not relevant_sentences.exists():
-        print("Nessuna frase rilevante trovata per l'esperimento, Density sarà 0.")
-        # Imposta w' a 0 per tutti? O solleva errore? Impostiamo a 0.
-        for rrc in ranked_chunks:
-            rrc.intrinsic_importance_w = k_relevant - rrc.ideal_rank + 1
-            rrc.relevance_density = 0.0
-            rrc.effective_relevance_w_prime = 0.0
-        RankedRelevantChunk.objects.bulk_update(ranked_chunks, ['intrinsic_importance_w', 'relevance_density', 'effective_relevance_w_prime'])
-        return
+    rrc_pks = np.array([row[0] for row in rows], dtype=np.int64)
+    ideal_ranks = np.array([row[1] for row in rows], dtype=np.int64)
+    overlaps = np.array([np.nan if row[2] is None else row[2] for row in rows], dtype=np.float64)
+    chunk_starts = np.array([row[3] for row in rows], dtype=np.int64)
+    chunk_ends = np.array([row[4] for row in rows], dtype=np.int64)
+    _fill_missing_overlaps(analysis, rrc_pks, overlaps, chunk_starts, chunk_ends)
+
+    # 1. Calcola w(c) (Intrinsic Importance), saltando i rank non validi
+    valid = (ideal_ranks >= 1) & (ideal_ranks <= k_relevant)
+    for pk, rank in zip(rrc_pks[~valid], ideal_ranks[~valid]):
+        logger.warning("Rank non valido (%d) per RRC ID %d. Salto calcolo proprietà.", rank, pk)
+    w = (k_relevant - ideal_ranks + 1).astype(np.float64)
+
+    # 2. Calcola Density(c): caratteri rilevanti / lunghezza del chunk (0 se lunghezza zero)
+    chunk_lengths = (chunk_ends - chunk_starts).astype(np.float64)
+    density = np.divide(overlaps, chunk_lengths, out=np.zeros_like(overlaps), where=chunk_lengths > 0)
+
+    # 3. Calcola w'(c) (Effective Relevance), con densità limitata a [0, 1] per sicurezza
+    w_prime = w * np.sqrt(np.clip(density, 0.0, 1.0))
 
-    # Prepara lista per bulk update
-    chunks_to_update = []
-    for rrc in ranked_chunks:
-        # 1. Calcola w(c) (Intrinsic Importance)
-        # Assicurati che ideal_rank sia valido (dovrebbe esserlo data la query filter)
-        if rrc.ideal_rank is None or rrc.ideal_rank < 1 or rrc.ideal_rank > k_relevant:
-             print(f"WARN: Rank non valido ({rrc.ideal_rank}) per RRC ID {rrc.id}. Salto calcolo proprietà.")
-             continue # Salta questo chunk se il rank non è valido
-
-        rrc.intrinsic_importance_w = float(k_relevant - rrc.ideal_rank + 1)
-
-        # 2. Calcola Density(c)
-        chunk = rrc.chunk
-        chunk_start = chunk.start_char
-        chunk_end = chunk.end_char
-        chunk_length = float(chunk.length) # Usa float per la divisione
-        overlapping_sentences_length = 0
-
-        if chunk_length > 0: # Evita divisione per zero
-            for sentence in relevant_sentences:
-                sent_start = sentence.start_char
-                sent_end = sentence.end_char
-                # Check overlap
-                if sent_start < chunk_end and sent_end > chunk_start:
-                    # Calcola la lunghezza della *parte* della frase che cade nel chunk
-                    overlap_start = max(sent_start, chunk_start)
-                    overlap_end = min(sent_end, chunk_end)
-                    overlapping_sentences_length += (overlap_end - overlap_start)
-
-            rrc.relevance_density = overlapping_sentences_length / chunk_length
-        else:
-            rrc.relevance_density = 0.0 # Densità zero se il chunk ha lunghezza zero
-
-        # 3. Calcola w'(c) (Effective Relevance)
-        # Gestisci densità negativa o > 1 (non dovrebbe accadere ma per sicurezza)
-        density = max(0.0, min(1.0, rrc.relevance_density))
-        # Usa math.sqrt, assicurati che l'argomento non sia negativo (già fatto con max)
-        rrc.effective_relevance_w_prime = rrc.intrinsic_importance_w * math.sqrt(density)
-
-        chunks_to_update.append(rrc)
-        # print(f"RRC ID {rrc.id}: Rank={rrc.ideal_rank}, w={rrc.intrinsic_importance_w:.2f}, Density={rrc.relevance_density:.3f}, w'={rrc.effective_relevance_w_prime:.3f}") # Debug log
+    chunks_to_update = [
+        RankedRelevantChunk(
+            pk=int(pk),
+            intrinsic_importance_w=float(w_c),
+            relevance_density=float(density_c),
+            effective_relevance_w_prime=float(w_prime_c),
+        )
+        for pk, w_c, density_c, w_prime_c in zip(rrc_pks[valid], w[valid], density[valid], w_prime[valid])
+    ]
 
     # Salva tutti gli aggiornamenti in un colpo solo
     if chunks_to_update:
         updated_fields = ['intrinsic_importance_w', 'relevance_density', 'effective_relevance_w_prime']
         RankedRelevantChunk.objects.bulk_update(chunks_to_update, updated_fields)
-        print(f"Aggiornate proprietà per {len(chunks_to_update)} oggetti RankedRelevantChunk.")
\ No newline at end of file
+        logger.info("Aggiornate proprietà per %d oggetti RankedRelevantChunk.", len(chunks_to_update))
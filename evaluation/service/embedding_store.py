@@ -0,0 +1,87 @@
+# evaluation/service/embedding_store.py
+import hashlib
+import logging
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+
+from evaluation.models import CachedEmbedding
+from experiments.service import embedding_registry
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound parameters per query, so hash lookups are split in batches
+LOOKUP_BATCH_SIZE = 500
+# Query vectors carry the model's query instruction, so they are stored under their own model key
+QUERY_MODEL_SUFFIX = '#query'
+
+
+def text_hash(text: str) -> str:
+    """Returns the content address (SHA-256 hex digest) of a text."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _load_vectors(model_name: str, hashes: Sequence[str]) -> Dict[str, np.ndarray]:
+    """Loads the stored vectors for the given hashes, returning {text_hash: float32 vector}."""
+    found = {}
+    for i in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+        batch = hashes[i: i + LOOKUP_BATCH_SIZE]
+        rows = CachedEmbedding.objects.filter(
+            model_name=model_name, text_hash__in=batch
+        ).values_list('text_hash', 'vector')
+        for row_hash, blob in rows:
+            found[row_hash] = np.frombuffer(bytes(blob), dtype=np.float32)
+    return found
+
+
+def get_embeddings(texts: Sequence[str], model_name: str,
+                   embed_fn: Callable[[List[str]], List[List[float]]]) -> np.ndarray:
+    """
+    Returns a (len(texts), dim) float32 matrix of embeddings for the given texts.
+    Vectors already stored for (model_name, text hash) are reused; only the missing
+    texts are passed to embed_fn (once per distinct text) and then persisted.
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    hashes = [text_hash(t) for t in texts]
+    unique_hashes = list(dict.fromkeys(hashes))
+    vectors = _load_vectors(model_name, unique_hashes)
+
+    missing_hashes = [h for h in unique_hashes if h not in vectors]
+    if missing_hashes:
+        text_by_hash = dict(zip(hashes, texts))
+        missing_texts = [text_by_hash[h] for h in missing_hashes]
+        logger.info("EmbeddingStore: %d cached, %d to embed with '%s'.",
+                    len(unique_hashes) - len(missing_hashes), len(missing_hashes), model_name)
+        new_vectors = np.asarray(embed_fn(missing_texts), dtype=np.float32)
+
+        CachedEmbedding.objects.bulk_create(
+            [
+                CachedEmbedding(
+                    model_name=model_name,
+                    text_hash=h,
+                    dimension=vec.shape[0],
+                    vector=vec.tobytes(),
+                )
+                for h, vec in zip(missing_hashes, new_vectors)
+            ],
+            ignore_conflicts=True,  # Another run may have stored the same text meanwhile
+        )
+        vectors.update(zip(missing_hashes, new_vectors))
+    else:
+        logger.info("EmbeddingStore: all %d embeddings found in cache for '%s'.", len(unique_hashes), model_name)
+
+    return np.vstack([vectors[h] for h in hashes])
+
+
+def get_query_embeddings(queries: Sequence[str], model_name: str) -> np.ndarray:
+    """
+    Returns a (len(queries), dim) float32 matrix of query embeddings (e.g. experiment questions),
+    stored by (model_name, question text hash): a question is embedded once per model, however
+    many ChunkSets it is retrieved against and however often its simulations are run again.
+    """
+    return get_embeddings(
+        list(queries), f'{model_name}{QUERY_MODEL_SUFFIX}',
+        lambda missing: embedding_registry.embed_queries(model_name, missing),
+    )
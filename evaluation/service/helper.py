@@ -3,6 +3,7 @@ from django.db import transaction, IntegrityError
 from evaluation.service import chunk_properties, retrieval_simulation
 
 from evaluation.models import ExperimentChunkAnalysis, RankedRelevantChunk
+from jobs.service import job_queue
 
 
 def handle_save_ranking_and_properties(request, analysis: ExperimentChunkAnalysis, experiment_pk: int, chunk_set_pk: int):
@@ -89,15 +90,18 @@ def handle_save_ranking_and_properties(request, analysis: ExperimentChunkAnalysi
     try:
         with transaction.atomic():
             if analysis.k_relevant > 0:
+                rrc_by_chunk_pk = {
+                    rrc.chunk_id: rrc
+                    for rrc in RankedRelevantChunk.objects.filter(analysis=analysis, chunk_id__in=submitted_ranks_map)
+                }
                 updated_rrcs = []
                 for chunk_pk, rank_value in submitted_ranks_map.items():
-                    try:
-                        rrc = RankedRelevantChunk.objects.get(analysis=analysis, chunk_id=chunk_pk)
-                        rrc.ideal_rank = rank_value
-                        updated_rrcs.append(rrc)
-                    except RankedRelevantChunk.DoesNotExist:
+                    rrc = rrc_by_chunk_pk.get(chunk_pk)
+                    if rrc is None:
                         messages.error(request, f"Critical error: RankedRelevantChunk not found for chunk PK {chunk_pk}.")
-                        raise
+                        raise RankedRelevantChunk.DoesNotExist(f"No RankedRelevantChunk for chunk PK {chunk_pk}")
+                    rrc.ideal_rank = rank_value
+                    updated_rrcs.append(rrc)
 
                 if updated_rrcs:
                     RankedRelevantChunk.objects.bulk_update(updated_rrcs, ['ideal_rank'])
@@ -139,27 +143,18 @@ def handle_run_simulation_and_rdsg(request, analysis: ExperimentChunkAnalysis, e
             messages.error(request, "Error: Chunk properties (w′) must be calculated before running the simulation. Please save the ranking first.")
             return True
 
-    # 2. Call services
-    try:
-        with transaction.atomic():
-            simulation = retrieval_simulation.run_retrieval_simulation(analysis)
-
-            if not simulation:
-                messages.error(request, "Retrieval simulation creation failed.")
-                return True
-
-            messages.info(request, f"Simulation (ID: {simulation.id}) completed. Retrieved {simulation.k_retrieved} chunks.")
-
-            # Compute RDSG
-            retrieval_simulation.calculate_rdsg_and_ndcg(simulation)
-
-            messages.success(request, f"NDCG score calculated: {simulation.ndcg_score:.4f}")
-            return False
+    # 2. Queue the simulation: retrieval and scoring run in the job worker, not in the request
+    retriever_name = request.POST.get('retriever_name') or retrieval_simulation.LLAMA_INDEX_RETRIEVER_NAME
+    if retriever_name not in retrieval_simulation.RETRIEVER_NAMES:
+        messages.error(request, f"Error: unknown retriever '{retriever_name}'.")
+        return True
 
-    except ValueError as ve:
-        messages.error(request, f"Error during simulation preparation: {ve}")
-    except Exception as e:
-        messages.error(request, f"Unexpected error during simulation or RDSG calculation: {e}")
-        print(f"Unhandled exception in _handle_run_simulation_and_rdsg: {e}")
+    model_name = request.POST.get('embedding_model_name') or retrieval_simulation.GLOBAL_EMBED_MODEL_NAME
+    if model_name not in retrieval_simulation.EMBED_MODEL_NAMES:
+        messages.error(request, f"Error: unknown embedding model '{model_name}'.")
+        return True
 
-    return True
+    job = job_queue.enqueue('simulate', {'analysis_id': analysis.pk, 'retriever_name': retriever_name,
+                                         'embedding_model_name': model_name})
+    messages.info(request, f"Retrieval simulation with {retriever_name} ({model_name}) queued (job #{job.pk}).")
+    return False
@@ -0,0 +1,76 @@
+# evaluation/service/interval_index.py
+from typing import Sequence, Tuple
+
+import numpy as np
+
+
+class IntervalIndex:
+    """
+    Index over a set of half-open character intervals [start, end) (e.g. the relevant
+    sentences of an experiment), answering overlap queries for many query intervals
+    (e.g. all chunks of a ChunkSet) at once.
+
+    The starts and the ends are kept in two sorted arrays with their prefix sums, so that
+    for any position x the number of intervals starting before x and the total coverage
+    of [0, x) are found with a binary search. Every query is then O(log n) and all
+    queries are answered in a single vectorised pass.
+    """
+
+    def __init__(self, starts: Sequence[int], ends: Sequence[int]):
+        self.starts = np.sort(np.asarray(starts, dtype=np.int64))
+        self.ends = np.sort(np.asarray(ends, dtype=np.int64))
+        self._starts_prefix = np.concatenate(([0], np.cumsum(self.starts)))
+        self._ends_prefix = np.concatenate(([0], np.cumsum(self.ends)))
+
+    def __len__(self):
+        return self.starts.shape[0]
+
+    def _coverage_before(self, positions: np.ndarray) -> np.ndarray:
+        """
+        Sum over all intervals of |[start, end) ∩ [0, x)| for each position x.
+        Equal to sum(x - start for start < x) - sum(x - end for end < x).
+        """
+        n_started = np.searchsorted(self.starts, positions, side='left')
+        n_ended = np.searchsorted(self.ends, positions, side='left')
+        started = n_started * positions - self._starts_prefix[n_started]
+        ended = n_ended * positions - self._ends_prefix[n_ended]
+        return started - ended
+
+    def overlap_counts(self, query_starts: Sequence[int], query_ends: Sequence[int]) -> np.ndarray:
+        """
+        Number of indexed intervals overlapping each query interval, using the same
+        condition as the original nested loop: start < query_end and end > query_start.
+        """
+        query_starts = np.asarray(query_starts, dtype=np.int64)
+        query_ends = np.asarray(query_ends, dtype=np.int64)
+        # Intervals ending at or before query_start also start before query_end, so the
+        # overlapping ones are simply the difference of the two counts.
+        started_before_end = np.searchsorted(self.starts, query_ends, side='left')
+        ended_before_start = np.searchsorted(self.ends, query_starts, side='right')
+        return started_before_end - ended_before_start
+
+    def overlap_lengths(self, query_starts: Sequence[int], query_ends: Sequence[int]) -> np.ndarray:
+        """
+        Total number of characters of the indexed intervals falling inside each query
+        interval (summed per interval, as in the Density(c) definition).
+        """
+        query_starts = np.asarray(query_starts, dtype=np.int64)
+        query_ends = np.asarray(query_ends, dtype=np.int64)
+        return self._coverage_before(query_ends) - self._coverage_before(query_starts)
+
+
+def find_overlaps(sentence_spans: Sequence[Tuple[int, int]], chunk_ids: Sequence[int],
+                  chunk_starts: Sequence[int], chunk_ends: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns (relevant_chunk_ids, overlap_lengths): the ids of the chunks overlapping at least
+    one sentence span and, aligned with them, the number of relevant characters they contain.
+    """
+    chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+    if not len(sentence_spans) or not chunk_ids.shape[0]:
+        return chunk_ids[:0], np.zeros(0, dtype=np.int64)
+
+    sentence_starts, sentence_ends = zip(*sentence_spans)
+    index = IntervalIndex(sentence_starts, sentence_ends)
+    is_relevant = index.overlap_counts(chunk_starts, chunk_ends) > 0
+    lengths = index.overlap_lengths(chunk_starts, chunk_ends)
+    return chunk_ids[is_relevant], lengths[is_relevant]
@@ -0,0 +1,253 @@
+# evaluation/service/invalidation.py
+"""
+Dependency-aware invalidation of the derived results.
+
+    SourceText file --+
+                      +--> ChunkSet --+
+    ChunkingStrategy -+               +--> ExperimentChunkAnalysis --> RetrievalSimulation
+    RelevantSentences ----------------+    (k_relevant, ranked chunks)  (RDSG / NDCG)
+
+Every derived object records the versions of its inputs when it is computed:
+ChunkSet.source_hash / strategy_fingerprint, ExperimentChunkAnalysis.annotations_hash /
+chunk_set_version and RetrievalSimulation.inputs_hash. An object is stale when one of its
+recorded versions no longer matches the current inputs, or when what it depends on is stale.
+Objects computed before the versions were recorded (blank versions) count as stale.
+"""
+import logging
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from corpus.models import SourceText
+from corpus.service import source_text_service
+from evaluation.models import ExperimentChunkAnalysis, RankedRelevantChunk, RetrievalSimulation
+from evaluation.service import batch_simulation, chunk_properties, numpy_retriever, relevant_chunks, retrieval_simulation
+from experiments.models import ChunkingStrategy, ChunkSet, RelevantSentence
+from experiments.service import chunk_reuse, chunking_pipeline
+
+logger = logging.getLogger(__name__)
+
+
+def stale_chunk_sets(chunk_set_ids: Optional[Iterable[int]] = None) -> Dict[int, str]:
+    """
+    {ChunkSet pk: reason} of the sets whose source file or strategy parameters changed since
+    they were chunked. Source files are hashed again, so edits made outside the app are seen.
+    """
+    chunk_sets = ChunkSet.objects.order_by('pk')
+    if chunk_set_ids is not None:
+        chunk_sets = chunk_sets.filter(pk__in=list(chunk_set_ids))
+    chunk_sets = list(chunk_sets.only('pk', 'source_text_id', 'strategy_id', 'source_hash', 'strategy_fingerprint'))
+
+    source_hashes = {}
+    for source_text in SourceText.objects.filter(pk__in={cs.source_text_id for cs in chunk_sets}):
+        try:
+            source_hashes[source_text.pk] = source_text_service.get_content_hash(source_text, refresh=True)
+        except OSError as e:
+            logger.error("Invalidation: cannot read the file of '%s': %s", source_text.title, e)
+    fingerprints = {}
+    for strategy in ChunkingStrategy.objects.filter(pk__in={cs.strategy_id for cs in chunk_sets}):
+        try:
+            fingerprints[strategy.pk] = chunk_reuse.strategy_fingerprint(strategy)
+        except ValueError as e:
+            logger.error("Invalidation: strategy '%s' has invalid parameters: %s", strategy.name, e)
+
+    stale = {}
+    for chunk_set in chunk_sets:
+        source_hash = source_hashes.get(chunk_set.source_text_id)
+        fingerprint = fingerprints.get(chunk_set.strategy_id)
+        if source_hash is not None and chunk_set.source_hash != source_hash:
+            stale[chunk_set.pk] = 'source file changed' if chunk_set.source_hash else 'source hash unknown'
+        elif fingerprint is not None and chunk_set.strategy_fingerprint != fingerprint:
+            stale[chunk_set.pk] = ('strategy parameters changed' if chunk_set.strategy_fingerprint
+                                   else 'strategy fingerprint unknown')
+    return stale
+
+
+def _current_annotations_hashes(experiment_ids: Iterable[int]) -> Dict[int, str]:
+    """{experiment pk: annotations_hash of its current relevant sentences}, with a single query."""
+    experiment_ids = set(experiment_ids)
+    spans: Dict[int, List[Tuple[int, int]]] = {experiment_id: [] for experiment_id in experiment_ids}
+    rows = RelevantSentence.objects.filter(experiment_id__in=experiment_ids).values_list(
+        'experiment_id', 'start_char', 'end_char'
+    )
+    for experiment_id, start_char, end_char in rows:
+        spans[experiment_id].append((start_char, end_char))
+    return {experiment_id: relevant_chunks.annotations_hash(s) for experiment_id, s in spans.items()}
+
+
+def stale_analyses(stale_chunk_set_ids: Iterable[int] = (),
+                   experiment_ids: Optional[Iterable[int]] = None) -> Dict[int, str]:
+    """
+    {ExperimentChunkAnalysis pk: reason} of the initialised analyses whose relevant sentences or
+    chunks changed since initialisation, or whose chunk set is itself stale.
+    """
+    stale_chunk_set_ids = set(stale_chunk_set_ids)
+    analyses = ExperimentChunkAnalysis.objects.filter(k_relevant__isnull=False).select_related('chunk_set')
+    if experiment_ids is not None:
+        analyses = analyses.filter(experiment_id__in=list(experiment_ids))
+    analyses = list(analyses.only('pk', 'experiment_id', 'annotations_hash', 'chunk_set_version', 'chunk_set__version'))
+    current_hashes = _current_annotations_hashes(analysis.experiment_id for analysis in analyses)
+
+    stale = {}
+    for analysis in analyses:
+        if analysis.chunk_set_id in stale_chunk_set_ids:
+            stale[analysis.pk] = 'chunk set stale'
+        elif analysis.chunk_set_version != analysis.chunk_set.version:
+            stale[analysis.pk] = 'chunks replaced'
+        elif analysis.annotations_hash != current_hashes[analysis.experiment_id]:
+            stale[analysis.pk] = 'relevant sentences changed'
+    return stale
+
+
+def latest_simulations() -> List[RetrievalSimulation]:
+    """The most recent simulation of each (analysis, retriever, embedding model); older ones are history."""
+    latest = {}
+    for simulation in RetrievalSimulation.objects.order_by('ran_at', 'pk').only(
+        'pk', 'analysis_id', 'retriever_name', 'embedding_model_name', 'inputs_hash'
+    ):
+        latest[(simulation.analysis_id, simulation.retriever_name, simulation.embedding_model_name)] = simulation
+    return list(latest.values())
+
+
+def stale_simulations(stale_analysis_ids: Iterable[int] = ()) -> Dict[int, str]:
+    """
+    {RetrievalSimulation pk: reason} of the latest simulations whose analysis is stale or whose
+    inputs (question, k_relevant, chunk set version, ranked relevant chunks) changed since scoring.
+    """
+    stale_analysis_ids = set(stale_analysis_ids)
+    simulations = latest_simulations()
+    analyses = list(ExperimentChunkAnalysis.objects.filter(
+        pk__in={simulation.analysis_id for simulation in simulations}
+    ).select_related('experiment__question', 'chunk_set'))
+    snapshots = batch_simulation.ranked_relevant_snapshots(analyses)
+    current_hashes = {
+        analysis.pk: retrieval_simulation.analysis_inputs_hash(analysis, snapshots.get(analysis.pk, []))
+        for analysis in analyses
+    }
+
+    stale = {}
+    for simulation in simulations:
+        if simulation.analysis_id in stale_analysis_ids:
+            stale[simulation.pk] = 'analysis stale'
+        elif simulation.inputs_hash != current_hashes[simulation.analysis_id]:
+            stale[simulation.pk] = 'inputs changed' if simulation.inputs_hash else 'inputs unknown'
+    return stale
+
+
+def find_stale() -> Dict[str, Dict[int, str]]:
+    """The invalidation graph: {'chunk_sets'|'analyses'|'simulations': {pk: reason}}."""
+    chunk_sets = stale_chunk_sets()
+    analyses = stale_analyses(chunk_sets)
+    simulations = stale_simulations(analyses)
+    return {'chunk_sets': chunk_sets, 'analyses': analyses, 'simulations': simulations}
+
+
+def _is_ready(analysis: ExperimentChunkAnalysis) -> bool:
+    """Every relevant chunk has its w' computed (the ranking is complete)."""
+    if not analysis.k_relevant:
+        return True
+    n_w_prime = RankedRelevantChunk.objects.filter(
+        analysis=analysis, effective_relevance_w_prime__isnull=False
+    ).count()
+    return n_w_prime >= analysis.k_relevant
+
+
+def _refresh_analysis(analysis: ExperimentChunkAnalysis) -> bool:
+    """
+    Initialises the analysis again and, when the existing ranking still covers every relevant
+    chunk, recomputes w, Density and w'. Returns False when a new manual ranking is needed.
+    """
+    relevant_chunks.initialize_analysis(analysis)
+    analysis.refresh_from_db()
+    if not analysis.k_relevant:
+        return True
+    n_ranked = analysis.ranked_relevant_chunks.filter(ideal_rank__isnull=False).count()
+    if n_ranked < analysis.k_relevant:
+        return False
+    chunk_properties.calculate_chunk_properties(analysis)
+    return _is_ready(analysis)
+
+
+def recompute_stale(dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Redoes only the stale part of the graph, in dependency order: stale chunk sets are rechunked
+    (in place, a set whose output is unchanged is only re-stamped; replacing the chunks deletes the
+    simulations run on the old ones), stale analyses are initialised again, then the stale latest
+    simulations, and those deleted with their chunks, are run again with the same retriever and model.
+    Analyses whose relevant chunks changed keep their manual ranks as a hint but need a new
+    ranking before they can be simulated: they are returned in 'awaiting_ranking'.
+    With dry_run=True only the stale objects are returned.
+    """
+    stale = find_stale()
+    summary: Dict[str, Any] = {'stale': stale, 'rechunked': [], 'restamped': [], 'reinitialised': [],
+                               'awaiting_ranking': [], 'simulations': [], 'deleted_simulations': 0, 'errors': []}
+    if dry_run:
+        return summary
+
+    # (retriever, embedding model) of the latest simulations of each analysis of the stale sets:
+    # rechunking deletes them, they are run again on the new chunks
+    previous_runs: Dict[int, List[Tuple[str, str]]] = defaultdict(list)
+    analysis_sets = dict(ExperimentChunkAnalysis.objects.filter(chunk_set_id__in=stale['chunk_sets']).values_list(
+        'pk', 'chunk_set_id'
+    ))
+    for simulation in latest_simulations():
+        if simulation.analysis_id in analysis_sets:
+            previous_runs[simulation.analysis_id].append((simulation.retriever_name, simulation.embedding_model_name))
+
+    for chunk_set in ChunkSet.objects.filter(pk__in=stale['chunk_sets']).select_related('source_text', 'strategy'):
+        try:
+            replaced, n_deleted = chunking_pipeline.rechunk_chunk_set(chunk_set)
+        except Exception as e:
+            logger.error("Invalidation: rechunking ChunkSet %d failed: %s", chunk_set.pk, e)
+            summary['errors'].append(f"ChunkSet {chunk_set.pk}: {e}")
+            continue
+        summary['rechunked' if replaced else 'restamped'].append(chunk_set.pk)
+        summary['deleted_simulations'] += n_deleted
+    rechunked = set(summary['rechunked'])
+
+    # The graph is walked again: a set re-stamped without changes does not invalidate its analyses,
+    # while the analyses of a set that could not be rechunked are left alone
+    analysis_reasons = stale_analyses(stale_chunk_sets(stale['chunk_sets']))
+    blocked = {pk for pk, reason in analysis_reasons.items() if reason == 'chunk set stale'}
+    for analysis in ExperimentChunkAnalysis.objects.filter(pk__in=set(analysis_reasons) - blocked).select_related(
+        'experiment', 'chunk_set'
+    ):
+        summary['reinitialised'].append(analysis.pk)
+        if not _refresh_analysis(analysis):
+            summary['awaiting_ranking'].append(analysis.pk)
+
+    simulation_reasons = stale_simulations(blocked)
+    simulations = RetrievalSimulation.objects.filter(
+        pk__in=[pk for pk, reason in simulation_reasons.items() if reason != 'analysis stale']
+    ).select_related(
+        'analysis__experiment__question', 'analysis__chunk_set'
+    )
+    runs = [(simulation.analysis, simulation.retriever_name, simulation.embedding_model_name)
+            for simulation in simulations]
+    for analysis in ExperimentChunkAnalysis.objects.filter(
+        pk__in=[pk for pk, chunk_set_id in analysis_sets.items() if chunk_set_id in rechunked]
+    ).select_related('experiment__question', 'chunk_set'):
+        runs.extend((analysis, retriever_name, model_name) for retriever_name, model_name in previous_runs[analysis.pk])
+
+    batched: Dict[str, List[ExperimentChunkAnalysis]] = defaultdict(list)
+    single = []
+    for analysis, retriever_name, model_name in runs:
+        if not _is_ready(analysis):
+            if analysis.pk not in summary['awaiting_ranking']:
+                summary['awaiting_ranking'].append(analysis.pk)
+        elif retriever_name == numpy_retriever.RETRIEVER_NAME:
+            batched[model_name].append(analysis)
+        else:
+            single.append((analysis, retriever_name, model_name))
+
+    created = []
+    for model_name, analyses in batched.items():
+        created.extend(batch_simulation.simulate_analyses(analyses, model_name))
+    for analysis, retriever_name, model_name in single:
+        try:
+            created.append(retrieval_simulation.simulate_and_score(analysis, retriever_name=retriever_name,
+                                                                   embedding_model_name=model_name))
+        except Exception as e:
+            logger.error("Invalidation: simulating analysis %d failed: %s", analysis.pk, e)
+            summary['errors'].append(f"Analysis {analysis.pk}: {e}")
+    summary['simulations'] = [simulation.pk for simulation in created]
+    return summary
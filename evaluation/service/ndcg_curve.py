@@ -0,0 +1,103 @@
+# evaluation/service/ndcg_curve.py
+"""
+RDSG, Ideal RDSG and NDCG at every cut-off k = 1..N of a simulation, from the full similarity
+ranking stored on it (RetrievalSimulation.ranking_chunk_ids / ranking_scores).
+
+The gains of the ranking are accumulated with one cumulative sum, so the whole curve costs the
+same as a single score. The Ideal RDSG@k is cut at min(k, relevant) chunks, while the per-run score
+of compute_rdsg_and_ndcg never cuts it: the two agree from k = relevant on, hence at k_retrieved
+(at least twice the relevant chunks), and below it NDCG@k is never lower than the untruncated ratio.
+For the LlamaIndex retriever the stored ranking is the exact NumPy one, so its NDCG@k_retrieved
+can differ slightly from the NDCG of the run.
+"""
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from evaluation.models import RetrievalSimulation
+from evaluation.service import batch_simulation, numpy_retriever, retrieval_simulation
+
+# Cut-offs shown next to the requested k on the analysis page
+DEFAULT_CUTOFFS = (1, 3, 5, 10, 20)
+
+
+def decode_ranking(simulation: RetrievalSimulation) -> Optional[numpy_retriever.Ranking]:
+    """The stored full ranking of the simulation, None for simulations run before it was stored."""
+    if simulation.ranking_chunk_ids is None or simulation.ranking_scores is None:
+        return None
+    return (np.frombuffer(bytes(simulation.ranking_chunk_ids), dtype=np.int64),
+            np.frombuffer(bytes(simulation.ranking_scores), dtype=np.float32))
+
+
+def compute_curves(ranking: numpy_retriever.Ranking,
+                   ranked_relevant: Sequence[Tuple[int, float, float]]) -> Dict[str, np.ndarray]:
+    """
+    {'rdsg', 'ideal_rdsg', 'ndcg'}: arrays whose entry k-1 is the score at cut-off k, for k = 1..N,
+    from a full ranking and the (chunk_id, w, w') snapshot of the ranked relevant chunks.
+    RDSG@k sums w' * s / log2(i + 1) over the first k retrieved chunks, Ideal RDSG@k sums
+    w / log2(i + 1) over the first min(k, relevant) chunks of the ideal ranking: below the number
+    of relevant chunks this is smaller than the Ideal RDSG of compute_rdsg_and_ndcg, which always
+    sums them all; from there on (so at k_retrieved) the NDCG equals that of compute_rdsg_and_ndcg.
+    """
+    chunk_pks, scores = ranking
+    n = chunk_pks.shape[0]
+    discounts = 1.0 / np.log2(np.arange(1, n + 1) + 1.0)
+
+    relevant_ids = np.asarray([chunk_id for chunk_id, _, _ in ranked_relevant], dtype=np.int64)
+    w_prime = np.asarray([w_prime for _, _, w_prime in ranked_relevant], dtype=np.float64)
+    order = np.argsort(relevant_ids)
+    relevant_ids, w_prime = relevant_ids[order], w_prime[order]
+    positions = np.clip(np.searchsorted(relevant_ids, chunk_pks), 0, max(0, len(relevant_ids) - 1))
+    is_relevant = (relevant_ids[positions] == chunk_pks) if len(relevant_ids) else np.zeros(n, dtype=bool)
+    gains = np.where(is_relevant, w_prime[positions] if len(relevant_ids) else 0.0, 0.0)
+    rdsg = np.cumsum(gains * scores.astype(np.float64) * discounts)
+
+    ideal_w = np.asarray([w for _, w, _ in ranked_relevant], dtype=np.float64)
+    ideal_cumulative = np.cumsum(ideal_w / np.log2(np.arange(1, len(ideal_w) + 1) + 1.0))
+    if len(ideal_w):
+        ideal_rdsg = ideal_cumulative[np.minimum(np.arange(n), len(ideal_w) - 1)]
+    else:
+        ideal_rdsg = np.zeros(n)
+
+    ndcg = np.divide(rdsg, ideal_rdsg, out=np.zeros(n), where=ideal_rdsg > 0)
+    return {'rdsg': rdsg, 'ideal_rdsg': ideal_rdsg, 'ndcg': ndcg}
+
+
+def value_at(curve: np.ndarray, k: int) -> float:
+    """Score at cut-off k: beyond the last ranked chunk the curve stays flat, 0 for an empty ranking."""
+    if not curve.shape[0] or k < 1:
+        return 0.0
+    return float(curve[min(k, curve.shape[0]) - 1])
+
+
+def simulation_curves(simulation: RetrievalSimulation,
+                      ranked_relevant: Optional[Sequence[Tuple[int, float, float]]] = None
+                      ) -> Optional[Dict[str, np.ndarray]]:
+    """Curves of a simulation on the current ranked relevant chunks (or the given snapshot); None without a ranking."""
+    ranking = decode_ranking(simulation)
+    if ranking is None:
+        return None
+    if ranked_relevant is None:
+        ranked_relevant = retrieval_simulation.get_ranked_relevant_snapshot(simulation.analysis_id)
+    return compute_curves(ranking, ranked_relevant)
+
+
+def curve_points(curves: Dict[str, np.ndarray], cutoffs: Iterable[int]) -> List[Dict[str, float]]:
+    """[{'k', 'rdsg', 'ideal_rdsg', 'ndcg'}] at the given cut-offs, sorted and without duplicates."""
+    return [
+        {'k': k, **{name: value_at(curve, k) for name, curve in curves.items()}}
+        for k in sorted({k for k in cutoffs if k >= 1})
+    ]
+
+
+def ndcg_at_k(simulations: Sequence[RetrievalSimulation], k: int) -> Dict[int, Optional[float]]:
+    """
+    {simulation pk: NDCG@k} of many simulations, reading their ranked relevant snapshots with one
+    query; None for simulations without a stored ranking.
+    """
+    snapshots = batch_simulation.ranked_relevant_snapshots([simulation.analysis_id for simulation in simulations])
+    values = {}
+    for simulation in simulations:
+        curves = simulation_curves(simulation, snapshots.get(simulation.analysis_id, []))
+        values[simulation.pk] = None if curves is None else value_at(curves['ndcg'], k)
+    return values
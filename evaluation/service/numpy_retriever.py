@@ -0,0 +1,127 @@
+# evaluation/service/numpy_retriever.py
+from typing import List, Sequence, Tuple, Union
+
+import numpy as np
+
+from evaluation.service import embedding_store
+from experiments.service import chunk_storage, embedding_registry
+
+RETRIEVER_NAME = "NumpyExactRetriever"
+
+# (chunk_pk, similarity score, 1-based rank)
+RetrievedTuple = Tuple[int, float, int]
+# Full ranking of a ChunkSet for one query: (int64 chunk pks, float32 scores) by descending score
+Ranking = Tuple[np.ndarray, np.ndarray]
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalizes each row (float32), so that a dot product is the cosine similarity."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k highest scores, sorted by descending score, ties in index order: the first
+    k entries of a stable descending sort, found with a partition and a sort of k items only.
+    """
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    kth_score = -np.partition(-scores, k - 1)[k - 1]
+    above = np.flatnonzero(scores > kth_score)
+    # Of the scores tied with the k-th one, the lowest indices fill the remaining places
+    tied = np.flatnonzero(scores == kth_score)[:k - above.shape[0]]
+    candidates = np.concatenate([above, tied])
+    return candidates[np.lexsort((candidates, -scores[candidates]))]
+
+
+def empty_ranking() -> Ranking:
+    return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+
+def encode_ranking(ranking: Ranking) -> Tuple[bytes, bytes]:
+    """(chunk pks, scores) as raw bytes, for RetrievalSimulation.ranking_chunk_ids / ranking_scores."""
+    chunk_pks, scores = ranking
+    return np.asarray(chunk_pks, dtype=np.int64).tobytes(), np.asarray(scores, dtype=np.float32).tobytes()
+
+
+def top_k_from_ranking(ranking: Ranking, k: int) -> List[RetrievedTuple]:
+    """The first k entries of a full ranking as (chunk_pk, score, rank) tuples."""
+    chunk_pks, scores = ranking
+    return [(int(chunk_pks[i]), float(scores[i]), i + 1) for i in range(min(k, chunk_pks.shape[0]))]
+
+
+class ExactTopKRetriever:
+    """
+    Exact cosine-similarity retriever over one ChunkSet: a normalised float32 matrix of the
+    chunk embeddings, scored against any number of queries with one matrix multiplication.
+    Scores are the same cosine similarities the LlamaIndex in-memory vector store returns; equal
+    scores are ranked in chunk order (LlamaIndex leaves their order to its heap).
+    """
+
+    def __init__(self, chunk_pks: Sequence[int], chunk_embeddings: np.ndarray):
+        self.chunk_pks = np.asarray(chunk_pks, dtype=np.int64)
+        self.matrix = normalize_rows(chunk_embeddings) if len(self.chunk_pks) else np.zeros((0, 0), dtype=np.float32)
+
+    @classmethod
+    def for_chunk_set(cls, chunk_set_id: int, model_name: str) -> 'ExactTopKRetriever':
+        """Builds the retriever of a ChunkSet, taking the chunk vectors from the embedding store."""
+        chunks = chunk_storage.chunk_texts(chunk_set_id)
+        if not chunks:
+            return cls([], np.zeros((0, 0), dtype=np.float32))
+        chunk_pks, texts = zip(*chunks)
+        embeddings = embedding_store.get_embeddings(
+            list(texts), model_name, lambda missing: embedding_registry.embed_texts(model_name, missing)
+        )
+        return cls(chunk_pks, embeddings)
+
+    def __len__(self):
+        return self.chunk_pks.shape[0]
+
+    def score(self, query_embeddings: np.ndarray) -> np.ndarray:
+        """(n_queries, n_chunks) cosine similarities."""
+        return normalize_rows(np.atleast_2d(query_embeddings)) @ self.matrix.T
+
+    def rank(self, query_embeddings: np.ndarray) -> List[Ranking]:
+        """
+        Full ranking of the chunks for each query, by descending cosine similarity (a stable sort:
+        ties keep the chunk order). Its first k entries are the top-k list.
+        """
+        query_embeddings = np.atleast_2d(query_embeddings)
+        if not len(self):
+            return [empty_ranking() for _ in range(query_embeddings.shape[0])]
+        scores = self.score(query_embeddings)
+        order = np.argsort(-scores, axis=1, kind='stable')
+        return [(self.chunk_pks[order[row]], scores[row, order[row]]) for row in range(scores.shape[0])]
+
+    def rank_questions(self, questions: Sequence[str], model_name: str) -> List[Ranking]:
+        """
+        Full rankings of a batch of question texts in one call: their vectors come from the embedding
+        store (embedded once per model) and are all scored with a single matrix multiplication.
+        """
+        if not len(self):
+            return self.rank(np.zeros((len(questions), 0), dtype=np.float32))
+        return self.rank(embedding_store.get_query_embeddings(questions, model_name))
+
+    def retrieve(self, query_embeddings: np.ndarray, k: Union[int, Sequence[int]]) -> List[List[RetrievedTuple]]:
+        """
+        Returns, for each query, its top-k list of (chunk_pk, score, rank) tuples.
+        k can be a single value or one value per query.
+        """
+        query_embeddings = np.atleast_2d(query_embeddings)
+        ks = [k] * query_embeddings.shape[0] if isinstance(k, int) else list(k)
+        if not len(self):
+            return [[] for _ in ks]
+
+        scores = self.score(query_embeddings)
+        results = []
+        for row, k_row in enumerate(ks):
+            indices = top_k_indices(scores[row], k_row)
+            results.append([
+                (int(self.chunk_pks[idx]), float(scores[row, idx]), rank)
+                for rank, idx in enumerate(indices, start=1)
+            ])
+        return results
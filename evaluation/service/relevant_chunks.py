@@ -1,7 +1,23 @@
 # evaluation/services.py
+import hashlib
+import json
+import logging
+from typing import Iterable, List, Sequence, Tuple
+
+import numpy as np
 from django.db import transaction
-from experiments.models import Chunk # Import Chunk
 from evaluation.models import ExperimentChunkAnalysis, RankedRelevantChunk # Importa modelli evaluation
+from evaluation.service import chunk_properties, interval_index
+from experiments.models import Experiment
+
+logger = logging.getLogger(__name__)
+
+
+def annotations_hash(sentence_spans: Iterable[Tuple[int, int]]) -> str:
+    """SHA-256 degli offset delle frasi rilevanti di un esperimento, indipendente dall'ordine."""
+    spans = sorted((int(start), int(end)) for start, end in sentence_spans)
+    return hashlib.sha256(json.dumps(spans, separators=(',', ':')).encode('ascii')).hexdigest()
+
 
 @transaction.atomic # Assicura che tutte le operazioni nel DB avvengano o nessuna
 def initialize_analysis(analysis: ExperimentChunkAnalysis):
@@ -12,84 +28,180 @@ def initialize_analysis(analysis: ExperimentChunkAnalysis):
     3. Crea gli oggetti RankedRelevantChunk iniziali (senza rank o score).
     Restituisce il numero di chunk rilevanti trovati (k_relevant).
     """
-    print(f"Inizializzazione Analisi per Analysis ID: {analysis.id}") # Log di debug
+    logger.debug("Inizializzazione Analisi per Analysis ID: %d", analysis.id)
 
     experiment = analysis.experiment
     chunk_set = analysis.chunk_set
 
-    # Recupera tutte le frasi rilevanti per l'esperimento
-    relevant_sentences = experiment.relevant_sentences.all()
-    if not relevant_sentences.exists():
-        print("Nessuna frase rilevante definita per questo esperimento. k_relevant = 0.")
-        analysis.k_relevant = 0
-        analysis.save(update_fields=['k_relevant'])
+    # Recupera tutte le frasi rilevanti per l'esperimento (solo gli offset servono)
+    sentence_spans = list(experiment.relevant_sentences.values_list('start_char', 'end_char'))
+    # Versione degli input da cui viene calcolata l'analisi (vedi invalidation)
+    analysis.annotations_hash = annotations_hash(sentence_spans)
+    analysis.chunk_set_version = chunk_set.version
+    if not sentence_spans:
+        logger.info("Nessuna frase rilevante definita per questo esperimento. k_relevant = 0.")
+        _set_relevant_chunks(analysis, [])
         # Non creiamo RankedRelevantChunk se non ci sono frasi rilevanti
         return 0
 
-    # Recupera tutti i chunk per questo chunk set
-    all_chunks = chunk_set.chunks.all()
-    if not all_chunks.exists():
-        print("Nessun chunk trovato per questo chunk set. k_relevant = 0.")
-        analysis.k_relevant = 0
-        analysis.save(update_fields=['k_relevant'])
+    # Recupera gli offset di tutti i chunk per questo chunk set
+    chunk_rows = list(chunk_set.chunks.values_list('pk', 'start_char', 'end_char'))
+    if not chunk_rows:
+        logger.info("Nessun chunk trovato per questo chunk set. k_relevant = 0.")
+        _set_relevant_chunks(analysis, [])
         return 0
 
-    relevant_chunk_pks = set() # Usiamo un set per memorizzare i PK dei chunk rilevanti trovati
-
-    # Itera per trovare le sovrapposizioni
-    for chunk in all_chunks:
-        chunk_start = chunk.start_char
-        chunk_end = chunk.end_char
-        is_relevant = False
-        for sentence in relevant_sentences:
-            sent_start = sentence.start_char
-            sent_end = sentence.end_char
-            # Condizione di sovrapposizione: (inizio_A < fine_B) AND (fine_A > inizio_B)
-            if sent_start < chunk_end and sent_end > chunk_start:
-                relevant_chunk_pks.add(chunk.pk)
-                is_relevant = True
-                # Trovata una sovrapposizione per questo chunk, possiamo passare al prossimo chunk
-                break
-        # if is_relevant: # Debug log
-        #     print(f"Chunk ID {chunk.pk} ({chunk_start}-{chunk_end}) è RILEVANTE.")
-        # else:
-        #     print(f"Chunk ID {chunk.pk} ({chunk_start}-{chunk_end}) non è rilevante.")
-
+    # Trova le sovrapposizioni con un'unica scansione ordinata (vedi interval_index):
+    # condizione di sovrapposizione (inizio_A < fine_B) AND (fine_A > inizio_B)
+    chunk_pks, chunk_starts, chunk_ends = zip(*chunk_rows)
+    relevant_chunk_pks, overlap_lengths = interval_index.find_overlaps(
+        sentence_spans, chunk_pks, chunk_starts, chunk_ends
+    )
 
     # Calcola k_relevant
     k_relevant = len(relevant_chunk_pks)
-    print(f"k_relevant calcolato: {k_relevant}")
+    logger.info("k_relevant calcolato: %d", k_relevant)
 
     # Aggiorna l'oggetto analysis nel DB
-    analysis.k_relevant = k_relevant
-    analysis.save()
+    _set_relevant_chunks(analysis, relevant_chunk_pks)
 
-    # Crea gli oggetti RankedRelevantChunk (solo se k_relevant > 0)
-    # Usiamo get_or_create per sicurezza, nel caso questa funzione venga chiamata più volte
-    created_count = 0
+    # Crea gli oggetti RankedRelevantChunk (solo se k_relevant > 0) con un'unica query,
+    # salvando anche la lunghezza della sovrapposizione usata poi per Density(c).
+    # In caso di conflitto (funzione chiamata più volte) si aggiorna solo la sovrapposizione,
+    # lasciando intatti i rank già assegnati.
     if k_relevant > 0:
-        relevant_chunks_queryset = Chunk.objects.filter(pk__in=relevant_chunk_pks)
-        print(f"Creazione di {k_relevant} oggetti RankedRelevantChunk per l'analisi ID: {analysis.id}")
-        for relevant_chunk in relevant_chunks_queryset:
-            ranked_chunk, created = RankedRelevantChunk.objects.get_or_create(
-                analysis=analysis,
-                chunk=relevant_chunk,
+        logger.info("Creazione di %d oggetti RankedRelevantChunk per l'analisi ID: %d", k_relevant, analysis.id)
+        RankedRelevantChunk.objects.bulk_create(
+            [
                 # Non impostiamo rank o score qui, verranno aggiunti dopo
-                defaults={
-                    'ideal_rank': None,
-                    'intrinsic_importance_w': None,
-                    'relevance_density': None,
-                    'effective_relevance_w_prime': None
-                }
-            )
-            if created:
-                created_count += 1
-
-    print(f"Creati {created_count} nuovi oggetti RankedRelevantChunk.")
-
-    # Pulisci eventuali RankedRelevantChunk orfani (se un chunk non è più rilevante?)
-    # Questo è più complesso, per ora assumiamo che la rilevanza non cambi una volta calcolata.
-    # Potremmo aggiungere:
-    # RankedRelevantChunk.objects.filter(analysis=analysis).exclude(chunk_id__in=relevant_chunk_pks).delete()
-
-    return k_relevant
\ No newline at end of file
+                RankedRelevantChunk(
+                    analysis=analysis,
+                    chunk_id=int(chunk_pk),
+                    relevant_overlap_chars=int(overlap),
+                )
+                for chunk_pk, overlap in zip(relevant_chunk_pks, overlap_lengths)
+            ],
+            update_conflicts=True,
+            unique_fields=['analysis', 'chunk'],
+            update_fields=['relevant_overlap_chars'],
+        )
+
+    return k_relevant
+
+
+def _set_relevant_chunks(analysis: ExperimentChunkAnalysis, relevant_chunk_pks) -> None:
+    """
+    Salva k_relevant e le versioni degli input, eliminando i RankedRelevantChunk dei chunk non più
+    rilevanti (annotazioni modificate o chunk rigenerati). Se l'insieme dei chunk rilevanti è cambiato
+    il ranking salvato non è più valido: w, Density e w' vengono azzerati (i rank restano come
+    suggerimento nella pagina di ranking) e l'analisi attende un nuovo ranking.
+    """
+    relevant_chunk_pks = {int(pk) for pk in relevant_chunk_pks}
+    previous_chunk_pks = set(analysis.ranked_relevant_chunks.values_list('chunk_id', flat=True))
+    if previous_chunk_pks - relevant_chunk_pks:
+        analysis.ranked_relevant_chunks.exclude(chunk_id__in=relevant_chunk_pks).delete()
+    if previous_chunk_pks and previous_chunk_pks != relevant_chunk_pks:
+        _reset_properties(analysis)
+    analysis.k_relevant = len(relevant_chunk_pks)
+    analysis.save(update_fields=['k_relevant', 'annotations_hash', 'chunk_set_version'])
+
+
+def _reset_properties(analysis: ExperimentChunkAnalysis) -> None:
+    logger.info("Chunk rilevanti cambiati per l'analisi ID: %d, ranking da rifare.", analysis.id)
+    analysis.ranked_relevant_chunks.update(
+        intrinsic_importance_w=None, relevance_density=None, effective_relevance_w_prime=None
+    )
+
+
+@transaction.atomic
+def update_analysis(analysis: ExperimentChunkAnalysis, sentence_spans: Sequence[Tuple[int, int]],
+                    changed_spans: Sequence[Tuple[int, int]], previous_hash: str) -> bool:
+    """
+    Aggiorna un'analisi dopo una modifica delle frasi rilevanti (sentence_spans: il nuovo insieme
+    completo) ricalcolando solo i chunk che si sovrappongono agli intervalli aggiunti o rimossi
+    (changed_spans): per gli altri chunk rilevanza e sovrapposizione non possono essere cambiate.
+    I chunk toccati sono trovati con un IntervalIndex sugli intervalli modificati, dopo un prefiltro
+    nel DB sull'intervallo che li contiene tutti.
+    Se l'analisi non era allineata alle annotazioni precedenti (previous_hash) o ai chunk attuali,
+    viene reinizializzata completamente. Restituisce True se l'aggiornamento è stato incrementale.
+    """
+    if analysis.annotations_hash != previous_hash or analysis.chunk_set_version != analysis.chunk_set.version:
+        initialize_analysis(analysis)
+        return False
+
+    touched_pks, overlaps_now = _touched_chunks(analysis, sentence_spans, changed_spans)
+    existing = {
+        chunk_id: (pk, overlap)
+        for pk, chunk_id, overlap in analysis.ranked_relevant_chunks.filter(chunk_id__in=touched_pks).values_list(
+            'pk', 'chunk_id', 'relevant_overlap_chars'
+        )
+    }
+    to_delete = [pk for chunk_id, (pk, _) in existing.items() if chunk_id not in overlaps_now]
+    to_create = [
+        RankedRelevantChunk(analysis=analysis, chunk_id=chunk_id, relevant_overlap_chars=overlap)
+        for chunk_id, overlap in overlaps_now.items() if chunk_id not in existing
+    ]
+    to_update = [
+        RankedRelevantChunk(pk=pk, relevant_overlap_chars=overlaps_now[chunk_id])
+        for chunk_id, (pk, overlap) in existing.items()
+        if chunk_id in overlaps_now and overlap != overlaps_now[chunk_id]
+    ]
+    if to_delete:
+        RankedRelevantChunk.objects.filter(pk__in=to_delete).delete()
+    if to_create:
+        RankedRelevantChunk.objects.bulk_create(to_create)
+    if to_update:
+        RankedRelevantChunk.objects.bulk_update(to_update, ['relevant_overlap_chars'])
+    logger.info("Analisi ID %d: %d chunk toccati, %d nuovi rilevanti, %d non più rilevanti, "
+                "%d sovrapposizioni aggiornate.", analysis.id, len(touched_pks), len(to_create), len(to_delete),
+                len(to_update))
+
+    analysis.k_relevant += len(to_create) - len(to_delete)
+    analysis.annotations_hash = annotations_hash(sentence_spans)
+    analysis.save(update_fields=['k_relevant', 'annotations_hash'])
+
+    if to_create or to_delete:
+        _reset_properties(analysis)
+    elif to_update and analysis.ranked_relevant_chunks.filter(ideal_rank__isnull=False).exists():
+        # Stesso insieme di chunk rilevanti: il ranking resta valido, cambia solo Density(c)
+        chunk_properties.calculate_chunk_properties(analysis)
+    return True
+
+
+def _touched_chunks(analysis: ExperimentChunkAnalysis, sentence_spans: Sequence[Tuple[int, int]],
+                    changed_spans: Sequence[Tuple[int, int]]) -> Tuple[List[int], dict]:
+    """
+    (pk dei chunk che si sovrappongono agli intervalli modificati, {pk: sovrapposizione con le frasi
+    rilevanti attuali} per quelli tra loro che sono rilevanti).
+    """
+    if not changed_spans:
+        return [], {}
+    changed_starts, changed_ends = zip(*changed_spans)
+    chunk_rows = list(analysis.chunk_set.chunks.filter(
+        start_char__lt=max(changed_ends), end_char__gt=min(changed_starts)
+    ).values_list('pk', 'start_char', 'end_char'))
+    if not chunk_rows:
+        return [], {}
+
+    chunk_pks, chunk_starts, chunk_ends = (np.asarray(column, dtype=np.int64) for column in zip(*chunk_rows))
+    touched = interval_index.IntervalIndex(changed_starts, changed_ends).overlap_counts(chunk_starts, chunk_ends) > 0
+    chunk_pks, chunk_starts, chunk_ends = chunk_pks[touched], chunk_starts[touched], chunk_ends[touched]
+    relevant_pks, overlaps = interval_index.find_overlaps(sentence_spans, chunk_pks, chunk_starts, chunk_ends)
+    return chunk_pks.tolist(), {int(pk): int(overlap) for pk, overlap in zip(relevant_pks, overlaps)}
+
+
+def update_experiment_analyses(experiment: Experiment, changed_spans: Sequence[Tuple[int, int]],
+                               previous_hash: str) -> Tuple[int, int]:
+    """
+    Aggiorna le analisi inizializzate dell'esperimento dopo un salvataggio delle annotazioni.
+    Restituisce (analisi aggiornate in modo incrementale, analisi reinizializzate).
+    """
+    sentence_spans = list(experiment.relevant_sentences.values_list('start_char', 'end_char'))
+    n_incremental = n_full = 0
+    analyses = ExperimentChunkAnalysis.objects.filter(experiment=experiment, k_relevant__isnull=False)
+    for analysis in analyses.select_related('experiment', 'chunk_set'):
+        if update_analysis(analysis, sentence_spans, changed_spans, previous_hash):
+            n_incremental += 1
+        else:
+            n_full += 1
+    return n_incremental, n_full
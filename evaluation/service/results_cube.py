@@ -0,0 +1,169 @@
+# evaluation/service/results_cube.py
+import logging
+import math
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+
+from evaluation.models import ExperimentChunkAnalysis, LatestNdcgScore, RetrievalSimulation
+from experiments.models import ChunkingStrategy, Experiment
+
+logger = logging.getLogger(__name__)
+
+
+def cube_model_name() -> str:
+    """
+    The embedding model whose simulations the cube holds (GLOBAL_EMBED_MODEL_NAME on PyTorch): the
+    cells are keyed by (experiment, strategy) only, so runs with other models or backends must not
+    replace the main result.
+    """
+    # Imported here: retrieval_simulation writes to this cube
+    from evaluation.service import retrieval_simulation
+    return retrieval_simulation.GLOBAL_EMBED_MODEL_NAME
+
+
+def record_simulation_score(simulation: RetrievalSimulation) -> None:
+    """
+    Stores the simulation's NDCG as the latest score of its (experiment, strategy) cell,
+    unless a more recent simulation already owns the cell or it was run with another model.
+    """
+    if simulation.embedding_model_name != cube_model_name():
+        return
+    analysis = simulation.analysis
+    experiment_id = analysis.experiment_id
+    strategy_id = analysis.chunk_set.strategy_id
+
+    current = LatestNdcgScore.objects.filter(experiment_id=experiment_id, strategy_id=strategy_id).first()
+    if current is not None and (current.ran_at, current.simulation_id) > (simulation.ran_at, simulation.pk):
+        return  # An older simulation was re-scored: the cell keeps the newer one
+
+    LatestNdcgScore.objects.update_or_create(
+        experiment_id=experiment_id,
+        strategy_id=strategy_id,
+        defaults={'simulation': simulation, 'ndcg_score': simulation.ndcg_score, 'ran_at': simulation.ran_at},
+    )
+
+
+def record_simulation_scores(simulations: Sequence[RetrievalSimulation]) -> None:
+    """
+    record_simulation_score for many simulations (loaded with analysis__chunk_set): the current
+    cells are read with one query and written back with one bulk_update and one bulk_create.
+    """
+    model_name = cube_model_name()
+    newest = {}
+    for simulation in simulations:
+        if simulation.embedding_model_name != model_name:
+            continue
+        key = (simulation.analysis.experiment_id, simulation.analysis.chunk_set.strategy_id)
+        if key not in newest or (newest[key].ran_at, newest[key].pk) < (simulation.ran_at, simulation.pk):
+            newest[key] = simulation
+
+    current = {
+        (cell.experiment_id, cell.strategy_id): cell
+        for cell in LatestNdcgScore.objects.filter(experiment_id__in={key[0] for key in newest})
+    }
+    to_update, to_create = [], []
+    for (experiment_id, strategy_id), simulation in newest.items():
+        cell = current.get((experiment_id, strategy_id))
+        if cell is None:
+            to_create.append(LatestNdcgScore(experiment_id=experiment_id, strategy_id=strategy_id, simulation=simulation,
+                                             ndcg_score=simulation.ndcg_score, ran_at=simulation.ran_at))
+        elif (cell.ran_at, cell.simulation_id) <= (simulation.ran_at, simulation.pk):
+            cell.simulation, cell.ndcg_score, cell.ran_at = simulation, simulation.ndcg_score, simulation.ran_at
+            to_update.append(cell)
+        # else: an older simulation was re-scored, the cell keeps the newer one
+    LatestNdcgScore.objects.bulk_update(to_update, ['simulation', 'ndcg_score', 'ran_at'])
+    LatestNdcgScore.objects.bulk_create(to_create)
+
+
+def _latest_cells(simulations) -> Dict[Tuple[int, int], LatestNdcgScore]:
+    """
+    Cells pointing at the most recent of the given simulations of the cube model for each
+    (experiment, strategy), scored or not: an unscored latest simulation leaves the cell empty, as on the results pages
+    before the cube, which read the latest simulation of each analysis.
+    """
+    cells = {}
+    for simulation in simulations.filter(embedding_model_name=cube_model_name()).select_related(
+        'analysis__chunk_set'
+    ).order_by('ran_at', 'pk'):
+        key = (simulation.analysis.experiment_id, simulation.analysis.chunk_set.strategy_id)
+        cells[key] = LatestNdcgScore(  # Ascending order: the last one is the latest
+            experiment_id=key[0],
+            strategy_id=key[1],
+            simulation=simulation,
+            ndcg_score=simulation.ndcg_score,
+            ran_at=simulation.ran_at,
+        )
+    return cells
+
+
+@transaction.atomic
+def refresh_cells(analysis_ids: Iterable[int]) -> int:
+    """
+    Points the cells of the given analyses at their latest remaining simulation, e.g. after some
+    of their simulations were deleted; cells of analyses left without simulations are removed.
+    Returns the number of cells written.
+    """
+    analysis_ids = set(analysis_ids)
+    keys = list(ExperimentChunkAnalysis.objects.filter(pk__in=analysis_ids).values_list(
+        'experiment_id', 'chunk_set__strategy_id'
+    ))
+    if not keys:
+        return 0
+    cells = _latest_cells(RetrievalSimulation.objects.filter(analysis_id__in=analysis_ids))
+    stale = Q()
+    for experiment_id, strategy_id in keys:
+        stale |= Q(experiment_id=experiment_id, strategy_id=strategy_id)
+    LatestNdcgScore.objects.filter(stale).delete()
+    LatestNdcgScore.objects.bulk_create(cells.values())
+    return len(cells)
+
+
+@transaction.atomic
+def rebuild_results_cube() -> int:
+    """
+    Recomputes the whole cube from the simulations table (latest simulation per analysis).
+    Returns the number of cells written.
+    """
+    cells = _latest_cells(RetrievalSimulation.objects.all())
+    LatestNdcgScore.objects.all().delete()
+    LatestNdcgScore.objects.bulk_create(cells.values())
+    logger.info("ResultsCube: %d cells rebuilt.", len(cells))
+    return len(cells)
+
+
+def get_ndcg_matrix(experiments=None,
+                    k: Optional[int] = None) -> Tuple[List[Experiment], List[ChunkingStrategy], np.ndarray]:
+    """
+    Returns (experiments, strategies, matrix), where matrix[i, j] is the latest NDCG of
+    experiment i with strategy j, NaN when missing or invalid (None/NaN/Inf).
+    With k, the cells hold NDCG@k of the same simulations, computed from their stored full
+    rankings (NaN for simulations run before rankings were stored).
+    Strategies are ordered by name; experiments by the given queryset (default: by pk).
+    """
+    experiments = list(experiments if experiments is not None else Experiment.objects.order_by('pk'))
+    strategies = list(ChunkingStrategy.objects.order_by('name'))
+    experiment_rows = {experiment.pk: i for i, experiment in enumerate(experiments)}
+    strategy_columns = {strategy.pk: j for j, strategy in enumerate(strategies)}
+
+    matrix = np.full((len(experiments), len(strategies)), np.nan)
+    cells = LatestNdcgScore.objects.values_list('experiment_id', 'strategy_id', 'ndcg_score', 'simulation_id')
+    if k is not None:
+        # Imported here: ndcg_curve builds on the simulation services, which write to this cube
+        from evaluation.service import ndcg_curve
+        cells = list(cells)
+        at_k = ndcg_curve.ndcg_at_k(
+            RetrievalSimulation.objects.filter(pk__in=[cell[3] for cell in cells]).only(
+                'pk', 'analysis_id', 'ranking_chunk_ids', 'ranking_scores'
+            ), k
+        )
+        cells = [(experiment_id, strategy_id, at_k.get(simulation_id), simulation_id)
+                 for experiment_id, strategy_id, _, simulation_id in cells]
+    for experiment_id, strategy_id, ndcg_score, _ in cells:
+        row = experiment_rows.get(experiment_id)
+        if row is None or ndcg_score is None or math.isnan(ndcg_score) or math.isinf(ndcg_score):
+            continue
+        matrix[row, strategy_columns[strategy_id]] = ndcg_score
+    return experiments, strategies, matrix
@@ -1,246 +1,361 @@
 # experiments/service/retrieval_simulation.py
+import hashlib
+import json
+import logging
 import math
+from typing import List, Optional, Sequence, Tuple
 
 from django.db import transaction
 
-# LlamaIndex Imports
-from llama_index.core import VectorStoreIndex, QueryBundle, Settings  # Import Settings
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.core.schema import TextNode
-
 # Import your Django models
-from evaluation.models import ExperimentChunkAnalysis, RetrievedChunk, RetrievalSimulation
+from evaluation.models import ExperimentChunkAnalysis, RankedRelevantChunk, RetrievedChunk, RetrievalSimulation
 from evaluation.service.relevant_chunks import initialize_analysis
+from evaluation.service import embedding_store, numpy_retriever, results_cube
+from experiments.service import embedding_registry
+from experiments.service.instrumentation import StageTimings, count_tokens
 
-GLOBAL_EMBED_MODEL_NAME = "BAAI/bge-small-en-v1.5"
-_embed_model = None
+logger = logging.getLogger(__name__)
 
+GLOBAL_EMBED_MODEL_NAME = "BAAI/bge-small-en-v1.5"
+# Embedding models selectable per simulation in the UI. The ONNX backends of the registry
+# ('@onnx', '@onnx-int8') are left out until check_embedding_parity has confirmed on the real
+# model that they give the same NDCG; they can still be run with `run_all_simulations --embedding-model`
+EMBED_MODEL_NAMES = [GLOBAL_EMBED_MODEL_NAME]
 
-def get_global_embed_model():
-    """Loads and returns the embedding model, memoizing it for reuse."""
-    global _embed_model
-    if _embed_model is None:
-        print(f"Loading embedding model for retrieval: {GLOBAL_EMBED_MODEL_NAME}...")
-        try:
-            _embed_model = HuggingFaceEmbedding(model_name=GLOBAL_EMBED_MODEL_NAME)
-            print("Embedding model loaded for retrieval.")
-        except Exception as e:
-            print(f"CRITICAL ERROR: Could not load embedding model '{GLOBAL_EMBED_MODEL_NAME}': {e}")
-            raise ValueError(f"Could not load embedding model: {GLOBAL_EMBED_MODEL_NAME}. Details: {e}") from e
-    return _embed_model
+# Retrievers selectable through RetrievalSimulation.retriever_name
+LLAMA_INDEX_RETRIEVER_NAME = "LlamaIndexVectorRetriever"
+RETRIEVER_NAMES = [LLAMA_INDEX_RETRIEVER_NAME, numpy_retriever.RETRIEVER_NAME]
 
 
-@transaction.atomic
-def run_retrieval_simulation(analysis: ExperimentChunkAnalysis):
-    """
-    Executes a retrieval simulation using LlamaIndex Vector Retriever for a given ExperimentChunkAnalysis.
-    Creates a RetrievalSimulation object and its associated RetrievedChunk objects.
-    Returns the created RetrievalSimulation object.
-    """
-    print(f"Starting REAL retrieval simulation for Analysis ID: {analysis.id}")
+def get_global_embed_model(embedding_model_name: str = GLOBAL_EMBED_MODEL_NAME):
+    """Returns the shared retrieval embedding model (default: PyTorch bge-small) from the process-wide registry."""
+    return embedding_registry.get_embed_model(embedding_model_name)
 
-    # Set the retriever and embedding model names for the simulation record
-    retriever_name = "LlamaIndexVectorRetriever"
-    embedding_model_name = GLOBAL_EMBED_MODEL_NAME  # Use the global model name
-
-    # 1. Determine k_retrieved (as before)
-    if analysis.k_relevant is None:
-        # If k_relevant is not calculated, call the function to initialize it
-        print("k_relevant is not calculated for this analysis. Calling initialize_analysis...")
-        initialize_analysis(analysis)  # Initialize k_relevant based on relevant sentences
-        # Reload the analysis object to get the updated k_relevant value
-        analysis = ExperimentChunkAnalysis.objects.get(pk=analysis.pk)
-        print(f"k_relevant re-calculated: {analysis.k_relevant}")
 
-    k_retrieved_target = max(10, 2 * analysis.k_relevant) if analysis.k_relevant > 0 else 10
-    print(f"Target k_retrieved: {k_retrieved_target}")
+def get_k_retrieved_target(k_relevant: int) -> int:
+    """Number of chunks to retrieve for an analysis: twice the relevant ones, at least 10."""
+    return max(10, 2 * k_relevant) if k_relevant > 0 else 10
 
-    # 2. Get all chunks from the chunk_set associated with the analysis
-    # Convert them to LlamaIndex TextNodes for indexing
-    all_chunks_in_set = analysis.chunk_set.chunks.all().order_by('chunk_index')
 
-    if not all_chunks_in_set:
-        print("No chunks in the chunk_set. Cannot perform simulation.")
-        simulation = RetrievalSimulation.objects.create(
-            analysis=analysis,
-            retriever_name=retriever_name,
-            embedding_model_name=embedding_model_name,
-            k_retrieved=0,
-            rdsg_score=None
-        )
-        return simulation
+def _build_text_nodes(all_chunks_in_set, chunk_embeddings):
+    """LlamaIndex TextNodes of the chunks, carrying their precomputed embeddings."""
+    from llama_index.core.schema import TextNode
 
-    # Convert your Django Chunk objects into LlamaIndex TextNodes
     llama_nodes = []
-    for chunk_obj in all_chunks_in_set:
+    for chunk_obj, chunk_embedding in zip(all_chunks_in_set, chunk_embeddings):
+        metadata = {
+            'chunk_pk': chunk_obj.pk,
+            'chunk_index': chunk_obj.chunk_index,
+            'start_char': chunk_obj.start_char,
+            'end_char': chunk_obj.end_char,
+            # You can add other useful metadata here for the retriever or debugging
+        }
         # It's CRUCIAL that the LlamaIndex node ID is the PK of your Django Chunk object.
         # This allows mapping retriever results back to your original Chunk objects.
+        # The precomputed embedding makes VectorStoreIndex skip the embedding step;
+        # metadata is excluded so the embedded content is the chunk text alone.
         llama_nodes.append(TextNode(
             text=chunk_obj.text,
             id_=str(chunk_obj.pk),
-            metadata={
-                'chunk_pk': chunk_obj.pk,
-                'chunk_index': chunk_obj.chunk_index,
-                'start_char': chunk_obj.start_char,
-                'end_char': chunk_obj.end_char,
-                # You can add other useful metadata here for the retriever or debugging
-            }
+            embedding=chunk_embedding.tolist(),
+            metadata=metadata,
+            excluded_embed_metadata_keys=list(metadata.keys()),
         ))
+    return llama_nodes
 
-    # 3. Initialize the embedding model and configure LlamaIndex global settings
-    embed_model = get_global_embed_model()
 
-    # Configure LlamaIndex global settings using Settings
-    print(f"Configuring LlamaIndex global settings with embed_model: {GLOBAL_EMBED_MODEL_NAME}...")
-    Settings.embed_model = embed_model
-    Settings.llm = None  # Set LLM to None as it's not needed for just retrieval embedding operations
-    print("LlamaIndex global settings configured.")
+def _retrieve_with_llama_index(all_chunks_in_set, chunk_embeddings, query_text: str, query_embedding, k: int,
+                               timings: StageTimings, embedding_model_name: str = GLOBAL_EMBED_MODEL_NAME):
+    """
+    Retrieves the top-k chunks with an in-memory LlamaIndex VectorStoreIndex, for a query whose
+    embedding is already known. Returns a list of (chunk_pk, score, rank) tuples.
+    """
+    # LlamaIndex is imported only when this retriever is used (slow import, not needed at startup)
+    from llama_index.core import VectorStoreIndex, QueryBundle
 
-    # 4. Create an in-memory VectorStoreIndex
-    # The index will automatically use the embed_model configured in Settings.
-    print("Creating VectorStoreIndex with chunks...")
-    index = VectorStoreIndex(nodes=llama_nodes)
-    print("VectorStoreIndex created.")
+    # Convert your Django Chunk objects into LlamaIndex TextNodes
+    with timings.stage('node_build'):
+        llama_nodes = _build_text_nodes(all_chunks_in_set, chunk_embeddings)
 
-    # 5. Get the retriever
-    # similarity_top_k determines how many top similar chunks to retrieve.
-    retriever = index.as_retriever(similarity_top_k=k_retrieved_target)
-    print(f"Retriever created with top_k={k_retrieved_target}.")
+    # Create an in-memory VectorStoreIndex
+    # Nodes already carry their embeddings; the model passed here only embeds the query.
+    # No process-wide Settings are touched, so concurrent runs do not interfere.
+    with timings.stage('index_build'):
+        index = VectorStoreIndex(nodes=llama_nodes, embed_model=get_global_embed_model(embedding_model_name))
 
-    # 6. Execute the query
-    query_text = analysis.experiment.question.text  # The question text from the experiment
-    print(f"Executing query: '{query_text[:50]}...'")
-
-    # QueryBundle encapsulates the query string for LlamaIndex
-    query_bundle = QueryBundle(query_str=query_text)
-
-    # The retriever returns a list of NodeWithScore objects
-    retrieved_results = retriever.retrieve(query_bundle)
-    print(f"Retriever returned {len(retrieved_results)} results.")
-
-    # 7. Process the retriever results
-    retrieved_chunks_data = []  # List of {'chunk': Chunk, 'score': float, 'rank': int}
-
-    # Map Django Chunk PKs to their objects for quick lookup
-    chunk_pk_to_obj_map = {str(c.pk): c for c in all_chunks_in_set}
-
-    for i, node_with_score in enumerate(retrieved_results):
-        node = node_with_score.node
-        score = node_with_score.score
-
-        # Retrieve the original Django Chunk object using the PK stored in node.id_
-        original_chunk_pk = node.id_
-        original_chunk_obj = chunk_pk_to_obj_map.get(original_chunk_pk)
-
-        if original_chunk_obj:
-            retrieved_chunks_data.append({
-                'chunk': original_chunk_obj,
-                'score': score,
-                'rank': i + 1  # Rank 1-based
-            })
-        else:
-            print(
-                f"WARN: Chunk with PK {original_chunk_pk} from retriever results not found in the original chunk_set.")
-
-    # 8. Create the RetrievalSimulation object in the DB
-    simulation = RetrievalSimulation.objects.create(
-        analysis=analysis,
-        retriever_name=retriever_name,
-        embedding_model_name=embedding_model_name,
-        k_retrieved=len(retrieved_chunks_data)  # Actual number of chunks retrieved
-        # rdsg_score will be calculated in a subsequent step
+        # similarity_top_k determines how many top similar chunks to retrieve.
+        retriever = index.as_retriever(similarity_top_k=k)
+
+    # QueryBundle encapsulates the query string for LlamaIndex; with its embedding set the
+    # retriever does not embed the query again. It returns a list of NodeWithScore objects
+    with timings.stage('query'):
+        retrieved_results = retriever.retrieve(QueryBundle(query_str=query_text, embedding=query_embedding.tolist()))
+    return [
+        (int(node_with_score.node.id_), node_with_score.score, i + 1)
+        for i, node_with_score in enumerate(retrieved_results)
+    ]
+
+
+def new_simulation_timings(analysis: ExperimentChunkAnalysis, retriever_name: str) -> StageTimings:
+    """Empty stage timings for one simulation of the analysis."""
+    return StageTimings(f"Simulation of analysis {analysis.pk} ({retriever_name})")
+
+
+def retrieve_for_analysis(analysis: ExperimentChunkAnalysis, retriever_name: str = LLAMA_INDEX_RETRIEVER_NAME,
+                          embedding_model_name: str = GLOBAL_EMBED_MODEL_NAME,
+                          timings: Optional[StageTimings] = None
+                          ) -> Tuple[List[numpy_retriever.RetrievedTuple], numpy_retriever.Ranking]:
+    """
+    Compute phase of a simulation: reads the chunks of the analysis, embeds them (through the
+    embedding store) and the question, runs the selected retriever and ranks every chunk by
+    cosine similarity (exact, with NumPy), so NDCG@k can later be computed for any k.
+    No transaction is held meanwhile, so other requests can keep writing to the DB.
+    Stage durations and item counts are added to timings, when given.
+    Returns the list of (chunk_pk, score, rank) tuples and the full ranking.
+    """
+    if timings is None:
+        timings = new_simulation_timings(analysis, retriever_name)
+    k_retrieved_target = get_k_retrieved_target(analysis.k_relevant)
+    logger.info("Target k_retrieved: %d", k_retrieved_target)
+
+    # Snapshot of the chunks of the chunk_set associated with the analysis
+    with timings.stage('node_build'):
+        all_chunks_in_set = list(analysis.chunk_set.chunks.all().order_by('chunk_index'))
+    if not all_chunks_in_set:
+        logger.warning("No chunks in the chunk_set of analysis %d. Cannot perform simulation.", analysis.pk)
+        timings.count(chunks=0, tokens=0, k_retrieved=0)
+        return [], numpy_retriever.empty_ranking()
+    timings.count(
+        chunks=len(all_chunks_in_set),
+        tokens=sum(count_tokens(chunk_obj.text) for chunk_obj in all_chunks_in_set),
     )
-    print(f"Created RetrievalSimulation ID: {simulation.id}.")
-
-    # 9. Bulk create the RetrievedChunk objects
-    retrieved_chunk_objects_to_create = []
-    for data in retrieved_chunks_data:
-        retrieved_chunk_objects_to_create.append(
-            RetrievedChunk(
-                simulation=simulation,
-                chunk=data['chunk'],
-                retrieved_rank=data['rank'],
-                similarity_score_s=data['score']
-            )
+
+    # Both retrievers embed the question with the shared model: load it (once per process) up front
+    with timings.stage('model_load'):
+        embedding_registry.get_embed_model(embedding_model_name)
+
+    # Chunk vectors come from the content-addressed store: only texts never embedded
+    # with this model before are sent to the (shared) embedding model.
+    with timings.stage('embedding'):
+        chunk_embeddings = embedding_store.get_embeddings(
+            [chunk_obj.text for chunk_obj in all_chunks_in_set],
+            embedding_model_name,
+            lambda texts: embedding_registry.embed_texts(embedding_model_name, texts, timings=timings),
         )
 
-    if retrieved_chunk_objects_to_create:
-        RetrievedChunk.objects.bulk_create(retrieved_chunk_objects_to_create)
-        print(
-            f"Created {len(retrieved_chunk_objects_to_create)} RetrievedChunk objects for simulation ID: {simulation.id}.")
+    query_text = analysis.experiment.question.text  # The question text from the experiment
+    logger.info("Executing query with %s: '%s...'", retriever_name, query_text[:50])
+    # The question vector is stored too: it is embedded once per model, not once per ChunkSet and run
+    with timings.stage('query'):
+        query_embedding = embedding_store.get_query_embeddings([query_text], embedding_model_name)[0]
+    if retriever_name not in RETRIEVER_NAMES:
+        raise ValueError(f"Unknown retriever '{retriever_name}'. Available: {', '.join(RETRIEVER_NAMES)}")
+
+    with timings.stage('index_build'):
+        exact_retriever = numpy_retriever.ExactTopKRetriever([c.pk for c in all_chunks_in_set], chunk_embeddings)
+    with timings.stage('query'):
+        ranking = exact_retriever.rank(query_embedding)[0]
+
+    if retriever_name == LLAMA_INDEX_RETRIEVER_NAME:
+        retrieved_results = _retrieve_with_llama_index(
+            all_chunks_in_set, chunk_embeddings, query_text, query_embedding, k_retrieved_target, timings,
+            embedding_model_name,
+        )
     else:
-        print("No RetrievedChunk objects to create.")
+        # The exact top-k is the head of the full ranking
+        retrieved_results = numpy_retriever.top_k_from_ranking(ranking, k_retrieved_target)
+    timings.count(k_retrieved=len(retrieved_results))
+    logger.info("Retriever returned %d results.", len(retrieved_results))
+    return retrieved_results, ranking
 
-    return simulation
 
+def get_ranked_relevant_snapshot(analysis_id: int) -> List[Tuple[int, float, float]]:
+    """(chunk_id, w, w') of the ranked relevant chunks with w' computed, ordered by ideal rank."""
+    return list(RankedRelevantChunk.objects.filter(
+        analysis_id=analysis_id, ideal_rank__isnull=False, effective_relevance_w_prime__isnull=False
+    ).order_by('ideal_rank').values_list('chunk_id', 'intrinsic_importance_w', 'effective_relevance_w_prime'))
 
-@transaction.atomic
-def calculate_rdsg_and_ndcg(simulation: RetrievalSimulation): # Renamed function
+
+def inputs_hash(question_text: str, k_relevant: Optional[int], chunk_set_version: Optional[int],
+                ranked_relevant: Sequence[Tuple[int, float, float]]) -> str:
     """
-    Calculates the RDSG, Ideal RDSG, and NDCG scores for a given RetrievalSimulation.
-    Updates and saves simulation.rdsg_score, simulation.ideal_rdsg_score, and simulation.ndcg_score.
+    SHA-256 of everything a simulation score depends on besides the embedding model: the question,
+    k_relevant (which sets k_retrieved), the version of the chunks and the (chunk_id, w, w') snapshot.
     """
-    print(f"Calculating RDSG and NDCG for Simulation ID: {simulation.id}")
+    payload = {
+        'question': question_text,
+        'k_relevant': k_relevant,
+        'chunk_set_version': chunk_set_version,
+        'ranked_relevant': [[chunk_id, w, w_prime] for chunk_id, w, w_prime in ranked_relevant],
+    }
+    return hashlib.sha256(json.dumps(payload, separators=(',', ':')).encode('utf-8')).hexdigest()
+
 
-    retrieved_chunks = simulation.retrieved_chunks.select_related('chunk').order_by('retrieved_rank')
-    analysis = simulation.analysis
+def analysis_inputs_hash(analysis: ExperimentChunkAnalysis, ranked_relevant: Sequence[Tuple[int, float, float]]) -> str:
+    """inputs_hash of a simulation of the analysis scored on the given snapshot."""
+    return inputs_hash(analysis.experiment.question.text, analysis.k_relevant, analysis.chunk_set.version,
+                       ranked_relevant)
 
-    # Fetch all RankedRelevantChunk objects for the analysis, ordered by ideal_rank
-    ranked_relevant_chunks_qs = analysis.ranked_relevant_chunks.select_related('chunk').filter(
-        ideal_rank__isnull=False, effective_relevance_w_prime__isnull=False
-    ).order_by('ideal_rank')
 
-    # Create a map for effective relevance (w') for quick lookup by chunk_id
-    w_prime_map = {rrc.chunk_id: rrc.effective_relevance_w_prime for rrc in ranked_relevant_chunks_qs}
+def compute_rdsg_and_ndcg(retrieved_results: Sequence[numpy_retriever.RetrievedTuple],
+                          ranked_relevant: Sequence[Tuple[int, float, float]]) -> Tuple[float, float, float]:
+    """
+    Pure computation of (RDSG, Ideal RDSG, NDCG) from the retrieved (chunk_pk, score, rank)
+    tuples and the (chunk_id, w, w') snapshot of the ranked relevant chunks.
+    """
+    # Map of effective relevance (w') for quick lookup by chunk_id
+    w_prime_map = {chunk_id: w_prime for chunk_id, _, w_prime in ranked_relevant}
 
     # --- Calculate RDSG ---
     rdsg_sum = 0.0
-    if not retrieved_chunks.exists():
-        print("No chunks retrieved in this simulation. RDSG = 0.")
-        rdsg_sum = 0.0
-    else:
-        for retrieved_chunk_item in retrieved_chunks:
-            chunk_id = retrieved_chunk_item.chunk_id
-            retrieved_rank_i = retrieved_chunk_item.retrieved_rank
-            similarity_score_s_i = retrieved_chunk_item.similarity_score_s
-
-            w_prime_c_i = w_prime_map.get(chunk_id, 0.0) # 0 if not relevant or w' not calculated
+    if not retrieved_results:
+        logger.info("No chunks retrieved in this simulation. RDSG = 0.")
+    for chunk_id, similarity_score_s_i, retrieved_rank_i in retrieved_results:
+        w_prime_c_i = w_prime_map.get(chunk_id, 0.0)  # 0 if not relevant or w' not calculated
 
-            denominator = math.log2(retrieved_rank_i + 1)
-            term_value = (w_prime_c_i * similarity_score_s_i) / denominator if denominator > 0 else 0.0
-            rdsg_sum += term_value
-            # print(f"  RDSG Term: Rank {retrieved_rank_i}, ChunkID {chunk_id}, w'={w_prime_c_i:.3f}, s={similarity_score_s_i:.3f}, term={term_value:.3f}")
+        denominator = math.log2(retrieved_rank_i + 1)
+        rdsg_sum += (w_prime_c_i * similarity_score_s_i) / denominator if denominator > 0 else 0.0
 
     # --- Calculate Ideal RDSG ---
     ideal_rdsg_sum = 0.0
-    if not ranked_relevant_chunks_qs.exists():
-        print("No ranked relevant chunks for ideal RDSG calculation. Ideal RDSG = 0.")
-        ideal_rdsg_sum = 0.0
-    else:
-        # We use enumerate for the ideal rank (i) from 1, based on the ordering
-        for idx, rrc_item in enumerate(ranked_relevant_chunks_qs):
-            ideal_rank_i = idx + 1 # Ideal rank is 1-based, matches (i) in the formula
-            ideal_w_c_i = rrc_item.intrinsic_importance_w
-
-            ideal_denominator = math.log2(ideal_rank_i + 1)
-            ideal_term_value = (ideal_w_c_i * 1.0) / ideal_denominator if ideal_denominator > 0 else 0.0
-            ideal_rdsg_sum += ideal_term_value
+    if not ranked_relevant:
+        logger.info("No ranked relevant chunks for ideal RDSG calculation. Ideal RDSG = 0.")
+    # Ideal rank (i) is 1-based and follows the ideal_rank ordering
+    for ideal_rank_i, (_, ideal_w_c_i, _) in enumerate(ranked_relevant, start=1):
+        ideal_denominator = math.log2(ideal_rank_i + 1)
+        ideal_rdsg_sum += (ideal_w_c_i * 1.0) / ideal_denominator if ideal_denominator > 0 else 0.0
 
     # --- Calculate NDCG ---
     ndcg_score = 0.0
     if ideal_rdsg_sum > 0:
         ndcg_score = rdsg_sum / ideal_rdsg_sum
     else:
-        print("Ideal RDSG is zero, NDCG cannot be calculated (defaulting to 0).")
-        # If ideal_rdsg_sum is 0, it means there are no relevant chunks or their w' values are all 0.
-        # In this case, NDCG is undefined or 0.
+        # If ideal_rdsg_sum is 0, there are no relevant chunks or their w values are all 0:
+        # NDCG is undefined, 0 by convention.
+        logger.info("Ideal RDSG is zero, NDCG cannot be calculated (defaulting to 0).")
+
+    return rdsg_sum, ideal_rdsg_sum, ndcg_score
+
+
+def save_simulation(analysis: ExperimentChunkAnalysis, retriever_name: str, embedding_model_name: str,
+                    retrieved_results: Sequence[numpy_retriever.RetrievedTuple],
+                    scores: Optional[Tuple[float, float, float]] = None,
+                    timings: Optional[StageTimings] = None, scored_inputs_hash: str = '',
+                    ranking: Optional[numpy_retriever.Ranking] = None) -> RetrievalSimulation:
+    """
+    Write phase of a simulation: one short transaction creating the RetrievalSimulation
+    (with its scores and the inputs_hash they were computed on, when already computed, its full
+    ranking, when given, and its stage timings completed with db_write) and bulk-inserting its
+    RetrievedChunks.
+    """
+    if timings is None:
+        timings = new_simulation_timings(analysis, retriever_name)
+    rdsg_score, ideal_rdsg_score, ndcg_score = scores or (None, None, None)
+    ranking_chunk_ids, ranking_scores = numpy_retriever.encode_ranking(ranking) if ranking is not None else (None, None)
+    with transaction.atomic():
+        with timings.stage('db_write'):
+            simulation = RetrievalSimulation.objects.create(
+                analysis=analysis,
+                retriever_name=retriever_name,
+                embedding_model_name=embedding_model_name,
+                k_retrieved=len(retrieved_results),  # Actual number of chunks retrieved
+                rdsg_score=rdsg_score,
+                ideal_rdsg_score=ideal_rdsg_score,
+                ndcg_score=ndcg_score,
+                inputs_hash=scored_inputs_hash,
+                ranking_chunk_ids=ranking_chunk_ids,
+                ranking_scores=ranking_scores,
+            )
+            RetrievedChunk.objects.bulk_create([
+                RetrievedChunk(
+                    simulation=simulation,
+                    chunk_id=chunk_pk,
+                    retrieved_rank=rank,
+                    similarity_score_s=score,
+                )
+                for chunk_pk, score, rank in retrieved_results
+            ])
+            # Unscored, the new latest simulation empties the cell until calculate_rdsg_and_ndcg runs
+            results_cube.record_simulation_score(simulation)
+        simulation.timings = timings.as_dict()
+        simulation.save(update_fields=['timings'])
+    logger.info("Created RetrievalSimulation ID: %d with %d RetrievedChunk objects.", simulation.id,
+                len(retrieved_results))
+    timings.log_summary()
+    return simulation
+
+
+def _ensure_initialized(analysis: ExperimentChunkAnalysis) -> ExperimentChunkAnalysis:
+    """Computes k_relevant if the analysis was never initialised, returning the reloaded analysis."""
+    if analysis.k_relevant is None:
+        logger.info("k_relevant is not calculated for this analysis. Calling initialize_analysis...")
+        initialize_analysis(analysis)  # Initialize k_relevant based on relevant sentences
+        analysis = ExperimentChunkAnalysis.objects.get(pk=analysis.pk)
+        logger.info("k_relevant re-calculated: %s", analysis.k_relevant)
+    return analysis
+
+
+def run_retrieval_simulation(analysis: ExperimentChunkAnalysis, retriever_name: str = LLAMA_INDEX_RETRIEVER_NAME,
+                             embedding_model_name: str = GLOBAL_EMBED_MODEL_NAME):
+    """
+    Executes a retrieval simulation for a given ExperimentChunkAnalysis, using the retriever
+    named retriever_name (LlamaIndex vector retriever or the exact NumPy retriever) and the
+    embedding model (and backend) embedding_model_name.
+    Creates a RetrievalSimulation object and its associated RetrievedChunk objects; scores
+    are filled in by calculate_rdsg_and_ndcg. Returns the created RetrievalSimulation object.
+    """
+    logger.info("Starting REAL retrieval simulation for Analysis ID: %d", analysis.id)
+    analysis = _ensure_initialized(analysis)
+    timings = new_simulation_timings(analysis, retriever_name)
+    retrieved_results, ranking = retrieve_for_analysis(analysis, retriever_name, embedding_model_name, timings=timings)
+    return save_simulation(analysis, retriever_name, embedding_model_name, retrieved_results, timings=timings,
+                           ranking=ranking)
+
+
+def simulate_and_score(analysis: ExperimentChunkAnalysis, retriever_name: str = LLAMA_INDEX_RETRIEVER_NAME,
+                       embedding_model_name: str = GLOBAL_EMBED_MODEL_NAME):
+    """
+    Retrieval simulation and RDSG/NDCG scoring in two phases: everything is computed on a
+    snapshot first, then the simulation is written, already scored, in a single short transaction.
+    """
+    logger.info("Starting retrieval simulation and scoring for Analysis ID: %d", analysis.id)
+    analysis = _ensure_initialized(analysis)
+    timings = new_simulation_timings(analysis, retriever_name)
+    retrieved_results, ranking = retrieve_for_analysis(analysis, retriever_name, embedding_model_name, timings=timings)
+    with timings.stage('scoring'):
+        ranked_relevant = get_ranked_relevant_snapshot(analysis.pk)
+        scores = compute_rdsg_and_ndcg(retrieved_results, ranked_relevant)
+    simulation = save_simulation(analysis, retriever_name, embedding_model_name, retrieved_results, scores,
+                                 timings, analysis_inputs_hash(analysis, ranked_relevant), ranking)
+    logger.info("NDCG calculated: %.4f", simulation.ndcg_score)
+    return simulation
+
+
+def calculate_rdsg_and_ndcg(simulation: RetrievalSimulation):
+    """
+    Calculates the RDSG, Ideal RDSG, and NDCG scores for a given RetrievalSimulation.
+    Updates and saves simulation.rdsg_score, simulation.ideal_rdsg_score, and simulation.ndcg_score.
+    """
+    logger.info("Calculating RDSG and NDCG for Simulation ID: %d", simulation.id)
+
+    # The scoring stage is added to the timings recorded when the simulation was run
+    timings = StageTimings.from_dict(simulation.timings, f"Scoring of simulation {simulation.pk}")
+    with timings.stage('scoring'):
+        retrieved_results = list(simulation.retrieved_chunks.order_by('retrieved_rank').values_list(
+            'chunk_id', 'similarity_score_s', 'retrieved_rank'
+        ))
+        ranked_relevant = get_ranked_relevant_snapshot(simulation.analysis_id)
+        rdsg_sum, ideal_rdsg_sum, ndcg_score = compute_rdsg_and_ndcg(retrieved_results, ranked_relevant)
 
     # Save results to the simulation object
     simulation.rdsg_score = rdsg_sum
     simulation.ideal_rdsg_score = ideal_rdsg_sum
     simulation.ndcg_score = ndcg_score
-    simulation.save(update_fields=['rdsg_score', 'ideal_rdsg_score', 'ndcg_score'])
-
-    print(f"RDSG calculated: {simulation.rdsg_score:.4f}")
-    print(f"Ideal RDSG calculated: {simulation.ideal_rdsg_score:.4f}")
-    print(f"NDCG calculated: {simulation.ndcg_score:.4f}")
\ No newline at end of file
+    simulation.inputs_hash = analysis_inputs_hash(simulation.analysis, ranked_relevant)
+    simulation.timings = timings.as_dict()
+    with transaction.atomic():
+        simulation.save(update_fields=['rdsg_score', 'ideal_rdsg_score', 'ndcg_score', 'inputs_hash', 'timings'])
+        results_cube.record_simulation_score(simulation)
+
+    logger.info("RDSG calculated: %.4f, Ideal RDSG calculated: %.4f, NDCG calculated: %.4f",
+                simulation.rdsg_score, simulation.ideal_rdsg_score, simulation.ndcg_score)
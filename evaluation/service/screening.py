@@ -0,0 +1,259 @@
+# evaluation/service/screening.py
+"""
+Approximate screening of chunking strategies.
+
+The sentences of each document (cached span segmentation) are embedded once, through the
+content-addressed embedding store. The vector of any chunk, whatever the strategy that
+produced it, is then estimated without encoding it: it is the length-weighted mean of the
+vectors of the sentences it covers, each weighted by the characters it shares with the chunk.
+Retrieval and NDCG are computed on these estimates exactly as in a batch simulation, which
+gives an NDCG estimate for every strategy and question in seconds. Nothing is stored: the
+final RetrievalSimulation keeps embedding the exact chunk texts.
+"""
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from corpus.models import SourceText
+from corpus.service import source_text_service
+from evaluation.models import ExperimentChunkAnalysis, RetrievalSimulation
+from evaluation.service import batch_simulation, embedding_store, numpy_retriever, retrieval_simulation
+from experiments.models import Chunk
+from experiments.service import embedding_registry, sentence_segmentation
+
+logger = logging.getLogger(__name__)
+
+# {(SourceText pk, content hash, model name): SentencePool}
+_pools: Dict[Tuple[int, str, str], 'SentencePool'] = {}
+
+
+class SentencePool:
+    """
+    Sentence vectors of one document, pooled over arbitrary character intervals.
+
+    As in IntervalIndex, the sentences are kept sorted by start and by end with prefix sums,
+    here of their vectors (v) and of start * v / end * v, so that for any position x
+
+        C(x) = sum over sentences of |[start, end) ∩ [0, x)| * v
+
+    is found with a binary search. The pooled numerator of a chunk [a, b) is C(b) - C(a) and
+    its weight is the scalar coverage, for all chunks in one vectorised pass.
+    """
+
+    def __init__(self, spans: np.ndarray, vectors: np.ndarray):
+        spans = np.asarray(spans, dtype=np.int64).reshape(-1, 2)
+        vectors = numpy_retriever.normalize_rows(vectors).astype(np.float64) if len(spans) else np.zeros((0, 0))
+        self.dimension = vectors.shape[1]
+        by_start = np.argsort(spans[:, 0], kind='stable')
+        by_end = np.argsort(spans[:, 1], kind='stable')
+        self.starts = spans[by_start, 0]
+        self.ends = spans[by_end, 1]
+        self._starts_prefix = np.concatenate(([0], np.cumsum(self.starts)))
+        self._ends_prefix = np.concatenate(([0], np.cumsum(self.ends)))
+        self._starts_vectors = self._vector_prefixes(vectors[by_start], self.starts)
+        self._ends_vectors = self._vector_prefixes(vectors[by_end], self.ends)
+
+    def __len__(self):
+        return self.starts.shape[0]
+
+    @staticmethod
+    def _vector_prefixes(vectors: np.ndarray, positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Prefix sums (with a leading zero row) of v and of position * v."""
+        zero_row = np.zeros((1, vectors.shape[1]))
+        return (np.concatenate((zero_row, np.cumsum(vectors, axis=0))),
+                np.concatenate((zero_row, np.cumsum(vectors * positions[:, None], axis=0))))
+
+    def _coverage_before(self, positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(scalar coverage, vector coverage C(x)) of [0, x) for each position x."""
+        n_started = np.searchsorted(self.starts, positions, side='left')
+        n_ended = np.searchsorted(self.ends, positions, side='left')
+        scalar = (n_started * positions - self._starts_prefix[n_started]) \
+            - (n_ended * positions - self._ends_prefix[n_ended])
+        x = positions.astype(np.float64)[:, None]
+        started_v, started_pv = self._starts_vectors
+        ended_v, ended_pv = self._ends_vectors
+        vector = (x * started_v[n_started] - started_pv[n_started]) - (x * ended_v[n_ended] - ended_pv[n_ended])
+        return scalar, vector
+
+    def pool(self, chunk_starts: Sequence[int], chunk_ends: Sequence[int]) -> np.ndarray:
+        """
+        (n_chunks, dim) float32 estimated chunk vectors: the length-weighted mean of the vectors
+        of the covered sentences. Chunks covering no sentence (only whitespace) get a zero vector.
+        """
+        chunk_starts = np.asarray(chunk_starts, dtype=np.int64)
+        chunk_ends = np.asarray(chunk_ends, dtype=np.int64)
+        if not len(self):
+            return np.zeros((chunk_starts.shape[0], self.dimension), dtype=np.float32)
+        weight_end, vector_end = self._coverage_before(chunk_ends)
+        weight_start, vector_start = self._coverage_before(chunk_starts)
+        weights = (weight_end - weight_start).astype(np.float64)[:, None]
+        pooled = np.divide(vector_end - vector_start, weights, out=np.zeros_like(vector_end), where=weights > 0)
+        return pooled.astype(np.float32)
+
+
+def get_sentence_pool(source_text: SourceText, model_name: str) -> SentencePool:
+    """
+    The SentencePool of a document: its sentences are embedded once per model (and stored in the
+    embedding store, so later runs only read them back).
+    """
+    content = source_text_service.get_full_text(source_text)
+    key = (source_text.pk, sentence_segmentation.content_hash(content), model_name)
+    pool = _pools.get(key)
+    if pool is None:
+        spans = sentence_segmentation.get_sentence_spans(content)
+        sentences = [content[start:end] for start, end in spans]
+        vectors = embedding_store.get_embeddings(
+            sentences, model_name, lambda missing: embedding_registry.embed_texts(model_name, missing)
+        )
+        pool = SentencePool(spans, vectors)
+        _pools[key] = pool
+    return pool
+
+
+def estimate_ndcg(analyses: Optional[List[ExperimentChunkAnalysis]] = None,
+                  model_name: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Screening NDCG of the given ready analyses (by default all of them): one row per analysis
+    with its experiment, strategy, chunk set and estimated NDCG.
+    """
+    model_name = model_name or retrieval_simulation.GLOBAL_EMBED_MODEL_NAME
+    if analyses is None:
+        analyses = batch_simulation.find_pending_analyses(force=True)
+    if not analyses:
+        return []
+    analyses = list(ExperimentChunkAnalysis.objects.filter(pk__in=[analysis.pk for analysis in analyses]).select_related(
+        'experiment__question', 'chunk_set__source_text', 'chunk_set__strategy'
+    ).order_by('chunk_set_id', 'pk'))
+
+    # Every question is embedded once, whatever the number of strategies it is screened on
+    questions = list(dict.fromkeys(analysis.experiment.question.text for analysis in analyses))
+    query_matrix = embedding_store.get_query_embeddings(questions, model_name)
+    query_rows = {question: i for i, question in enumerate(questions)}
+    snapshots = batch_simulation.ranked_relevant_snapshots(analyses)
+
+    analyses_by_chunk_set: Dict[int, List[ExperimentChunkAnalysis]] = defaultdict(list)
+    for analysis in analyses:
+        analyses_by_chunk_set[analysis.chunk_set_id].append(analysis)
+    chunk_rows: Dict[int, List[Tuple[int, int, int]]] = defaultdict(list)
+    for chunk_set_id, pk, start_char, end_char in Chunk.objects.filter(
+        chunk_set_id__in=analyses_by_chunk_set
+    ).order_by('chunk_set_id', 'chunk_index').values_list('chunk_set_id', 'pk', 'start_char', 'end_char'):
+        chunk_rows[chunk_set_id].append((pk, start_char, end_char))
+
+    rows = []
+    for chunk_set_id, group in analyses_by_chunk_set.items():
+        chunk_set = group[0].chunk_set
+        if chunk_rows[chunk_set_id]:
+            pool = get_sentence_pool(chunk_set.source_text, model_name)
+            chunk_pks, chunk_starts, chunk_ends = zip(*chunk_rows[chunk_set_id])
+            retriever = numpy_retriever.ExactTopKRetriever(chunk_pks, pool.pool(chunk_starts, chunk_ends))
+            results_per_analysis = retriever.retrieve(
+                query_matrix[[query_rows[analysis.experiment.question.text] for analysis in group]],
+                [retrieval_simulation.get_k_retrieved_target(analysis.k_relevant) for analysis in group],
+            )
+        else:
+            results_per_analysis = [[] for _ in group]
+        for analysis, results in zip(group, results_per_analysis):
+            _, _, ndcg_score = retrieval_simulation.compute_rdsg_and_ndcg(results, snapshots.get(analysis.pk, []))
+            rows.append({
+                'analysis_id': analysis.pk,
+                'experiment_id': analysis.experiment_id,
+                'strategy_id': chunk_set.strategy_id,
+                'strategy': chunk_set.strategy.name,
+                'chunk_set_id': chunk_set_id,
+                'estimated_ndcg': ndcg_score,
+            })
+    return rows
+
+
+def _ranks(values: np.ndarray) -> np.ndarray:
+    """Average ranks (ties share the mean rank), for the Spearman correlation."""
+    order = np.argsort(values, kind='stable')
+    ranks = np.empty(len(values), dtype=np.float64)
+    ranks[order] = np.arange(1, len(values) + 1)
+    for value in np.unique(values):
+        tied = values == value
+        ranks[tied] = ranks[tied].mean()
+    return ranks
+
+
+def _correlation(x: np.ndarray, y: np.ndarray) -> Optional[float]:
+    if len(x) < 2 or np.std(x) == 0 or np.std(y) == 0:
+        return None
+    return float(np.corrcoef(x, y)[0, 1])
+
+
+def screening_report(analyses: Optional[List[ExperimentChunkAnalysis]] = None,
+                     model_name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Runs the screening and compares it with the exact NDCG of the latest scored simulation of each
+    analysis run with the same embedding model: per-analysis rows, per-strategy means, and how closely the estimate tracks the exact score
+    (mean/max absolute error, Pearson and Spearman correlation, agreement on the best strategy
+    of each experiment and on the ordering of the strategies).
+    """
+    model_name = model_name or retrieval_simulation.GLOBAL_EMBED_MODEL_NAME
+    started = time.perf_counter()
+    rows = estimate_ndcg(analyses, model_name)
+    elapsed = time.perf_counter() - started
+    logger.info("Screening: %d analyses estimated in %.2fs.", len(rows), elapsed)
+
+    # Simulations of another model (or backend) would measure the model difference, not the screening's
+    exact = {}
+    for analysis_id, ndcg_score in RetrievalSimulation.objects.filter(
+        analysis_id__in=[row['analysis_id'] for row in rows], embedding_model_name=model_name, ndcg_score__isnull=False
+    ).order_by('ran_at', 'pk').values_list('analysis_id', 'ndcg_score'):
+        exact[analysis_id] = ndcg_score  # Ascending order: the latest one is kept
+    for row in rows:
+        row['exact_ndcg'] = exact.get(row['analysis_id'])
+        row['error'] = None if row['exact_ndcg'] is None else row['estimated_ndcg'] - row['exact_ndcg']
+
+    paired = [row for row in rows if row['exact_ndcg'] is not None]
+    estimated = np.array([row['estimated_ndcg'] for row in paired], dtype=np.float64)
+    exact_scores = np.array([row['exact_ndcg'] for row in paired], dtype=np.float64)
+    errors = np.abs(estimated - exact_scores)
+
+    by_strategy: Dict[str, Dict[str, list]] = defaultdict(lambda: {'estimated': [], 'exact': []})
+    best: Dict[int, Dict[str, Tuple[float, str]]] = defaultdict(dict)
+    for row in rows:
+        by_strategy[row['strategy']]['estimated'].append(row['estimated_ndcg'])
+        if row['exact_ndcg'] is not None:
+            by_strategy[row['strategy']]['exact'].append(row['exact_ndcg'])
+            for kind in ('estimated', 'exact'):
+                score = row[f'{kind}_ndcg']
+                if kind not in best[row['experiment_id']] or score > best[row['experiment_id']][kind][0]:
+                    best[row['experiment_id']][kind] = (score, row['strategy'])
+    strategies = [
+        {
+            'strategy': name,
+            'analyses': len(scores['estimated']),
+            'mean_estimated_ndcg': float(np.mean(scores['estimated'])),
+            'mean_exact_ndcg': float(np.mean(scores['exact'])) if scores['exact'] else None,
+        }
+        for name, scores in sorted(by_strategy.items())
+    ]
+    compared = [s for s in strategies if s['mean_exact_ndcg'] is not None]
+    strategy_estimated = np.array([s['mean_estimated_ndcg'] for s in compared])
+    strategy_exact = np.array([s['mean_exact_ndcg'] for s in compared])
+
+    return {
+        'model_name': model_name,
+        'seconds': elapsed,
+        'rows': rows,
+        'strategies': strategies,
+        'agreement': {
+            'pairs': len(paired),
+            'mean_abs_error': float(errors.mean()) if len(paired) else None,
+            'max_abs_error': float(errors.max()) if len(paired) else None,
+            'pearson': _correlation(estimated, exact_scores),
+            'spearman': _correlation(_ranks(estimated), _ranks(exact_scores)) if len(paired) else None,
+            'best_strategy_agreement': (
+                float(np.mean([b['estimated'][1] == b['exact'][1] for b in best.values()])) if best else None
+            ),
+            'strategy_order_spearman': (
+                _correlation(_ranks(strategy_estimated), _ranks(strategy_exact)) if len(compared) else None
+            ),
+        },
+    }
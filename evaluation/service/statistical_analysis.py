@@ -1,63 +1,27 @@
+import logging
+
 import numpy as np
-from scipy import stats
-from django.db.models import Prefetch  #
 
-# Import Django Models from your project
-from experiments.models import ChunkingStrategy, Experiment  #
-from evaluation.models import ExperimentChunkAnalysis, RetrievalSimulation  #
+from evaluation.service import results_cube
+
+logger = logging.getLogger(__name__)
 
 
 def get_ndcg_scores_per_strategy():
     """
-    Fetches NDCG scores for all strategies across all experiments from the database.
+    Fetches NDCG scores for all strategies across all experiments from the results cube.
     Returns a dictionary: {strategy_name: [ndcg_score_exp1, ndcg_score_exp2, ...]}
     """
-    print("Fetching NDCG scores from database for statistical analysis...")
-
-    # Get all chunking strategies, ordered by name
-    all_strategies = ChunkingStrategy.objects.all().order_by('name')  #
-    # Get all unique experiments
-    experiments = Experiment.objects.all()  #
-
-    # Initialize a dictionary to store lists of NDCG scores for each strategy
-    ndcg_scores_per_strategy = {strategy.name: [] for strategy in all_strategies}  #
-
-    # Iterate through each experiment to collect scores
-    for experiment in experiments:  #
-        # Prefetch analyses and their latest simulations for this specific experiment for efficiency
-        analyses_for_experiment = ExperimentChunkAnalysis.objects.filter(experiment=experiment).select_related(
-            'chunk_set__strategy'  #
-        ).prefetch_related(
-            Prefetch(
-                'simulations',  # Related name for RetrievalSimulation in ExperimentChunkAnalysis
-                queryset=RetrievalSimulation.objects.order_by('-ran_at'),  # Get the most recent simulation
-                to_attr='latest_simulations'  # Assigns the prefetched simulations to this attribute
-            )
-        ).order_by('chunk_set__strategy__name')  # Ensure consistent ordering of strategies within an experiment
-
-        # Create a temporary dictionary to hold scores for the current experiment across all strategies.
-        # This is crucial to ensure paired data for Wilcoxon, by filling missing scores with None.
-        current_experiment_ndcg_scores = {strategy.name: None for strategy in all_strategies}  #
-
-        for analysis in analyses_for_experiment:  #
-            strategy_name = analysis.chunk_set.strategy.name  #
-            if analysis.latest_simulations:  #
-                latest_sim = analysis.latest_simulations[0]  #
-                # Validate NDCG score before adding: must not be None, NaN, or Inf
-                if latest_sim.ndcg_score is not None and not np.isnan(latest_sim.ndcg_score) and not np.isinf(
-                        latest_sim.ndcg_score):  #
-                    current_experiment_ndcg_scores[strategy_name] = latest_sim.ndcg_score  #
-                else:
-                    print(
-                        f"WARN: NDCG score for Experiment {experiment.id}, Strategy {strategy_name} is invalid (None/NaN/Inf): {latest_sim.ndcg_score}")  #
-
-        # Append scores from the current experiment to the main `ndcg_scores_per_strategy` structure.
-        # This ensures each strategy's list has an entry (score or None) for every experiment.
-        for strategy_name_obj in all_strategies:  # Iterate through strategy objects to ensure all are covered
-            strategy_name = strategy_name_obj.name  #
-            ndcg_scores_per_strategy[strategy_name].append(current_experiment_ndcg_scores[strategy_name])  #
-
-    return ndcg_scores_per_strategy  #
+    logger.info("Fetching NDCG scores from the results cube for statistical analysis...")
+
+    # experiments x strategies matrix; missing or invalid (None/NaN/Inf) scores are NaN
+    experiments, all_strategies, ndcg_matrix = results_cube.get_ndcg_matrix()
+
+    # Each strategy's list has an entry (score or None) for every experiment, so that data stays paired for Wilcoxon
+    return {
+        strategy.name: [None if np.isnan(score) else float(score) for score in ndcg_matrix[:, column]]
+        for column, strategy in enumerate(all_strategies)
+    }
 
 
 def run_wilcoxon_tests(ndcg_scores_data, comparison_pairs, alpha=0.05):
@@ -72,6 +36,8 @@ def run_wilcoxon_tests(ndcg_scores_data, comparison_pairs, alpha=0.05):
     Returns:
         list: List of dictionaries, each containing test results for a comparison pair.
     """
+    from scipy import stats  # Imported on use: scipy.stats is slow to import and only this page needs it
+
     wilcoxon_results = []  #
 
     print("\n--- Performing Wilcoxon Signed-Rank Tests ---")  #
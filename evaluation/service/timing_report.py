@@ -0,0 +1,97 @@
+# evaluation/service/timing_report.py
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.db.models import Max
+
+from evaluation.models import RetrievalSimulation
+from experiments.models import ChunkSet
+from experiments.service.instrumentation import STAGES
+
+# (upper bound in characters, label) of the document size classes of the report
+SIZE_BUCKETS = [
+    (10_000, '< 10K chars'),
+    (100_000, '10K - 100K chars'),
+    (1_000_000, '100K - 1M chars'),
+    (10_000_000, '1M - 10M chars'),
+]
+LARGEST_BUCKET = '>= 10M chars'
+
+
+def size_bucket(characters: Optional[int]) -> Tuple[int, str]:
+    """(sort position, label) of the size class of a document of the given length."""
+    if characters is None:
+        return len(SIZE_BUCKETS) + 1, 'unknown'
+    for position, (upper_bound, label) in enumerate(SIZE_BUCKETS):
+        if characters < upper_bound:
+            return position, label
+    return len(SIZE_BUCKETS), LARGEST_BUCKET
+
+
+def _aggregate(runs: Iterable[Tuple[Tuple, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Averages the timings of the runs sharing a group key. Each row holds the mean seconds of every
+    stage (None when no run of the group went through it) with its share of the mean total,
+    the slowest stage and the mean item counts.
+    """
+    groups = defaultdict(list)
+    for key, timings in runs:
+        groups[key].append(timings)
+
+    rows = []
+    for key in sorted(groups):
+        group = groups[key]
+        stage_means = {}
+        for stage in STAGES:
+            values = [timings['stages'][stage] for timings in group if stage in timings.get('stages', {})]
+            stage_means[stage] = sum(values) / len(values) if values else None
+        total = sum(timings.get('total_seconds', 0.0) for timings in group) / len(group)
+
+        count_values = defaultdict(list)
+        for timings in group:
+            for name, value in timings.get('counts', {}).items():
+                count_values[name].append(value)
+
+        slowest = max((stage for stage in STAGES if stage_means[stage] is not None),
+                      key=lambda stage: stage_means[stage], default=None)
+        rows.append({
+            'key': key,
+            'runs': len(group),
+            # (mean seconds, % of the total, stage name) in STAGES order
+            'cells': [
+                (stage_means[stage],
+                 100 * stage_means[stage] / total if stage_means[stage] is not None and total > 0 else None,
+                 stage)
+                for stage in STAGES
+            ],
+            'total_seconds': total,
+            'slowest_stage': slowest,
+            'counts': {name: sum(values) / len(values) for name, values in sorted(count_values.items())},
+        })
+    return rows
+
+
+def chunking_report() -> List[Dict[str, Any]]:
+    """Mean stage timings of the chunk sets, per (document size class, strategy)."""
+    chunk_sets = ChunkSet.objects.filter(timings__isnull=False).annotate(
+        document_chars=Max('chunks__end_char')
+    ).values_list('strategy__name', 'document_chars', 'timings')
+
+    runs = []
+    for strategy_name, document_chars, timings in chunk_sets:
+        characters = timings.get('counts', {}).get('characters', document_chars)
+        runs.append((size_bucket(characters) + (strategy_name,), timings))
+    return _aggregate(runs)
+
+
+def simulation_report() -> List[Dict[str, Any]]:
+    """Mean stage timings of the retrieval simulations, per (document size class, strategy, retriever)."""
+    simulations = RetrievalSimulation.objects.filter(timings__isnull=False).annotate(
+        document_chars=Max('analysis__chunk_set__chunks__end_char')
+    ).values_list('analysis__chunk_set__strategy__name', 'retriever_name', 'document_chars', 'timings')
+
+    runs = [
+        (size_bucket(document_chars) + (strategy_name, retriever_name), timings)
+        for strategy_name, retriever_name, document_chars, timings in simulations
+    ]
+    return _aggregate(runs)
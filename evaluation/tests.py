@@ -1,3 +1,505 @@
-from django.test import TestCase
+import io
+import os
+import random
+import shutil
+import string
+import tempfile
+from types import SimpleNamespace
 
-# Create your tests here.
+import numpy as np
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from corpus.models import Question, SourceText
+from evaluation.models import ExperimentChunkAnalysis, RetrievalSimulation
+from evaluation.service import (batch_simulation, bulk_scoring, chunk_properties, embedding_store, interval_index,
+                                invalidation, ndcg_curve, numpy_retriever, relevant_chunks, retrieval_simulation,
+                                screening)
+from experiments.models import Chunk, ChunkingStrategy, ChunkSet, Experiment, RelevantSentence
+from experiments.service import annotations, chunking_pipeline, embedding_registry, structure_utils
+from experiments.service.instrumentation import StageTimings
+
+TEXT_LENGTH = 5000
+
+
+def create_experiment(title='Test document', question_text='What is it about?'):
+    source_text = SourceText.objects.create(title=title, file=f'source_texts/{title}.txt')
+    question = Question.objects.create(source_text=source_text, text=question_text)
+    return Experiment.objects.create(source_text=source_text, question=question)
+
+
+def create_chunk_set(source_text, strategy_name, spans):
+    """A ChunkSet with one chunk per (start, end) span, under a new length strategy."""
+    strategy = ChunkingStrategy.objects.create(name=strategy_name, method_type='length',
+                                               parameters={'chunk_size': 128, 'chunk_overlap': 10})
+    chunk_set = ChunkSet.objects.create(source_text=source_text, strategy=strategy)
+    Chunk.objects.bulk_create([
+        Chunk(chunk_set=chunk_set, chunk_index=i, start_char=start, end_char=end, stored_text='x' * (end - start))
+        for i, (start, end) in enumerate(spans)
+    ])
+    return chunk_set
+
+
+def random_chunk_spans(rng, text_length=TEXT_LENGTH):
+    """Consecutive chunks of random length, some of them overlapping the previous one."""
+    spans, start = [], 0
+    while start < text_length:
+        end = min(text_length, start + rng.randint(20, 300))
+        spans.append((start, end))
+        start = max(start + 1, end - rng.choice([0, 0, 10, 50]))
+    return spans
+
+
+class UpdateAnalysisTests(TestCase):
+    """The incremental update after an annotation change gives the same analysis as initialize_analysis."""
+
+    def setUp(self):
+        rng = random.Random(0)
+        self.experiment = create_experiment()
+        chunk_spans = random_chunk_spans(rng)
+        # Two chunk sets with the same chunks: one updated incrementally, one initialised from scratch
+        self.incremental = ExperimentChunkAnalysis.objects.create(
+            experiment=self.experiment, chunk_set=create_chunk_set(self.experiment.source_text, 'A', chunk_spans)
+        )
+        self.reference = ExperimentChunkAnalysis.objects.create(
+            experiment=self.experiment, chunk_set=create_chunk_set(self.experiment.source_text, 'B', chunk_spans)
+        )
+
+    def relevant(self, analysis):
+        analysis.refresh_from_db()
+        return analysis.k_relevant, sorted(analysis.ranked_relevant_chunks.values_list(
+            'chunk__start_char', 'chunk__end_char', 'relevant_overlap_chars'
+        ))
+
+    def test_random_edits_match_full_initialisation(self):
+        rng = random.Random(42)
+        highlights = {}
+        relevant_chunks.initialize_analysis(self.incremental)
+        for step in range(40):
+            new_highlights = dict(highlights)
+            n_removed = len(new_highlights) if rng.random() < 0.1 else rng.randint(0, min(2, len(new_highlights)))
+            for span in rng.sample(sorted(new_highlights), n_removed):
+                del new_highlights[span]
+            for _ in range(rng.randint(0, 3)):
+                start = rng.randrange(TEXT_LENGTH - 1)
+                new_highlights[(start, min(TEXT_LENGTH, start + rng.randint(1, 400)))] = 'x'
+
+            previous_hash = relevant_chunks.annotations_hash(highlights)
+            added, removed = annotations.save_annotations(self.experiment, new_highlights)
+            highlights = new_highlights
+            self.incremental.refresh_from_db()
+            self.assertTrue(relevant_chunks.update_analysis(
+                self.incremental, list(highlights), added + removed, previous_hash
+            ))
+            relevant_chunks.initialize_analysis(self.reference)
+            self.assertEqual(self.relevant(self.incremental), self.relevant(self.reference), f"step {step}")
+
+    def test_stale_analysis_is_initialised_again(self):
+        relevant_chunks.initialize_analysis(self.incremental)
+        added, removed = annotations.save_annotations(self.experiment, {(100, 200): 'x'})
+        self.incremental.refresh_from_db()
+        self.assertFalse(relevant_chunks.update_analysis(
+            self.incremental, [(100, 200)], added + removed, previous_hash='not the previous hash'
+        ))
+        relevant_chunks.initialize_analysis(self.reference)
+        self.assertEqual(self.relevant(self.incremental), self.relevant(self.reference))
+
+
+class SentencePoolTests(SimpleTestCase):
+    """SentencePool.pool equals the overlap-weighted mean of the covered sentence vectors."""
+
+    @staticmethod
+    def brute_force(spans, vectors, chunk_starts, chunk_ends):
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        pooled = np.zeros((len(chunk_starts), vectors.shape[1]))
+        for i, (chunk_start, chunk_end) in enumerate(zip(chunk_starts, chunk_ends)):
+            weights = np.array([max(0, min(end, chunk_end) - max(start, chunk_start)) for start, end in spans])
+            if weights.sum() > 0:
+                pooled[i] = weights @ vectors / weights.sum()
+        return pooled
+
+    def test_random_chunks_match_brute_force(self):
+        rng = np.random.default_rng(0)
+        # Sentences with gaps between them (whitespace) and a few overlapping ones, in shuffled order
+        starts = np.cumsum(rng.integers(1, 60, size=200))
+        spans = [(int(start), int(start + length)) for start, length in zip(starts, rng.integers(5, 80, size=200))]
+        rng.shuffle(spans)
+        vectors = rng.normal(size=(len(spans), 16))
+        pool = screening.SentencePool(spans, vectors)
+
+        chunk_starts = rng.integers(0, int(starts[-1]) + 100, size=300)
+        chunk_ends = chunk_starts + rng.integers(1, 400, size=300)
+        np.testing.assert_allclose(pool.pool(chunk_starts, chunk_ends),
+                                   self.brute_force(spans, vectors, chunk_starts, chunk_ends), atol=1e-5)
+
+    def test_chunk_inside_a_single_sentence_gets_its_vector(self):
+        vectors = np.array([[3.0, 4.0], [1.0, 0.0]])
+        pool = screening.SentencePool([(0, 10), (12, 20)], vectors)
+        np.testing.assert_allclose(pool.pool([2], [5]), [[0.6, 0.8]], atol=1e-6)
+
+    def test_chunk_between_sentences_gets_a_zero_vector(self):
+        pool = screening.SentencePool([(0, 10), (12, 20)], np.eye(2))
+        np.testing.assert_array_equal(pool.pool([10], [12]), [[0.0, 0.0]])
+
+    def test_empty_pool(self):
+        pool = screening.SentencePool(np.zeros((0, 2)), np.zeros((0, 4)))
+        self.assertEqual(len(pool), 0)
+        self.assertEqual(pool.pool([0, 5], [3, 9]).shape[0], 2)
+
+
+def random_ranking_and_snapshot(rng, n_chunks, n_relevant):
+    """A full ranking of n_chunks random ids (scores descending) and a (chunk_id, w, w') snapshot of n_relevant of them."""
+    chunk_ids = rng.choice(10 ** 6, size=n_chunks, replace=False).astype(np.int64)
+    ranking = (chunk_ids, np.sort(rng.uniform(-0.2, 1.0, size=n_chunks)).astype(np.float32)[::-1].copy())
+    relevant = rng.choice(chunk_ids, size=n_relevant, replace=False)
+    w = np.sort(rng.uniform(0.1, 3.0, size=n_relevant))[::-1]
+    snapshot = [(int(chunk_id), float(w_i), float(w_i * rng.uniform(0.5, 1.0))) for chunk_id, w_i in zip(relevant, w)]
+    return ranking, snapshot
+
+
+class NdcgCurveTests(SimpleTestCase):
+    """compute_curves against the per-run compute_rdsg_and_ndcg on the same ranking."""
+
+    def test_matches_per_run_score_at_k_retrieved(self):
+        rng = np.random.default_rng(0)
+        for _ in range(50):
+            n_relevant = int(rng.integers(1, 30))
+            ranking, snapshot = random_ranking_and_snapshot(rng, int(rng.integers(n_relevant, 120)), n_relevant)
+            k_retrieved = min(retrieval_simulation.get_k_retrieved_target(n_relevant), ranking[0].shape[0])
+            curves = ndcg_curve.compute_curves(ranking, snapshot)
+
+            rdsg, ideal_rdsg, ndcg = retrieval_simulation.compute_rdsg_and_ndcg(
+                numpy_retriever.top_k_from_ranking(ranking, k_retrieved), snapshot)
+            self.assertAlmostEqual(ndcg_curve.value_at(curves['rdsg'], k_retrieved), rdsg, places=5)
+            self.assertAlmostEqual(ndcg_curve.value_at(curves['ideal_rdsg'], k_retrieved), ideal_rdsg, places=5)
+            self.assertAlmostEqual(ndcg_curve.value_at(curves['ndcg'], k_retrieved), ndcg, places=5)
+
+    def test_ideal_rdsg_is_cut_below_the_relevant_count(self):
+        rng = np.random.default_rng(1)
+        ranking, snapshot = random_ranking_and_snapshot(rng, 60, 12)
+        first = np.isin(ranking[0], [chunk_id for chunk_id, _, _ in snapshot[:3]])
+        ranking = (np.concatenate([ranking[0][first], ranking[0][~first]]), ranking[1])  # Some gain in the first k
+        curves = ndcg_curve.compute_curves(ranking, snapshot)
+
+        k = 5
+        rdsg, full_ideal_rdsg, full_ndcg = retrieval_simulation.compute_rdsg_and_ndcg(
+            numpy_retriever.top_k_from_ranking(ranking, k), snapshot)
+        ideal_at_k = sum(w / np.log2(i + 1) for i, (_, w, _) in enumerate(snapshot[:k], start=1))
+        self.assertAlmostEqual(ndcg_curve.value_at(curves['rdsg'], k), rdsg, places=5)
+        self.assertAlmostEqual(ndcg_curve.value_at(curves['ideal_rdsg'], k), ideal_at_k, places=5)
+        self.assertLess(ideal_at_k, full_ideal_rdsg)
+        # The per-run score divides by the untruncated ideal, the curve by the ideal at k
+        self.assertAlmostEqual(ndcg_curve.value_at(curves['ndcg'], k), rdsg / ideal_at_k, places=5)
+        self.assertGreater(ndcg_curve.value_at(curves['ndcg'], k), full_ndcg)
+
+
+class BulkScoringTests(SimpleTestCase):
+    """score_arrays on a batch gives, per simulation, what compute_rdsg_and_ndcg gives for it alone."""
+
+    def assert_matches_per_simulation(self, simulation_analysis, simulations_retrieved, snapshots, rng):
+        rows = [(i, chunk_id, s, rank) for i, retrieved in enumerate(simulations_retrieved)
+                for chunk_id, s, rank in retrieved]
+        rng.shuffle(rows)  # Rows come back from the database in any order
+        columns = tuple(np.asarray([row[c] for row in rows], dtype=dtype)
+                        for c, dtype in enumerate((np.int64, np.int64, np.float64, np.int64)))
+        rdsg, ideal, ndcg = bulk_scoring.score_arrays(np.asarray(simulation_analysis, dtype=np.int64), columns,
+                                                      snapshots)
+
+        for i, (analysis_id, retrieved) in enumerate(zip(simulation_analysis, simulations_retrieved)):
+            expected = retrieval_simulation.compute_rdsg_and_ndcg(retrieved, snapshots.get(analysis_id, []))
+            np.testing.assert_allclose((rdsg[i], ideal[i], ndcg[i]), expected, rtol=1e-9, atol=1e-12)
+
+    def test_random_batches(self):
+        rng = random.Random(0)
+        for _ in range(20):
+            # Large ids exercise the grouping on (analysis id, chunk id) pairs
+            analysis_ids = rng.sample(range(1, 2 ** 20), rng.randint(1, 8))
+            chunk_pool = rng.sample(range(1, 2 ** 31), 300)
+            snapshots = {}
+            for analysis_id in analysis_ids:
+                relevant = rng.sample(chunk_pool, rng.randint(0, 15))  # Some analyses have an empty snapshot
+                snapshots[analysis_id] = sorted(
+                    ((chunk_id, rng.uniform(0.1, 3.0), rng.uniform(0.0, 3.0)) for chunk_id in relevant),
+                    key=lambda row: -row[1],
+                )
+            missing_id = max(analysis_ids) + 1  # Analysis with no snapshot at all
+
+            simulation_analysis, simulations_retrieved = [], []
+            for _ in range(rng.randint(1, 25)):  # Several simulations share each analysis
+                simulation_analysis.append(rng.choice(analysis_ids + [missing_id]))
+                retrieved_ids = rng.sample(chunk_pool, rng.randint(0, 30))  # Some simulations retrieved nothing
+                simulations_retrieved.append([(chunk_id, rng.uniform(-0.2, 1.0), rank)
+                                              for rank, chunk_id in enumerate(retrieved_ids, start=1)])
+            self.assert_matches_per_simulation(simulation_analysis, simulations_retrieved, snapshots, rng)
+
+    def test_shared_chunk_is_scored_with_the_w_prime_of_its_own_analysis(self):
+        snapshots = {1: [(7, 2.0, 1.5)], 2: [(7, 1.0, 0.25)], 3: []}
+        self.assert_matches_per_simulation(
+            [1, 2, 2, 3, 4], [[(7, 0.9, 1)], [(7, 0.9, 2)], [], [(7, 0.5, 1)], [(7, 0.5, 1)]], snapshots,
+            random.Random(1),
+        )
+
+    def test_chunk_ids_beyond_32_bits_are_not_confused(self):
+        # (1 << 32) | 2 ** 33 + 5 == (3 << 32) | 5: packed keys would give chunk 2 ** 33 + 5 the w' of chunk 5
+        big_id = 2 ** 33 + 5
+        snapshots = {1: [(big_id, 2.0, 1.5)], 3: [(5, 1.0, 0.25), (2 ** 32 + 5, 0.5, 0.5)]}
+        self.assert_matches_per_simulation(
+            [1, 1, 3, 3], [[(big_id, 0.9, 1), (5, 0.8, 2)], [(2 ** 32 + 5, 0.7, 1)], [(big_id, 0.9, 1)],
+                           [(5, 0.6, 1), (2 ** 32 + 5, 0.4, 2)]],
+            snapshots, random.Random(2),
+        )
+
+    def test_nothing_retrieved(self):
+        rdsg, ideal, ndcg = bulk_scoring.score_arrays(
+            np.asarray([5, 6], dtype=np.int64), tuple(np.zeros(0, dtype=np.int64) for _ in range(4)),
+            {5: [(1, 2.0, 1.0)]},
+        )
+        np.testing.assert_allclose(rdsg, [0.0, 0.0])
+        np.testing.assert_allclose(ideal, [2.0, 0.0])
+        np.testing.assert_allclose(ndcg, [0.0, 0.0])
+
+
+class EmbeddingStoreTests(TestCase):
+
+    def test_each_distinct_text_is_embedded_once(self):
+        embedded = []
+
+        def embed(texts):
+            embedded.extend(texts)
+            return [[len(text), 1.0] for text in texts]
+
+        vectors = embedding_store.get_embeddings(['a', 'bb', 'a'], 'test-model', embed)
+        np.testing.assert_array_equal(vectors, [[1, 1], [2, 1], [1, 1]])
+        with self.assertLogs('evaluation.service.embedding_store', level='INFO') as logs:
+            again = embedding_store.get_embeddings(['bb', 'ccc'], 'test-model', embed)
+        np.testing.assert_array_equal(again, [[2, 1], [3, 1]])
+        self.assertEqual(embedded, ['a', 'bb', 'ccc'])
+        self.assertIn("1 cached, 1 to embed", logs.output[0])
+
+
+class IntervalIndexTests(SimpleTestCase):
+    """IntervalIndex against the nested loop it replaced: overlap when start < query_end and end > query_start."""
+
+    @staticmethod
+    def brute_force(spans, query_starts, query_ends):
+        counts, lengths = [], []
+        for query_start, query_end in zip(query_starts, query_ends):
+            overlapping = [(start, end) for start, end in spans if start < query_end and end > query_start]
+            counts.append(len(overlapping))
+            lengths.append(sum(min(end, query_end) - max(start, query_start) for start, end in overlapping))
+        return counts, lengths
+
+    def assert_matches_brute_force(self, spans, query_starts, query_ends):
+        index = interval_index.IntervalIndex([start for start, _ in spans], [end for _, end in spans])
+        counts, lengths = self.brute_force(spans, query_starts, query_ends)
+        self.assertEqual(index.overlap_counts(query_starts, query_ends).tolist(), counts)
+        self.assertEqual(index.overlap_lengths(query_starts, query_ends).tolist(), lengths)
+
+    def test_random_intervals(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            spans = []
+            for _ in range(rng.randint(0, 30)):
+                start = rng.randint(0, 200)
+                spans.append((start, start + rng.randint(1, 60)))
+            spans += rng.sample(spans, min(len(spans), 3))  # Duplicates
+            spans += [(start + 1, end - 1) for start, end in spans[:3] if end - start > 2]  # Nested
+            query_starts = [rng.randint(0, 260) for _ in range(50)]
+            query_ends = [start + rng.randint(0, 80) for start in query_starts]
+            # Queries touching the indexed intervals on either side
+            query_starts += [end for _, end in spans] + [start - 5 for start, _ in spans]
+            query_ends += [end + 5 for _, end in spans] + [start for start, _ in spans]
+            self.assert_matches_brute_force(spans, query_starts, query_ends)
+
+    def test_touching_intervals_do_not_overlap(self):
+        self.assert_matches_brute_force([(0, 10), (10, 20), (10, 20), (2, 8)], [10, 0, 5, 20, 9], [15, 10, 12, 30, 11])
+        index = interval_index.IntervalIndex([0, 10], [10, 20])
+        self.assertEqual(index.overlap_counts([10, 20], [10, 25]).tolist(), [0, 0])
+
+    def test_find_overlaps_keeps_only_overlapping_chunks(self):
+        chunk_ids, lengths = interval_index.find_overlaps([(5, 15), (12, 20)], [7, 8, 9], [0, 15, 20], [5, 18, 30])
+        self.assertEqual((chunk_ids.tolist(), lengths.tolist()), ([8], [3]))
+        chunk_ids, lengths = interval_index.find_overlaps([], [7], [0], [5])
+        self.assertEqual((chunk_ids.tolist(), lengths.tolist()), ([], []))
+
+
+class LetterEmbedding:
+    """Stand-in model: the vector of a text is its letter counts."""
+
+    max_length = 512
+
+    @staticmethod
+    def vector(text):
+        return [text.lower().count(letter) + 0.1 for letter in string.ascii_lowercase]
+
+    def get_text_embedding_batch(self, texts):
+        return [self.vector(text) for text in texts]
+
+    def get_query_embedding(self, query):
+        return self.vector(query)
+
+
+class InvalidationTests(TestCase):
+    """Edited annotations make only their analyses and simulations stale, recompute_stale refreshes them."""
+
+    MODEL_NAME = 'test-letter-model'
+    PARAGRAPHS = ["Apples grow on trees.", "Bananas are yellow and sweet.", "Cherries are small and red.",
+                  "Dates come from palms.", "Elderberries make syrup.", "Figs ripen in late summer."]
+
+    def setUp(self):
+        media_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_dir, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_dir, CACHE_ROOT=os.path.join(media_dir, 'cache'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        embedding_registry.register_model(self.MODEL_NAME, LetterEmbedding())
+        self.addCleanup(embedding_registry._models.pop, self.MODEL_NAME, None)
+
+        self.content = '\n\n'.join(self.PARAGRAPHS)
+        os.makedirs(os.path.join(media_dir, 'source_texts'))
+        with open(os.path.join(media_dir, 'source_texts', 'fruit.txt'), 'w', encoding='utf-8') as f:
+            f.write(self.content)
+        source_text = SourceText.objects.create(title='Fruit', file='source_texts/fruit.txt')
+        strategy = ChunkingStrategy.objects.create(name='Paragraphs', method_type='structure',
+                                                   parameters={'structure_type': 'pure_paragraph'})
+        chunk_set = chunking_pipeline.save_chunk_set(source_text, strategy,
+                                                     structure_utils._pure_paragraph_split(self.content, '\n\n'))
+
+        self.analyses = []
+        for paragraph, question_text in ((1, 'Which fruit is yellow?'), (3, 'What grows on palms?')):
+            question = Question.objects.create(source_text=source_text, text=question_text)
+            experiment = Experiment.objects.create(source_text=source_text, question=question)
+            self.annotate(experiment, paragraph)
+            analysis = ExperimentChunkAnalysis.objects.create(experiment=experiment, chunk_set=chunk_set)
+            relevant_chunks.initialize_analysis(analysis)
+            self.rank(analysis)
+            self.analyses.append(analysis)
+        batch_simulation.simulate_analyses(self.load(self.analyses), self.MODEL_NAME)
+
+    def span(self, paragraph):
+        start = self.content.index(self.PARAGRAPHS[paragraph])
+        return start, start + len(self.PARAGRAPHS[paragraph])
+
+    def annotate(self, experiment, paragraph):
+        start, end = self.span(paragraph)
+        RelevantSentence.objects.create(experiment=experiment, start_char=start, end_char=end,
+                                        text=self.content[start:end])
+
+    @staticmethod
+    def rank(analysis):
+        """Ranks the not yet ranked relevant chunks after the ranked ones and computes w'."""
+        unranked = analysis.ranked_relevant_chunks.filter(ideal_rank__isnull=True).order_by('chunk__chunk_index')
+        n_ranked = analysis.ranked_relevant_chunks.filter(ideal_rank__isnull=False).count()
+        for rank, ranked_chunk in enumerate(unranked, start=n_ranked + 1):
+            ranked_chunk.ideal_rank = rank
+            ranked_chunk.save(update_fields=['ideal_rank'])
+        chunk_properties.calculate_chunk_properties(analysis)
+
+    @staticmethod
+    def load(analyses):
+        return list(ExperimentChunkAnalysis.objects.filter(pk__in=[a.pk for a in analyses]).select_related(
+            'experiment__question', 'chunk_set'))
+
+    def latest_pks(self):
+        return {simulation.analysis_id: simulation.pk for simulation in invalidation.latest_simulations()}
+
+    def recompute(self):
+        out = io.StringIO()
+        call_command('recompute_stale', stdout=out)
+        return out.getvalue()
+
+    def test_nothing_is_stale_after_setup(self):
+        self.assertEqual(invalidation.find_stale(), {'chunk_sets': {}, 'analyses': {}, 'simulations': {}})
+
+    def test_edited_sentence_makes_only_its_analysis_stale(self):
+        edited, other = self.analyses
+        before = self.latest_pks()
+        sentence = edited.experiment.relevant_sentences.get()
+        sentence.end_char -= 5
+        sentence.save()
+
+        stale = invalidation.find_stale()
+        self.assertEqual(stale['chunk_sets'], {})
+        self.assertEqual(stale['analyses'], {edited.pk: 'relevant sentences changed'})
+        self.assertEqual(stale['simulations'], {before[edited.pk]: 'analysis stale'})
+
+        output = self.recompute()
+        self.assertIn("1 analyses initialised again", output)
+        self.assertEqual(invalidation.find_stale(), {'chunk_sets': {}, 'analyses': {}, 'simulations': {}})
+        after = self.latest_pks()
+        self.assertNotEqual(after[edited.pk], before[edited.pk])
+        self.assertEqual(after[other.pk], before[other.pk])  # Untouched analysis: not simulated again
+
+    def test_incremental_update_leaves_the_simulation_stale_until_ranked(self):
+        edited, other = self.analyses
+        before = self.latest_pks()
+        experiment = edited.experiment
+        previous_hash = relevant_chunks.annotations_hash(experiment.relevant_sentences.values_list('start_char',
+                                                                                                    'end_char'))
+        highlights = {span: self.content[span[0]:span[1]] for span in (self.span(1), self.span(4))}
+        added, removed = annotations.save_annotations(experiment, highlights)
+        relevant_chunks.update_experiment_analyses(experiment, added + removed, previous_hash)
+
+        stale = invalidation.find_stale()
+        self.assertEqual(stale['analyses'], {})  # Updated in place with the annotations
+        self.assertEqual(stale['simulations'], {before[edited.pk]: 'inputs changed'})
+
+        summary = invalidation.recompute_stale()
+        self.assertEqual((summary['awaiting_ranking'], summary['simulations']), ([edited.pk], []))
+
+        self.rank(ExperimentChunkAnalysis.objects.get(pk=edited.pk))
+        self.assertIn("1 simulations run again", self.recompute())
+        self.assertEqual(invalidation.find_stale(), {'chunk_sets': {}, 'analyses': {}, 'simulations': {}})
+        self.assertEqual(self.latest_pks()[other.pk], before[other.pk])
+        self.assertEqual(RetrievalSimulation.objects.filter(analysis=edited).count(), 2)
+
+
+class ExactTopKRetrieverTests(SimpleTestCase):
+    """ExactTopKRetriever returns the top-k of the LlamaIndex vector store on the same embeddings."""
+
+    MODEL_NAME = 'test-llama-mock-model'
+
+    def setUp(self):
+        from llama_index.core.embeddings import MockEmbedding
+
+        embedding_registry.register_model(self.MODEL_NAME, MockEmbedding(embed_dim=8))
+        self.addCleanup(embedding_registry._models.pop, self.MODEL_NAME, None)
+
+    def llama_index_top_k(self, chunk_pks, embeddings, query, k):
+        chunks = [SimpleNamespace(pk=int(pk), text=f'chunk {i}', chunk_index=i, start_char=i, end_char=i + 1)
+                  for i, pk in enumerate(chunk_pks)]
+        return retrieval_simulation._retrieve_with_llama_index(chunks, embeddings, 'question', query, k,
+                                                               StageTimings('test'), self.MODEL_NAME)
+
+    def test_same_top_k_as_llama_index(self):
+        rng = np.random.default_rng(0)
+        chunk_pks = rng.choice(10 ** 6, size=150, replace=False)
+        embeddings = rng.normal(size=(150, 8)).astype(np.float32)
+        retriever = numpy_retriever.ExactTopKRetriever(chunk_pks, embeddings)
+        for query in rng.normal(size=(5, 8)).astype(np.float32):
+            for k in (1, 10, 37, 150, 200):
+                expected = self.llama_index_top_k(chunk_pks, embeddings, query, k)
+                (retrieved,) = retriever.retrieve(query, k)
+                self.assertEqual([(pk, rank) for pk, _, rank in retrieved], [(pk, rank) for pk, _, rank in expected])
+                np.testing.assert_allclose([score for _, score, _ in retrieved], [score for _, score, _ in expected],
+                                           atol=1e-5)
+
+    def test_ties_are_ranked_in_chunk_order(self):
+        rng = np.random.default_rng(1)
+        # Few distinct vectors (none zero, LlamaIndex gives them NaN scores): most scores are tied
+        embeddings = rng.integers(1, 3, size=(60, 3)).astype(np.float32)
+        chunk_pks = np.arange(100, 160)
+        retriever = numpy_retriever.ExactTopKRetriever(chunk_pks, embeddings)
+        for query in rng.integers(1, 4, size=(5, 3)).astype(np.float32):
+            (ranking,) = retriever.rank(query)
+            for k in range(0, 62):
+                (retrieved,) = retriever.retrieve(query, k)
+                self.assertEqual(retrieved, numpy_retriever.top_k_from_ranking(ranking, k))
+            # Within equal scores, chunks keep their order
+            for (pk, score, _), (next_pk, next_score, _) in zip(retrieved, retrieved[1:]):
+                if score == next_score:
+                    self.assertLess(pk, next_pk)
+            # LlamaIndex orders ties by its heap: same scores, possibly other tied chunks
+            expected = self.llama_index_top_k(chunk_pks, embeddings, query, 10)
+            np.testing.assert_allclose([score for _, score, _ in retriever.retrieve(query, 10)[0]],
+                                       [score for _, score, _ in expected], atol=1e-5)
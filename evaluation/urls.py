@@ -21,4 +21,9 @@ urlpatterns = [
         views.run_statistical_analysis_view,
         name='statistical_analysis'
     ),
+    path(
+        'timings/',
+        views.view_stage_timings,
+        name='stage_timings'
+    ),
 ]
\ No newline at end of file
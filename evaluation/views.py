@@ -1,9 +1,8 @@
 import json
-import math
+import logging
 
 import numpy as np
 
-from django.db.models import Prefetch
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse
 from django.contrib import messages
@@ -11,11 +10,25 @@ from django.db import transaction
 
 # Import models from other apps and this app
 from corpus.models import SourceText, Question
-from evaluation.service import relevant_chunks, helper
-from experiments.models import Experiment, ChunkingStrategy, ChunkSet, Chunk
-from .models import ExperimentChunkAnalysis, RankedRelevantChunk, RetrievalSimulation
+from evaluation.service import relevant_chunks, helper, ndcg_curve, results_cube, timing_report
+from experiments.models import Experiment, ChunkSet, Chunk
+from .models import ExperimentChunkAnalysis, RankedRelevantChunk
 from .service.helper import handle_run_simulation_and_rdsg
 from .service import statistical_analysis
+from .service.retrieval_simulation import EMBED_MODEL_NAMES, RETRIEVER_NAMES
+from experiments.service.instrumentation import STAGES
+from jobs.service import job_queue
+
+logger = logging.getLogger(__name__)
+
+
+def _requested_k(request):
+    """The NDCG@k cut-off asked with ?k=, None when absent or not a positive integer."""
+    try:
+        k = int(request.GET.get('k', ''))
+    except ValueError:
+        return None
+    return k if k >= 1 else None
 
 
 def evaluation_detail_view(request, experiment_pk, chunk_set_pk):
@@ -45,13 +58,13 @@ def evaluation_detail_view(request, experiment_pk, chunk_set_pk):
     if created_by_this_request:
         messages.info(request, f"Analysis record (ID: {analysis.id}) created.")
         try:
-            print(f"Calling services.initialize_analysis for Analysis ID: {analysis.id}")
+            logger.info("Calling services.initialize_analysis for Analysis ID: %d", analysis.id)
             relevant_chunks.initialize_analysis(analysis)
             analysis.refresh_from_db()  # Reload to update k_relevant
             messages.success(request, f"Initial analysis completed: {analysis.k_relevant} relevant chunks identified.")
         except Exception as e:
             messages.error(request, f"Error during initial analysis: {e}")
-            print(f"Error in initialize_analysis: {e}")
+            logger.exception("Error in initialize_analysis: %s", e)
 
     # --- Modular POST handling ---
     if request.method == 'POST':
@@ -105,6 +118,15 @@ def evaluation_detail_view(request, experiment_pk, chunk_set_pk):
                 'relevance_info': relevance_info
             })
 
+    # NDCG@k at the usual cut-offs, k_retrieved, N and ?k=, from the stored full ranking (no retrieval is run)
+    requested_k = _requested_k(request)
+    ndcg_at_k_points = []
+    if simulation:
+        curves = ndcg_curve.simulation_curves(simulation)
+        if curves is not None:
+            cutoffs = [*ndcg_curve.DEFAULT_CUTOFFS, simulation.k_retrieved, len(curves['ndcg'])]
+            ndcg_at_k_points = ndcg_curve.curve_points(curves, cutoffs + ([requested_k] if requested_k else []))
+
     ranking_complete = False
     properties_calculated = False
     if analysis.k_relevant is not None and analysis.k_relevant > 0:
@@ -114,16 +136,13 @@ def evaluation_detail_view(request, experiment_pk, chunk_set_pk):
             ranking_complete = True
         else:
             if ranked_count > 0 and ranked_count < analysis.k_relevant:
-                print(f"WARN: Incomplete ranking. {ranked_count}/{analysis.k_relevant} ranks assigned.")
+                logger.warning("Incomplete ranking. %d/%d ranks assigned.", ranked_count, analysis.k_relevant)
 
         if ranking_complete:
             first_ranked_rrc = RankedRelevantChunk.objects.filter(analysis=analysis, ideal_rank__isnull=False).order_by('ideal_rank').first()
             if first_ranked_rrc and first_ranked_rrc.effective_relevance_w_prime is not None:
                 properties_calculated = True
 
-    print("PASSAGGIO DATI")
-    print(json.dumps(all_relevant_highlights_data))
-
     context = {
         'experiment': experiment,
         'chunk_set': chunk_set,
@@ -135,6 +154,11 @@ def evaluation_detail_view(request, experiment_pk, chunk_set_pk):
         'ranking_complete': ranking_complete,
         'properties_calculated': properties_calculated,
         'all_relevant_highlights_json': json.dumps(all_relevant_highlights_data),
+        'retriever_names': RETRIEVER_NAMES,
+        'embed_model_names': EMBED_MODEL_NAMES,
+        'ndcg_at_k_points': ndcg_at_k_points,
+        'requested_k': requested_k,
+        'active_jobs': job_queue.active_jobs('simulate', analysis_id=analysis.pk),
     }
     return render(request, 'evaluation/evaluation_detail.html', context)
 
@@ -144,12 +168,13 @@ def view_evaluation_results(request):
     Displays a summary table of NDCG scores for all experiments and chunking strategies.
     Allows for easy comparison across different strategies, including aggregate metrics.
     """
-    print("Loading Evaluation Results Summary...")
-
-    all_strategies = ChunkingStrategy.objects.all().order_by('name')
-
-    experiments = Experiment.objects.select_related('source_text', 'question').order_by('source_text__title',
-                                                                                        'question__text')
+    # One read of the materialised results cube: experiments x strategies matrix of latest NDCG (NaN = missing);
+    # with ?k=, NDCG@k of the same simulations from their stored rankings
+    requested_k = _requested_k(request)
+    experiments, all_strategies, ndcg_matrix = results_cube.get_ndcg_matrix(
+        Experiment.objects.select_related('source_text', 'question').order_by('source_text__title', 'question__text'),
+        k=requested_k,
+    )
 
     results_data = []  # Data for the main table (per experiment row)
 
@@ -166,7 +191,7 @@ def view_evaluation_results(request):
     # { 'Strategy Name A': 5, 'Strategy Name B': 2 }
     strategy_wins_count = {strategy.name: 0 for strategy in all_strategies}
 
-    for experiment in experiments:
+    for row, experiment in enumerate(experiments):
         row_data = {
             'experiment_id': experiment.id,
             'document_title': experiment.source_text.title,
@@ -175,37 +200,20 @@ def view_evaluation_results(request):
             'ndcg_scores_for_calc': []  # Temporary list to collect scores for average/variance for current experiment
         }
 
-        analyses_for_experiment = ExperimentChunkAnalysis.objects.filter(experiment=experiment).select_related(
-            'chunk_set__strategy'
-        ).prefetch_related(
-            Prefetch(
-                'simulations',
-                queryset=RetrievalSimulation.objects.order_by('-ran_at'),
-                to_attr='latest_simulations'
-            )
-        ).order_by('chunk_set__strategy__name')
-
         # Collect NDCG scores for this specific experiment (for internal ranking and per-row average/variance)
         current_experiment_strategy_ndcg_scores = {}  # {strategy_name: ndcg_score}
 
-        for analysis in analyses_for_experiment:
-            strategy_name = analysis.chunk_set.strategy.name
-            ndcg_score = None
-            if analysis.latest_simulations:
-                latest_sim = analysis.latest_simulations[0]
-                # Ensure ndcg_score is not None and not NaN/Inf for calculations
-                if latest_sim.ndcg_score is not None and not math.isnan(latest_sim.ndcg_score) and not math.isinf(
-                        latest_sim.ndcg_score):
-                    ndcg_score = latest_sim.ndcg_score
-                else:
-                    print(
-                        f"WARN: NDCG score for Experiment {experiment.id}, Strategy {strategy_name} is None/NaN/Inf: {latest_sim.ndcg_score}")
+        # Columns follow the strategy name order; invalid scores are already NaN in the cube
+        for column, strategy in enumerate(all_strategies):
+            if np.isnan(ndcg_matrix[row, column]):
+                continue
+            strategy_name = strategy.name
+            ndcg_score = float(ndcg_matrix[row, column])
 
             row_data['strategy_results'][strategy_name] = ndcg_score
-            if ndcg_score is not None:
-                row_data['ndcg_scores_for_calc'].append(ndcg_score)
-                current_experiment_strategy_ndcg_scores[strategy_name] = ndcg_score
-                all_ndcg_scores_per_strategy[strategy_name].append(ndcg_score)  # Add to global list for aggregate calc
+            row_data['ndcg_scores_for_calc'].append(ndcg_score)
+            current_experiment_strategy_ndcg_scores[strategy_name] = ndcg_score
+            all_ndcg_scores_per_strategy[strategy_name].append(ndcg_score)  # Add to global list for aggregate calc
 
         # --- Calculate Average, Variance, Best/Worst Scores for the current row (Experiment) ---
         if row_data['ndcg_scores_for_calc']:
@@ -306,6 +314,7 @@ def view_evaluation_results(request):
         'all_strategies': all_strategies,
         'results_data': results_data,  # Data for the main per-experiment table
         'summary_table_data': summary_table_data,  # Data for the new aggregate summary table
+        'requested_k': requested_k,
     }
     return render(request, 'evaluation/results_summary.html', context)
 
@@ -315,8 +324,6 @@ def run_statistical_analysis_view(request):
     Renders a page displaying the results of Wilcoxon Signed-Rank tests
     comparing different chunking strategies.
     """
-    print("Accessing Wilcoxon Tests Results page and initiating calculations...")
-
     # Define the comparison pairs. These names must exactly match the strategy names in your database.
     # The order of strategies here should ideally reflect their Mean NDCG from your summary table.
     comparison_pairs = [
@@ -338,3 +345,16 @@ def run_statistical_analysis_view(request):
         'wilcoxon_results': wilcoxon_results  #
     }
     return render(request, 'evaluation/wilcoxon_test.html', context)
+
+
+def view_stage_timings(request):
+    """
+    Report of the per-stage timings recorded on chunk sets and retrieval simulations,
+    averaged per document size class and strategy, to see where wall time goes.
+    """
+    context = {
+        'stages': STAGES,
+        'chunking_rows': timing_report.chunking_report(),
+        'simulation_rows': timing_report.simulation_report(),
+    }
+    return render(request, 'evaluation/stage_timings.html', context)
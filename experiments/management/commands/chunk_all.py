@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from experiments.service import chunking_pipeline
+
+
+class Command(BaseCommand):
+    help = "Applies every ChunkingStrategy to every SourceText that has not been chunked with it yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source-text', type=int, action='append', dest='source_text_ids',
+            help="Restrict to the given SourceText id (repeatable).",
+        )
+        parser.add_argument(
+            '--strategy', type=int, action='append', dest='strategy_ids',
+            help="Restrict to the given ChunkingStrategy id (repeatable).",
+        )
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help="Processes for the non-semantic chunkers (default: number of CPUs).",
+        )
+
+    def handle(self, *args, **options):
+        created, failures = chunking_pipeline.run_chunking_pipeline(
+            source_text_ids=options['source_text_ids'],
+            strategy_ids=options['strategy_ids'],
+            max_workers=options['workers'],
+        )
+        for title, strategy_name, error in failures:
+            self.stderr.write(self.style.ERROR(f"'{strategy_name}' on '{title}': {error}"))
+        self.stdout.write(self.style.SUCCESS(f"{len(created)} chunk sets created, {len(failures)} failed."))
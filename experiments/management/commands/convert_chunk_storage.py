@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+from django.db.models.functions import Length
+
+from experiments.models import Chunk, ChunkSet
+from experiments.service import chunk_storage
+
+
+class Command(BaseCommand):
+    help = ("Converts existing ChunkSets between inline text storage and offsets-only storage "
+            "(text sliced from the source on demand), or only verifies them.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--to', choices=chunk_storage.STORAGE_MODES, help="Target storage mode.")
+        parser.add_argument(
+            '--chunk-set', type=int, action='append', dest='chunk_set_ids',
+            help="Restrict to the given ChunkSet id (repeatable).",
+        )
+        parser.add_argument('--verify', action='store_true',
+                            help="Check that every chunk can be materialised from its offsets.")
+        parser.add_argument('--rechunk', action='store_true',
+                            help="With --verify: apply each strategy again and compare its output with the chunks.")
+
+    def handle(self, *args, **options):
+        if not options['to'] and not options['verify']:
+            raise CommandError("Nothing to do: pass --to inline|offsets and/or --verify.")
+
+        chunk_sets = ChunkSet.objects.select_related('source_text', 'strategy').order_by('pk')
+        if options['chunk_set_ids']:
+            chunk_sets = chunk_sets.filter(pk__in=options['chunk_set_ids'])
+
+        stored_before = _stored_chars(chunk_sets)
+        failed = 0
+        for chunk_set in chunk_sets:
+            label = f"ChunkSet {chunk_set.pk} ('{chunk_set.source_text.title}' / '{chunk_set.strategy.name}')"
+            if options['to']:
+                try:
+                    n_offsets_only, n_stored = chunk_storage.convert_chunk_set(chunk_set, options['to'])
+                except chunk_storage.ChunkStorageError as e:
+                    self.stderr.write(self.style.ERROR(f"{label}: {e}"))
+                    failed += 1
+                    continue
+                self.stdout.write(f"{label}: {options['to']}, {n_offsets_only} offsets-only, {n_stored} stored.")
+            if options['verify']:
+                problems = chunk_storage.verify_chunk_set(chunk_set, rechunk=options['rechunk'])
+                for problem in problems:
+                    self.stderr.write(self.style.ERROR(f"{label}: {problem}"))
+                failed += bool(problems)
+
+        if options['to']:
+            self.stdout.write(f"Stored chunk text: {stored_before} -> {_stored_chars(chunk_sets)} characters.")
+        if failed:
+            raise CommandError(f"{failed} chunk sets failed.")
+        self.stdout.write(self.style.SUCCESS("Done."))
+
+
+def _stored_chars(chunk_sets) -> int:
+    """Characters of chunk text stored in the DB for the given chunk sets."""
+    total = Chunk.objects.filter(chunk_set__in=chunk_sets).aggregate(
+        total=Sum(Length('stored_text'))
+    )['total']
+    return total or 0
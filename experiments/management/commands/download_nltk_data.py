@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from experiments.service import nltk_resources
+
+
+class Command(BaseCommand):
+    help = "Downloads the NLTK data used for sentence segmentation into settings.NLTK_DATA_DIR (one-time, online)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'packages', nargs='*', default=None,
+            help=f"NLTK packages to download (default: {' '.join(nltk_resources.NLTK_PACKAGES)}).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            nltk_resources.download(options['packages'])
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"NLTK data downloaded to {settings.NLTK_DATA_DIR}."))
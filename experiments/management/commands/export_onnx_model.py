@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from experiments.service import onnx_embedding
+
+
+class Command(BaseCommand):
+    help = ("Exports a sentence-transformers embedding model to ONNX and quantises it to int8, for the "
+            "'<model>@onnx' and '<model>@onnx-int8' embedding backends (needs torch and onnxruntime).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default="BAAI/bge-small-en-v1.5", help="Embedding model name.")
+        parser.add_argument('--no-quantize', action='store_true', help="Only export the fp32 graph.")
+
+    def handle(self, *args, **options):
+        try:
+            model_dir = onnx_embedding.export_model(options['model'], quantize=not options['no_quantize'])
+        except ImportError as e:
+            raise CommandError(f"Missing export dependency: {e}. Install torch, sentence-transformers, "
+                               f"onnx and onnxruntime.") from e
+        self.stdout.write(self.style.SUCCESS(f"'{options['model']}' exported to {model_dir}."))
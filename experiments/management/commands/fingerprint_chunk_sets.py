@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from corpus.models import SourceText
+from corpus.service import source_text_service
+from experiments.models import ChunkingStrategy, ChunkSet
+from experiments.service import chunk_reuse
+
+
+class Command(BaseCommand):
+    help = ("Fills the content hashes of source texts and the source hash / strategy fingerprint "
+            "of existing ChunkSets, so that new equivalent pairs can clone them.")
+
+    def handle(self, *args, **options):
+        hashes = {}
+        for source_text in SourceText.objects.order_by('pk'):
+            try:
+                hashes[source_text.pk] = source_text_service.get_content_hash(source_text)
+            except OSError as e:
+                self.stderr.write(self.style.ERROR(f"'{source_text.title}': {e}"))
+
+        fingerprints = {}
+        for strategy in ChunkingStrategy.objects.order_by('pk'):
+            try:
+                fingerprints[strategy.pk] = chunk_reuse.strategy_fingerprint(strategy)
+            except ValueError as e:
+                self.stderr.write(self.style.WARNING(f"Strategy '{strategy.name}': {e}"))
+
+        updated = 0
+        for chunk_set in ChunkSet.objects.order_by('pk'):
+            fields = []
+            # Sets without a hash were chunked from the current file (offsets sets always record theirs)
+            if not chunk_set.source_hash and chunk_set.source_text_id in hashes:
+                chunk_set.source_hash = hashes[chunk_set.source_text_id]
+                fields.append('source_hash')
+            if not chunk_set.strategy_fingerprint and chunk_set.strategy_id in fingerprints:
+                chunk_set.strategy_fingerprint = fingerprints[chunk_set.strategy_id]
+                fields.append('strategy_fingerprint')
+            if fields:
+                chunk_set.save(update_fields=fields)
+                updated += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(hashes)} source texts hashed, {len(fingerprints)} strategies fingerprinted, "
+            f"{updated} chunk sets updated."
+        ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from corpus.models import SourceText
+from corpus.service import source_text_service
+from experiments.service import semantic_chunking
+
+
+class Command(BaseCommand):
+    help = ("Chunks a document with the native semantic engine for several breakpoint percentile "
+            "thresholds, embedding its sentences only once, and prints the resulting chunk statistics.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('source_text_id', type=int)
+        parser.add_argument('--model', default="BAAI/bge-small-en-v1.5", help="Embedding model name.")
+        parser.add_argument('--buffer-size', type=int, default=1)
+        parser.add_argument(
+            '--thresholds', type=float, nargs='+', default=[80, 85, 90, 95, 98],
+            help="Breakpoint percentile thresholds to evaluate.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            source_text = SourceText.objects.get(pk=options['source_text_id'])
+        except SourceText.DoesNotExist:
+            raise CommandError(f"SourceText {options['source_text_id']} does not exist.")
+
+        content = source_text_service.get_full_text(source_text)
+        results = semantic_chunking.sweep_thresholds(
+            content, options['model'], options['buffer_size'], options['thresholds']
+        )
+
+        self.stdout.write(f"{source_text.title} (buffer_size={options['buffer_size']}, model={options['model']})")
+        self.stdout.write(f"{'threshold':>10} {'chunks':>8} {'mean chars':>11} {'max chars':>10}")
+        for threshold, chunks_data in results.items():
+            lengths = [data['end_char'] - data['start_char'] for data in chunks_data]
+            mean_length = sum(lengths) / len(lengths) if lengths else 0
+            self.stdout.write(f"{threshold:>10g} {len(lengths):>8} {mean_length:>11.1f} {max(lengths, default=0):>10}")
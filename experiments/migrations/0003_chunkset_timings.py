@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0002_rename_document_chunkset_source_text_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunkset',
+            name='timings',
+            field=models.JSONField(blank=True, help_text='Per-stage durations and item counts of the run', null=True),
+        ),
+    ]
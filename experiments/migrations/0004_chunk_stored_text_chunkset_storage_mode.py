@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0003_chunkset_timings'),
+    ]
+
+    operations = [
+        # Same column ('text'), now nullable and read through the Chunk.text property
+        migrations.RenameField(
+            model_name='chunk',
+            old_name='text',
+            new_name='stored_text',
+        ),
+        migrations.AlterField(
+            model_name='chunk',
+            name='stored_text',
+            field=models.TextField(blank=True, db_column='text', null=True),
+        ),
+        migrations.AddField(
+            model_name='chunkset',
+            name='source_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='chunkset',
+            name='storage_mode',
+            field=models.CharField(choices=[('inline', 'Text stored in every chunk'), ('offsets', 'Offsets only, text sliced from the source')], default='inline', max_length=10),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0004_chunk_stored_text_chunkset_storage_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunkset',
+            name='cloned_from',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='clones', to='experiments.chunkset'),
+        ),
+        migrations.AddField(
+            model_name='chunkset',
+            name='strategy_fingerprint',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='chunkset',
+            name='source_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+    ]
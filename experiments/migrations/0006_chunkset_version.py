@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0005_chunkset_fingerprints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunkset',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
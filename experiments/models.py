@@ -49,9 +49,26 @@ class ChunkingStrategy(models.Model):
 
 class ChunkSet(models.Model):
     """Represents the collection of chunks produced by applying a Strategy to a SourceText."""
+    STORAGE_INLINE = 'inline'
+    STORAGE_OFFSETS = 'offsets'
+    STORAGE_CHOICES = [
+        (STORAGE_INLINE, 'Text stored in every chunk'),
+        (STORAGE_OFFSETS, 'Offsets only, text sliced from the source'),
+    ]
     source_text = models.ForeignKey(SourceText, on_delete=models.CASCADE)
     strategy = models.ForeignKey(ChunkingStrategy, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    storage_mode = models.CharField(max_length=10, choices=STORAGE_CHOICES, default=STORAGE_INLINE)
+    # SHA-256 of the source content that was chunked (the offsets refer to it)
+    source_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    # SHA-256 of the normalised method_type and parameters the strategy had when the set was chunked
+    strategy_fingerprint = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    # Set when the chunks were copied from an equivalent set (same source_hash and strategy_fingerprint)
+    cloned_from = models.ForeignKey('self', null=True, blank=True, related_name='clones', on_delete=models.SET_NULL)
+    # Incremented whenever the chunks are replaced in place, so analyses built on older chunks are detected
+    version = models.PositiveIntegerField(default=1)
+    # {'stages': {stage: seconds}, 'counts': {...}, 'total_seconds': ...} of the chunking run
+    timings = models.JSONField(null=True, blank=True, help_text="Per-stage durations and item counts of the run")
 
     class Meta:
         # A source_text + strategy combination should only produce one set of chunks
@@ -61,7 +78,9 @@ class ChunkSet(models.Model):
 class Chunk(models.Model):
     """Represents a single chunk of text within a ChunkSet."""
     chunk_set = models.ForeignKey(ChunkSet, related_name='chunks', on_delete=models.CASCADE)
-    text = models.TextField()
+    # NULL when the text is exactly source[start_char:end_char] and the set uses offsets storage:
+    # read it through the `text` property, which slices it from the source on demand
+    stored_text = models.TextField(db_column='text', null=True, blank=True)
     chunk_index = models.PositiveIntegerField(help_text="Order of the chunk within the set (0-based)")
     # Store location within the original source text for analysis
     start_char = models.PositiveIntegerField()
@@ -72,6 +91,19 @@ class Chunk(models.Model):
         ordering = ['chunk_index']
         unique_together = ('chunk_set', 'chunk_index') # Ensure unique index per set
 
+    @property
+    def text(self):
+        """Testo del chunk: quello salvato o, se assente, la porzione del testo sorgente tra gli offset."""
+        if self.stored_text is not None:
+            return self.stored_text
+        from experiments.service import chunk_storage
+
+        return chunk_storage.slice_source(self.chunk_set_id, self.start_char, self.end_char)
+
+    @text.setter
+    def text(self, value):
+        self.stored_text = value
+
     @property
     def length(self):
         """Calcola la lunghezza del chunk basata su start_char e end_char."""
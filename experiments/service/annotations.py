@@ -0,0 +1,40 @@
+# experiments/service/annotations.py
+import logging
+from typing import Dict, List, Tuple
+
+from django.db import transaction
+
+from experiments.models import Experiment, RelevantSentence
+
+logger = logging.getLogger(__name__)
+
+Span = Tuple[int, int]
+
+
+def save_annotations(experiment: Experiment, highlights: Dict[Span, str]) -> Tuple[List[Span], List[Span]]:
+    """
+    Makes the relevant sentences of the experiment equal to `highlights` ({(start, end): text},
+    the complete desired state sent by the annotation page) touching only the changed rows:
+    the ranges no longer highlighted are deleted and the new ones inserted, while unchanged
+    ranges keep their row and annotation time.
+    Returns (added spans, removed spans), sorted.
+    """
+    with transaction.atomic():
+        stored = {
+            (start_char, end_char): pk
+            for pk, start_char, end_char in RelevantSentence.objects.filter(experiment=experiment).values_list(
+                'pk', 'start_char', 'end_char'
+            )
+        }
+        removed = sorted(span for span in stored if span not in highlights)
+        added = sorted(span for span in highlights if span not in stored)
+        if removed:
+            RelevantSentence.objects.filter(pk__in=[stored[span] for span in removed]).delete()
+        if added:
+            RelevantSentence.objects.bulk_create([
+                RelevantSentence(experiment=experiment, text=highlights[span], start_char=span[0], end_char=span[1])
+                for span in added
+            ])
+    logger.info("Annotations of experiment %d: %d added, %d removed, %d unchanged.", experiment.pk, len(added),
+                len(removed), len(stored) - len(removed))
+    return added, removed
@@ -1,64 +1,125 @@
 import json
-from typing import List, Dict, Any
-
-# --- LlamaIndex Imports ---
-from llama_index.core import Document as LlamaDocument
-from llama_index.core.node_parser import (
-    TokenTextSplitter,
-    SentenceSplitter,
-    SemanticSplitterNodeParser,
-)
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+import logging
+from typing import List, Dict, Any, Optional, Tuple
 
 from experiments.models import ChunkingStrategy
 from experiments.service import structure_utils # Importa il tuo modulo con le funzioni custom
+from experiments.service import sentence_segmentation
+from experiments.service import embedding_registry
+from experiments.service import semantic_chunking
+from experiments.service.instrumentation import StageTimings, count_tokens
+
+logger = logging.getLogger(__name__)
 
-import nltk
+# LlamaIndex (e i suoi node parser) viene importato solo nei rami che lo usano:
+# l'import è lento e non serve all'avvio di manage.py, delle view o del worker.
 
-try:
-    nltk.data.find('tokenizers/punkt')
-    print("NLTK 'punkt' tokenizer già scaricato.")
-except LookupError:
-    print("NLTK 'punkt' tokenizer non trovato, avvio il download...")
-    nltk.download('punkt')
-    nltk.download('wordnet')
-    nltk.download('omw-1.4')
-    nltk.download('punkt_tab')
-    print("NLTK 'punkt' tokenizer scaricato.")
 
-def apply_chunking_strategy(strategy: ChunkingStrategy, content: str, source_doc_id: str = "doc") -> List[Dict[str, Any]]:
+def _llama_document(content: str, source_doc_id: str):
+    from llama_index.core import Document as LlamaDocument
 
-    llama_document = LlamaDocument(
+    return LlamaDocument(
         text=content,
         doc_id=str(source_doc_id), # Es. source_text.id o un UUID
         metadata={'source_doc_id': str(source_doc_id)} # Esempio di metadato
     )
 
-    params = strategy.parameters
-    if not isinstance(params, dict): # Assicura che params sia un dizionario
-        try:
-            params = json.loads(params) if isinstance(params, str) else {}
-        except json.JSONDecodeError:
-            print(f"WARN: Parametri per strategia '{strategy.name}' non sono JSON valido. Usati defaults.")
-            params = {}
+
+# Parametri di ogni variante di chunking: {variante: {nome: (conversione, default)}}.
+# Unica fonte dei default: la usano apply_chunking_strategy e il fingerprint delle strategie
+# (due strategie con gli stessi parametri effettivi producono gli stessi chunk).
+PARAMETER_SPECS = {
+    'length': {
+        'chunk_size': (int, 512), 'chunk_overlap': (int, 50), 'separator': (str, " "),
+    },
+    'structure:pure_paragraph': {
+        'paragraph_separator': (str, '\n\n'),
+    },
+    'structure:n_sentence_chunking': {
+        'sentences_per_chunk': (int, 5), 'sentence_overlap': (int, 1),
+    },
+    'structure:sentence_window': {
+        'min_chars_per_chunk': (int, 200), 'max_chars_per_chunk': (int, 500), 'sentence_overlap_chars': (int, 50),
+    },
+    'structure:sentence_splitter': {
+        'chunk_size': (int, 1024), 'chunk_overlap': (int, 200), 'separator': (str, " "),
+        'paragraph_separator': (str, "\n\n\n"),
+    },
+    'semantic:native': {
+        'embed_model_name': (str, None), 'buffer_size': (int, 1), 'breakpoint_percentile_threshold': (float, 95),
+    },
+    'semantic:llama_index': {
+        'embed_model_name': (str, None), 'buffer_size': (int, 1), 'breakpoint_percentile_threshold': (int, 95),
+    },
+}
+CUSTOM_STRUCTURE_TYPES = ('pure_paragraph', 'n_sentence_chunking', 'sentence_window')
+
+
+def parse_parameters(parameters: Any, strategy_name: str = '') -> Dict[str, Any]:
+    """I parametri della strategia come dizionario (accetta anche una stringa JSON)."""
+    if isinstance(parameters, dict):
+        return parameters
+    try:
+        return json.loads(parameters) if isinstance(parameters, str) else {}
+    except json.JSONDecodeError:
+        logger.warning("Parametri per strategia '%s' non sono JSON valido. Usati defaults.", strategy_name)
+        return {}
+
+
+def get_variant(method_type: str, params: Dict[str, Any]) -> str:
+    """La variante (chiave di PARAMETER_SPECS) che apply_chunking_strategy esegue per questi parametri."""
+    if method_type == 'length':
+        return 'length'
+    if method_type == 'structure':
+        # Fallback al SentenceSplitter di LlamaIndex se non specificato un structure_type custom
+        structure_type = params.get('structure_type')
+        return f'structure:{structure_type}' if structure_type in CUSTOM_STRUCTURE_TYPES else 'structure:sentence_splitter'
+    if method_type == 'semantic':
+        return 'semantic:native' if params.get('engine') == 'native' else 'semantic:llama_index'
+    raise ValueError(f"Tipo di metodo di chunking '{method_type}' non supportato.")
+
+
+def effective_parameters(method_type: str, parameters: Any, strategy_name: str = '') -> Tuple[str, Dict[str, Any]]:
+    """
+    (variante, parametri effettivi): i soli parametri letti dalla variante, con i default applicati
+    e i tipi convertiti (es. {"chunk_size": "512"} e {} danno lo stesso risultato per 'length').
+    """
+    params = parse_parameters(parameters, strategy_name)
+    variant = get_variant(method_type, params)
+    effective = {}
+    for name, (convert, default) in PARAMETER_SPECS[variant].items():
+        value = params.get(name)
+        effective[name] = convert(value) if value is not None else default
+    return variant, effective
+
+
+def apply_chunking_strategy(strategy: ChunkingStrategy, content: str, source_doc_id: str = "doc",
+                            timings: Optional[StageTimings] = None) -> List[Dict[str, Any]]:
+    # I tempi delle fasi (model_load, embedding, node_build) e i conteggi finiscono in timings, se passato
+    if timings is None:
+        timings = StageTimings(f"Chunking '{strategy.name}'")
 
     chunks_data_list: List[Dict[str, Any]] = [] # Inizializza qui, sarà popolata in ogni ramo
 
     try:
-        if strategy.method_type == 'length':
-            print(f"LlamaIndex: Configurazione TokenTextSplitter con params: {params}")
+        variant, params = effective_parameters(strategy.method_type, strategy.parameters, strategy.name)
+
+        if variant == 'length':
+            logger.info("LlamaIndex: Configurazione TokenTextSplitter con params: %s", params)
+            from llama_index.core.node_parser import TokenTextSplitter
             node_parser = TokenTextSplitter(
-                chunk_size=int(params.get('chunk_size', 512)),
-                chunk_overlap=int(params.get('chunk_overlap', 50)),
-                separator=params.get('separator', " "),
+                chunk_size=params['chunk_size'],
+                chunk_overlap=params['chunk_overlap'],
+                separator=params['separator'],
             )
             # Esegui il parsing e popola chunks_data_list QUI per 'length'
-            nodes = node_parser.get_nodes_from_documents([llama_document])
+            with timings.stage('node_build'):
+                nodes = node_parser.get_nodes_from_documents([_llama_document(content, source_doc_id)])
             for node in nodes:
                 start_char = node.start_char_idx if node.start_char_idx is not None else -1
                 end_char = node.end_char_idx if node.end_char_idx is not None else -1
                 if start_char == -1 or end_char == -1 or start_char >= end_char:
-                    print(f"WARN: Nodo LlamaIndex (ID: {node.node_id}) con indici non validi/mancanti. Saltato.")
+                    logger.warning("Nodo LlamaIndex (ID: %s) con indici non validi/mancanti. Saltato.", node.node_id)
                     continue
                 chunks_data_list.append({
                     'text': node.text,
@@ -68,37 +129,39 @@ def apply_chunking_strategy(strategy: ChunkingStrategy, content: str, source_doc
                 })
 
 
-        elif strategy.method_type == 'structure':
-            structure_type = params.get('structure_type') # Recupera structure_type qui
-            if structure_type == 'pure_paragraph':
-                paragraph_separator = params.get('paragraph_separator', '\n\n')
-                chunks_data_list = structure_utils._pure_paragraph_split(content, paragraph_separator)
-            elif structure_type == 'n_sentence_chunking':
-                sentences_per_chunk = int(params.get('sentences_per_chunk', 5))
-                sentence_overlap = int(params.get('sentence_overlap', 1))
-                chunks_data_list = structure_utils._n_sentence_chunking(content, sentences_per_chunk, sentence_overlap)
-            elif structure_type == 'sentence_window':
-                min_chars_per_chunk = int(params.get('min_chars_per_chunk', 200))
-                max_chars_per_chunk = int(params.get('max_chars_per_chunk', 500))
-                sentence_overlap_chars = int(params.get('sentence_overlap_chars', 50))
-                chunks_data_list = structure_utils._sentence_window_chunking(content, min_chars_per_chunk, max_chars_per_chunk,
-                                                             sentence_overlap_chars)
+        elif variant.startswith('structure:'):
+            if variant == 'structure:pure_paragraph':
+                with timings.stage('node_build'):
+                    chunks_data_list = structure_utils._pure_paragraph_split(content, params['paragraph_separator'])
+            elif variant == 'structure:n_sentence_chunking':
+                with timings.stage('node_build'):
+                    chunks_data_list = structure_utils._n_sentence_chunking(
+                        content, params['sentences_per_chunk'], params['sentence_overlap'])
+                timings.count(sentences=len(sentence_segmentation.get_sentence_spans(content)))
+            elif variant == 'structure:sentence_window':
+                with timings.stage('node_build'):
+                    chunks_data_list = structure_utils._sentence_window_chunking(
+                        content, params['min_chars_per_chunk'], params['max_chars_per_chunk'],
+                        params['sentence_overlap_chars'])
+                timings.count(sentences=len(sentence_segmentation.get_sentence_spans(content)))
             else:  # Fallback al SentenceSplitter di LlamaIndex se non specificato un structure_type custom
-                print(
-                    f"LlamaIndex: Configurazione SentenceSplitter con params: {params} (No custom structure_type specificato)")
+                logger.info("LlamaIndex: Configurazione SentenceSplitter con params: %s "
+                            "(No custom structure_type specificato)", params)
+                from llama_index.core.node_parser import SentenceSplitter
                 node_parser = SentenceSplitter(
-                    chunk_size=int(params.get('chunk_size', 1024)),
-                    chunk_overlap=int(params.get('chunk_overlap', 200)),
-                    separator=params.get('separator', " "),
-                    paragraph_separator=params.get('paragraph_separator', "\n\n\n"),
+                    chunk_size=params['chunk_size'],
+                    chunk_overlap=params['chunk_overlap'],
+                    separator=params['separator'],
+                    paragraph_separator=params['paragraph_separator'],
                 )
                 # Esegui il parsing e popola chunks_data_list QUI per il fallback 'structure'
-                nodes = node_parser.get_nodes_from_documents([llama_document])
+                with timings.stage('node_build'):
+                    nodes = node_parser.get_nodes_from_documents([_llama_document(content, source_doc_id)])
                 for node in nodes:
                     start_char = node.start_char_idx if node.start_char_idx is not None else -1
                     end_char = node.end_char_idx if node.end_char_idx is not None else -1
                     if start_char == -1 or end_char == -1 or start_char >= end_char:
-                        print(f"WARN: Nodo LlamaIndex (ID: {node.node_id}) con indici non validi/mancanti. Saltato.")
+                        logger.warning("Nodo LlamaIndex (ID: %s) con indici non validi/mancanti. Saltato.", node.node_id)
                         continue
                     chunks_data_list.append({
                         'text': node.text,
@@ -107,31 +170,57 @@ def apply_chunking_strategy(strategy: ChunkingStrategy, content: str, source_doc
                         'metadata': node.metadata if node.metadata else None
                     })
 
-        elif strategy.method_type == 'semantic':
-            print(f"LlamaIndex: Configurazione SemanticSplitterNodeParser con params: {params}")
-            embed_model_name = params.get("embed_model_name")
+        elif variant == 'semantic:native':
+            # Motore nativo: embedding delle frasi in cache, finestre e breakpoint calcolati con NumPy
+            logger.info("Native: Semantic chunking con params: %s", params)
+            embed_model_name = params["embed_model_name"]
+            if not embed_model_name:
+                raise ValueError("Per 'semantic' chunking, 'embed_model_name' è richiesto nei parametri.")
+            # Embedding delle frasi (e caricamento del modello, se serve) misurato a parte:
+            # semantic_chunk poi li ritrova nella cache in memoria
+            with timings.stage('embedding'):
+                sentence_vectors = semantic_chunking.get_sentence_embeddings(content, embed_model_name)
+            with timings.stage('node_build'):
+                chunks_data_list = semantic_chunking.semantic_chunk(
+                    content,
+                    embed_model_name,
+                    buffer_size=params["buffer_size"],
+                    breakpoint_percentile_threshold=params["breakpoint_percentile_threshold"],
+                )
+            timings.count(sentences=len(sentence_vectors))
+
+        else:  # 'semantic:llama_index'
+            logger.info("LlamaIndex: Configurazione SemanticSplitterNodeParser con params: %s", params)
+            embed_model_name = params["embed_model_name"]
             if not embed_model_name:
                 raise ValueError("Per 'semantic' chunking, 'embed_model_name' è richiesto nei parametri.")
 
             try:
-                print(f"Caricamento embedding model: {embed_model_name}")
-                embed_model = HuggingFaceEmbedding(model_name=embed_model_name)
+                # Istanza condivisa del registry: il modello viene caricato una sola volta per processo
+                with timings.stage('model_load'):
+                    embed_model = embedding_registry.get_embed_model(embed_model_name)
             except Exception as e_embed:
-                print(f"ERRORE CRITICO: Impossibile caricare embedding model '{embed_model_name}': {e_embed}")
+                logger.error("Impossibile caricare embedding model '%s': %s", embed_model_name, e_embed)
                 raise ValueError(f"Impossibile caricare embedding model: {embed_model_name}. Dettagli: {e_embed}") from e_embed
 
+            from llama_index.core.node_parser import SemanticSplitterNodeParser
             node_parser = SemanticSplitterNodeParser(
                 embed_model=embed_model,
-                breakpoint_percentile_threshold=int(params.get("breakpoint_percentile_threshold", 95)), # Converti a float
-                buffer_size=int(params.get("buffer_size", 1)),
+                breakpoint_percentile_threshold=params["breakpoint_percentile_threshold"],
+                buffer_size=params["buffer_size"],
+                # Stesse frasi (in cache) delle strategie basate su frasi
+                sentence_splitter=sentence_segmentation.get_sentence_pieces,
             )
             # Esegui il parsing e popola chunks_data_list QUI per 'semantic'
-            nodes = node_parser.get_nodes_from_documents([llama_document])
+            # (il parser calcola gli embedding delle frasi durante il parsing: un'unica fase)
+            with timings.stage('node_build'):
+                nodes = node_parser.get_nodes_from_documents([_llama_document(content, source_doc_id)])
+            timings.count(sentences=len(sentence_segmentation.get_sentence_spans(content)))
             for node in nodes:
                 start_char = node.start_char_idx if node.start_char_idx is not None else -1
                 end_char = node.end_char_idx if node.end_char_idx is not None else -1
                 if start_char == -1 or end_char == -1 or start_char >= end_char:
-                    print(f"WARN: Nodo LlamaIndex (ID: {node.node_id}) con indici non validi/mancanti. Saltato.")
+                    logger.warning("Nodo LlamaIndex (ID: %s) con indici non validi/mancanti. Saltato.", node.node_id)
                     continue
                 chunks_data_list.append({
                     'text': node.text,
@@ -139,18 +228,17 @@ def apply_chunking_strategy(strategy: ChunkingStrategy, content: str, source_doc
                     'end_char': end_char,
                     'metadata': node.metadata if node.metadata else None
                 })
-        else:
-            raise ValueError(f"Tipo di metodo di chunking '{strategy.method_type}' non supportato.")
 
     except ValueError as ve:
-        print(f"Errore di configurazione strategia '{strategy.name}': {ve}")
+        logger.error("Errore di configurazione strategia '%s': %s", strategy.name, ve)
         raise
     except ImportError as ie:
-        print(f"Errore di import LlamaIndex (manca una libreria?): {ie}")
+        logger.error("Errore di import LlamaIndex (manca una libreria?): %s", ie)
         raise ValueError(f"Dipendenza LlamaIndex mancante: {ie}") from ie
     except Exception as e:
-        print(f"ERRORE CRITICO durante l'inizializzazione o l'uso del parser: {e}")
+        logger.exception("Errore critico durante l'inizializzazione o l'uso del parser: %s", e)
         raise Exception(f"Errore generale per strategia '{strategy.name}': {e}") from e
 
-    print(f"ChunkImplementations: Restituiti {len(chunks_data_list)} chunk data per strategia '{strategy.name}'.")
+    timings.count(chunks=len(chunks_data_list), characters=len(content), tokens=count_tokens(content))
+    logger.info("ChunkImplementations: Restituiti %d chunk data per strategia '%s'.", len(chunks_data_list), strategy.name)
     return chunks_data_list
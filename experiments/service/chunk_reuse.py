@@ -0,0 +1,83 @@
+# experiments/service/chunk_reuse.py
+import hashlib
+import json
+import logging
+from typing import Optional
+
+from django.db import transaction
+
+from corpus.models import SourceText
+from corpus.service import source_text_service
+from experiments.models import Chunk, ChunkingStrategy, ChunkSet
+from experiments.service import chunk_implementations
+from experiments.service.instrumentation import StageTimings
+
+logger = logging.getLogger(__name__)
+
+CLONE_BATCH_SIZE = 2000
+
+
+def strategy_fingerprint(strategy: ChunkingStrategy) -> str:
+    """
+    SHA-256 of the normalised strategy: the chunker variant and its effective parameters
+    (defaults applied, types converted, keys sorted). Strategies with different names or with
+    parameters that only differ in form ({} vs the explicit defaults, "512" vs 512) share it.
+    """
+    variant, params = chunk_implementations.effective_parameters(strategy.method_type, strategy.parameters,
+                                                                 strategy.name)
+    normalised = json.dumps({'variant': variant, 'parameters': params}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(normalised.encode('utf-8')).hexdigest()
+
+
+def find_equivalent_chunk_set(source_hash: str, fingerprint: str) -> Optional[ChunkSet]:
+    """The oldest ChunkSet chunked from the same content with an equivalent strategy, if any."""
+    if not source_hash or not fingerprint:
+        return None
+    return ChunkSet.objects.filter(source_hash=source_hash, strategy_fingerprint=fingerprint).order_by('pk').first()
+
+
+def clone_chunk_set(original: ChunkSet, source_text: SourceText, strategy: ChunkingStrategy) -> ChunkSet:
+    """
+    Copies the chunks of an equivalent set to a new ChunkSet of (source_text, strategy) in one
+    transaction. Chunk texts are identical, so their embeddings are found in the content-addressed
+    embedding store instead of being computed again.
+    """
+    timings = StageTimings(f"Clone of ChunkSet {original.pk} for '{strategy.name}'")
+    with transaction.atomic():
+        with timings.stage('db_write'):
+            chunk_set = ChunkSet.objects.create(
+                source_text=source_text,
+                strategy=strategy,
+                storage_mode=original.storage_mode,
+                source_hash=original.source_hash,
+                strategy_fingerprint=original.strategy_fingerprint,
+                cloned_from=original,
+            )
+            rows = list(original.chunks.order_by('chunk_index').values_list(
+                'stored_text', 'chunk_index', 'start_char', 'end_char', 'metadata'
+            ))
+            Chunk.objects.bulk_create([
+                Chunk(chunk_set=chunk_set, stored_text=stored_text, chunk_index=chunk_index,
+                      start_char=start_char, end_char=end_char, metadata=metadata)
+                for stored_text, chunk_index, start_char, end_char, metadata in rows
+            ], batch_size=CLONE_BATCH_SIZE)
+        timings.count(chunks=len(rows))
+        chunk_set.timings = timings.as_dict()
+        chunk_set.save(update_fields=['timings'])
+    logger.info("ChunkReuse: ChunkSet %d cloned from %d for '%s' / '%s'.", chunk_set.pk, original.pk,
+                source_text.title, strategy.name)
+    return chunk_set
+
+
+def clone_equivalent(source_text: SourceText, strategy: ChunkingStrategy,
+                     content: Optional[str] = None) -> Optional[ChunkSet]:
+    """
+    Creates the ChunkSet of (source_text, strategy) by cloning an equivalent set, when one exists.
+    Returns None when the pair has to be chunked.
+    """
+    original = find_equivalent_chunk_set(
+        source_text_service.get_content_hash(source_text, content), strategy_fingerprint(strategy)
+    )
+    if original is None:
+        return None
+    return clone_chunk_set(original, source_text, strategy)
@@ -0,0 +1,171 @@
+# experiments/service/chunk_storage.py
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import transaction
+
+from corpus.models import SourceText
+from corpus.service import mapped_text, source_text_service
+from experiments.models import Chunk, ChunkSet
+
+logger = logging.getLogger(__name__)
+
+STORAGE_MODES = [mode for mode, _ in ChunkSet.STORAGE_CHOICES]
+UPDATE_BATCH_SIZE = 500
+
+VERIFIED_SOURCES_CACHE_SIZE = 1024
+
+# LRU cache {ChunkSet pk: (SourceText, content hash checked against the set)}, most recently used
+# last. The mappings themselves stay owned (and dropped on eviction) by mapped_text.
+_verified_sources: 'OrderedDict[int, Tuple[SourceText, str]]' = OrderedDict()
+_verified_sources_lock = threading.Lock()
+
+
+class ChunkStorageError(ValueError):
+    """The offsets of a chunk set cannot be resolved against its source text."""
+
+
+def get_storage_mode(storage_mode: Optional[str] = None) -> str:
+    """The requested storage mode, or settings.CHUNK_STORAGE_MODE (inline by default)."""
+    storage_mode = storage_mode or getattr(settings, 'CHUNK_STORAGE_MODE', ChunkSet.STORAGE_INLINE)
+    if storage_mode not in STORAGE_MODES:
+        raise ValueError(f"Unknown chunk storage mode '{storage_mode}'. Available: {', '.join(STORAGE_MODES)}")
+    return storage_mode
+
+
+def stored_texts(source: mapped_text.MappedText, chunks_data: Sequence[Dict[str, Any]]) -> List[Optional[str]]:
+    """
+    Text to store for each chunk in offsets mode: None when the chunker's text is exactly
+    source[start_char:end_char] (checked here, chunk by chunk), the text itself otherwise.
+    This is what guarantees that materialised chunks are identical to the chunker output.
+    """
+    return [
+        None if source.slice(data['start_char'], data['end_char']) == data['text'] else data['text']
+        for data in chunks_data
+    ]
+
+
+def _mapped_source(chunk_set_id: int) -> mapped_text.MappedText:
+    with _verified_sources_lock:
+        verified = _verified_sources.get(chunk_set_id)
+        if verified is not None:
+            _verified_sources.move_to_end(chunk_set_id)
+    if verified is not None:
+        source_text, content_hash = verified
+        mapped = mapped_text.get_mapped_text(source_text)
+        if mapped.content_hash == content_hash:
+            return mapped
+
+    # Not checked yet, or the source was mapped again since: check it against the set
+    chunk_set = ChunkSet.objects.select_related('source_text').get(pk=chunk_set_id)
+    mapped = mapped_text.get_mapped_text(chunk_set.source_text)
+    if chunk_set.source_hash and chunk_set.source_hash != mapped.content_hash:
+        raise ChunkStorageError(
+            f"The file of '{chunk_set.source_text.title}' changed after ChunkSet {chunk_set_id} was chunked: "
+            f"its offsets no longer match the text."
+        )
+    with _verified_sources_lock:
+        _verified_sources[chunk_set_id] = (chunk_set.source_text, mapped.content_hash)
+        while len(_verified_sources) > VERIFIED_SOURCES_CACHE_SIZE:
+            _verified_sources.popitem(last=False)
+    return mapped
+
+
+def forget_chunk_set(chunk_set_id: int) -> None:
+    """Drops the checked source of a set whose chunks or source hash were just rewritten."""
+    with _verified_sources_lock:
+        _verified_sources.pop(chunk_set_id, None)
+
+
+def slice_source(chunk_set_id: int, start_char: int, end_char: int) -> str:
+    """Text of an offsets-only chunk, read from the memory-mapped source of its set."""
+    return _mapped_source(chunk_set_id).slice(start_char, end_char)
+
+
+def chunk_texts(chunk_set_id: int) -> List[Tuple[int, str]]:
+    """(pk, text) of every chunk of the set ordered by chunk_index, without loading Chunk objects."""
+    rows = Chunk.objects.filter(chunk_set_id=chunk_set_id).order_by('chunk_index').values_list(
+        'pk', 'stored_text', 'start_char', 'end_char'
+    )
+    source = None
+    texts = []
+    for pk, text, start_char, end_char in rows:
+        if text is None:
+            source = source or _mapped_source(chunk_set_id)
+            text = source.slice(start_char, end_char)
+        texts.append((pk, text))
+    return texts
+
+
+def convert_chunk_set(chunk_set: ChunkSet, storage_mode: str) -> Tuple[int, int]:
+    """
+    Moves an existing chunk set to the given storage mode. Going to offsets, the text of a chunk
+    is dropped only if it is exactly the source slice between its offsets; the others keep it.
+    Returns (offsets-only chunks, chunks with stored text).
+    """
+    storage_mode = get_storage_mode(storage_mode)
+    forget_chunk_set(chunk_set.pk)
+    source = mapped_text.get_mapped_text(chunk_set.source_text)
+    if chunk_set.storage_mode == ChunkSet.STORAGE_OFFSETS:
+        _mapped_source(chunk_set.pk)  # Refuses to touch a set whose source changed since it was chunked
+
+    chunks = list(chunk_set.chunks.order_by('chunk_index').only('pk', 'stored_text', 'start_char', 'end_char'))
+    changed = []
+    for chunk in chunks:
+        if storage_mode == ChunkSet.STORAGE_OFFSETS:
+            if chunk.stored_text is not None and chunk.stored_text == source.slice(chunk.start_char, chunk.end_char):
+                chunk.stored_text = None
+                changed.append(chunk)
+        elif chunk.stored_text is None:
+            chunk.stored_text = source.slice(chunk.start_char, chunk.end_char)
+            changed.append(chunk)
+
+    with transaction.atomic():
+        Chunk.objects.bulk_update(changed, ['stored_text'], batch_size=UPDATE_BATCH_SIZE)
+        chunk_set.storage_mode = storage_mode
+        chunk_set.source_hash = source.content_hash
+        chunk_set.save(update_fields=['storage_mode', 'source_hash'])
+    forget_chunk_set(chunk_set.pk)
+
+    n_offsets_only = sum(1 for chunk in chunks if chunk.stored_text is None)
+    logger.info("ChunkStorage: ChunkSet %d -> %s, %d offsets-only and %d stored chunks.",
+                chunk_set.pk, storage_mode, n_offsets_only, len(chunks) - n_offsets_only)
+    return n_offsets_only, len(chunks) - n_offsets_only
+
+
+def verify_chunk_set(chunk_set: ChunkSet, rechunk: bool = False) -> List[str]:
+    """
+    Checks that the chunks of the set can be materialised: the source is unchanged and the
+    offsets are inside it. With rechunk=True the strategy is applied again and its output
+    (offsets and text) is compared with the materialised chunks.
+    Returns the problems found (empty list when the set is consistent).
+    """
+    problems = []
+    forget_chunk_set(chunk_set.pk)
+    try:
+        source = _mapped_source(chunk_set.pk)
+    except ChunkStorageError as e:
+        return [str(e)]
+
+    rows = list(chunk_set.chunks.order_by('chunk_index').values_list(
+        'chunk_index', 'stored_text', 'start_char', 'end_char'
+    ))
+    for chunk_index, text, start_char, end_char in rows:
+        if text is None and not 0 <= start_char < end_char <= len(source):
+            problems.append(f"chunk {chunk_index}: offsets [{start_char}, {end_char}) outside the source text")
+
+    if rechunk and not problems:
+        from experiments.service import chunk_implementations
+
+        content = source_text_service.get_full_text(chunk_set.source_text)
+        expected = chunk_implementations.apply_chunking_strategy(chunk_set.strategy, content)
+        if len(expected) != len(rows):
+            problems.append(f"the strategy now produces {len(expected)} chunks, the set has {len(rows)}")
+        for data, (chunk_index, text, start_char, end_char) in zip(expected, rows):
+            materialised = text if text is not None else source.slice(start_char, end_char)
+            if (data['start_char'], data['end_char'], data['text']) != (start_char, end_char, materialised):
+                problems.append(f"chunk {chunk_index}: differs from the chunker output")
+    return problems
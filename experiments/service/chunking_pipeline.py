@@ -0,0 +1,246 @@
+# experiments/service/chunking_pipeline.py
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+
+import django
+from django.db import transaction
+
+from corpus.models import SourceText
+from corpus.service import mapped_text, source_text_service
+from experiments.models import ChunkingStrategy, ChunkSet, Chunk
+from experiments.service import chunk_implementations, chunk_reuse, chunk_storage
+from experiments.service.instrumentation import StageTimings
+
+logger = logging.getLogger(__name__)
+
+
+def _texts_to_store(source_text: SourceText, chunks_data: List[Dict[str, Any]], storage_mode: str,
+                    timings: StageTimings) -> Tuple[str, List[Optional[str]]]:
+    """(source hash, text to store for each chunk) of a chunker output in the given storage mode."""
+    source_hash = source_text_service.get_content_hash(source_text)
+    texts = [data['text'] for data in chunks_data]
+    if storage_mode == ChunkSet.STORAGE_OFFSETS:
+        source = mapped_text.get_mapped_text(source_text)
+        source_hash = source.content_hash
+        texts = chunk_storage.stored_texts(source, chunks_data)
+        timings.count(offsets_only_chunks=sum(1 for text in texts if text is None))
+    return source_hash, texts
+
+
+def _create_chunks(chunk_set: ChunkSet, chunks_data: List[Dict[str, Any]], texts: List[Optional[str]]) -> None:
+    Chunk.objects.bulk_create([
+        Chunk(
+            chunk_set=chunk_set,
+            stored_text=text,
+            chunk_index=i,
+            start_char=data['start_char'],
+            end_char=data['end_char'],
+        )
+        for i, (data, text) in enumerate(zip(chunks_data, texts))
+    ])
+
+
+def save_chunk_set(source_text: SourceText, strategy: ChunkingStrategy, chunks_data: List[Dict[str, Any]],
+                   timings: Optional[StageTimings] = None, storage_mode: Optional[str] = None) -> ChunkSet:
+    """
+    Creates the ChunkSet and bulk-inserts its chunks in a single transaction.
+    With the offsets storage mode (settings.CHUNK_STORAGE_MODE or storage_mode) only the offsets
+    of a chunk are stored when its text is verified to be the exact slice of the source.
+    The timings of the chunking run, completed with the db_write stage, are stored on the ChunkSet,
+    together with the source hash and strategy fingerprint that let equivalent pairs clone it.
+    """
+    if timings is None:
+        timings = StageTimings(f"Chunking '{strategy.name}'")
+    storage_mode = chunk_storage.get_storage_mode(storage_mode)
+    source_hash, texts = _texts_to_store(source_text, chunks_data, storage_mode, timings)
+
+    with transaction.atomic():
+        with timings.stage('db_write'):
+            chunk_set = ChunkSet.objects.create(
+                source_text=source_text, strategy=strategy, storage_mode=storage_mode, source_hash=source_hash,
+                strategy_fingerprint=chunk_reuse.strategy_fingerprint(strategy),
+            )
+            _create_chunks(chunk_set, chunks_data, texts)
+        chunk_set.timings = timings.as_dict()
+        chunk_set.save(update_fields=['timings'])
+    timings.log_summary()
+    return chunk_set
+
+
+def rechunk_chunk_set(chunk_set: ChunkSet) -> Tuple[bool, int]:
+    """
+    Applies the current strategy parameters to the current source file of an existing set.
+    When the output is identical to the stored chunks only the source hash and strategy
+    fingerprint are updated; otherwise the chunks are replaced in place (the set keeps its pk,
+    its storage mode and its analyses) and the version is incremented, which makes every
+    analysis built on the old chunks stale.
+    Replacing the chunks also deletes, in the same transaction, the simulations run on the old
+    ones (their retrieved chunks, rankings and results cube cells): their scores and chunk ids
+    would no longer match anything. The manual ranks of the old relevant chunks go with them.
+    Returns (True when the chunks were replaced, number of simulations deleted).
+    """
+    source_text, strategy = chunk_set.source_text, chunk_set.strategy
+    timings = StageTimings(f"Rechunking '{strategy.name}' on '{source_text.title}'")
+    content = source_text_service.get_full_text(source_text)
+    source_hash = source_text_service.get_content_hash(source_text, content, refresh=True)
+    # A set without a source hash predates hashing: its text is stored inline, so it can still be compared
+    source_changed = bool(chunk_set.source_hash) and chunk_set.source_hash != source_hash
+    if source_changed:
+        mapped_text.forget(source_text.pk)
+    chunks_data = chunk_implementations.apply_chunking_strategy(strategy, content, timings=timings)
+
+    unchanged = False
+    if not source_changed:
+        # The old offsets still refer to this content, so offsets-only chunks can be materialised
+        stored = Chunk.objects.filter(chunk_set=chunk_set).order_by('chunk_index').values_list('start_char', 'end_char')
+        stored_texts = [text for _, text in chunk_storage.chunk_texts(chunk_set.pk)]
+        unchanged = [(data['start_char'], data['end_char'], data['text']) for data in chunks_data] == [
+            (start_char, end_char, text) for (start_char, end_char), text in zip(stored, stored_texts)
+        ]
+
+    fingerprint = chunk_reuse.strategy_fingerprint(strategy)
+    if unchanged:
+        ChunkSet.objects.filter(pk=chunk_set.pk).update(source_hash=source_hash, strategy_fingerprint=fingerprint)
+        chunk_set.source_hash, chunk_set.strategy_fingerprint = source_hash, fingerprint
+        logger.info("ChunkingPipeline: ChunkSet %d unchanged by rechunking.", chunk_set.pk)
+        return False, 0
+
+    # Imported here: the evaluation services depend on this module
+    from evaluation.models import RetrievalSimulation
+    from evaluation.service import results_cube
+
+    source_hash, texts = _texts_to_store(source_text, chunks_data, chunk_set.storage_mode, timings)
+    with transaction.atomic():
+        with timings.stage('db_write'):
+            simulations = RetrievalSimulation.objects.filter(analysis__chunk_set=chunk_set)
+            analysis_ids = set(simulations.values_list('analysis_id', flat=True))
+            n_simulations = simulations.count()
+            simulations.delete()  # Cascades to their retrieved chunks and results cube cells
+            results_cube.refresh_cells(analysis_ids)
+            # Cascades to the relevant chunks of the old version
+            Chunk.objects.filter(chunk_set=chunk_set).delete()
+            _create_chunks(chunk_set, chunks_data, texts)
+            chunk_set.source_hash = source_hash
+            chunk_set.strategy_fingerprint = fingerprint
+            chunk_set.version += 1
+            chunk_set.cloned_from = None
+        chunk_set.timings = timings.as_dict()
+        chunk_set.save(update_fields=['source_hash', 'strategy_fingerprint', 'version', 'cloned_from', 'timings'])
+    chunk_storage.forget_chunk_set(chunk_set.pk)
+    timings.log_summary()
+    logger.info("ChunkingPipeline: ChunkSet %d rechunked, %d chunks (version %d), %d simulations of the old "
+                "chunks deleted.", chunk_set.pk, len(chunks_data), chunk_set.version, n_simulations)
+    return True, n_simulations
+
+
+def find_missing_pairs(source_text_ids: Optional[List[int]] = None,
+                       strategy_ids: Optional[List[int]] = None) -> List[Tuple[SourceText, ChunkingStrategy]]:
+    """Returns the (SourceText, ChunkingStrategy) pairs of the cross product that have no ChunkSet yet."""
+    source_texts = SourceText.objects.all().order_by('pk')
+    strategies = ChunkingStrategy.objects.all().order_by('pk')
+    if source_text_ids:
+        source_texts = source_texts.filter(pk__in=source_text_ids)
+    if strategy_ids:
+        strategies = strategies.filter(pk__in=strategy_ids)
+
+    existing = set(ChunkSet.objects.values_list('source_text_id', 'strategy_id'))
+    strategies = list(strategies)
+    return [
+        (source_text, strategy)
+        for source_text in source_texts
+        for strategy in strategies
+        if (source_text.pk, strategy.pk) not in existing
+    ]
+
+
+def _init_worker():
+    """Makes sure Django is configured in the worker process (needed with the 'spawn' start method)."""
+    django.setup()
+
+
+def _chunk_in_worker(strategy_name: str, method_type: str, parameters: Any,
+                     content: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Runs one chunking job in a worker process, on an unsaved copy of the strategy.
+    Returns the chunks data and the stage timings of the run (as a dict, to cross the process boundary).
+    """
+    strategy = ChunkingStrategy(name=strategy_name, method_type=method_type, parameters=parameters)
+    timings = StageTimings(f"Chunking '{strategy_name}'")
+    chunks_data = chunk_implementations.apply_chunking_strategy(strategy, content, timings=timings)
+    return chunks_data, timings.as_dict()
+
+
+def _reuse_key(source_text: SourceText, strategy: ChunkingStrategy, content: str) -> Tuple[str, str]:
+    """(content hash, strategy fingerprint); pairs with the same key produce the same chunks."""
+    try:
+        fingerprint = chunk_reuse.strategy_fingerprint(strategy)
+    except ValueError:
+        # Invalid parameters: never shared, the chunking job reports the error
+        fingerprint = f'invalid-{strategy.pk}'
+    return source_text_service.get_content_hash(source_text, content), fingerprint
+
+
+def run_chunking_pipeline(source_text_ids: Optional[List[int]] = None, strategy_ids: Optional[List[int]] = None,
+                          max_workers: Optional[int] = None) -> Tuple[List[ChunkSet], List[Tuple[str, str, str]]]:
+    """
+    Applies every strategy to every document that has not been chunked with it yet.
+    Pairs equivalent to an existing ChunkSet (same content hash and strategy fingerprint) are
+    cloned from it; among equivalent pending pairs only the first is chunked, the others are
+    cloned once it is saved.
+    CPU-bound chunkers run in a process pool; semantic strategies all go to one dedicated
+    worker, so the embedding model is loaded once and stays warm. Each ChunkSet is written
+    by the main process in its own short transaction as soon as its job completes.
+    Returns (created chunk sets, [(document title, strategy name, error)]).
+    """
+    pairs = find_missing_pairs(source_text_ids, strategy_ids)
+    if not pairs:
+        logger.info("ChunkingPipeline: nothing to do, every document/strategy pair has a ChunkSet.")
+        return [], []
+
+    logger.info("ChunkingPipeline: %d document/strategy pairs to chunk.", len(pairs))
+    contents = {}
+    for source_text, _ in pairs:
+        if source_text.pk not in contents:
+            contents[source_text.pk] = source_text_service.get_full_text(source_text)
+
+    created, failures = [], []
+    # {reuse key: [pairs]}: the first pair of each group is chunked, the others clone its ChunkSet
+    groups: Dict[Tuple[str, str], List[Tuple[SourceText, ChunkingStrategy]]] = {}
+    for source_text, strategy in pairs:
+        key = _reuse_key(source_text, strategy, contents[source_text.pk])
+        original = chunk_reuse.find_equivalent_chunk_set(*key)
+        if original is not None:
+            created.append(chunk_reuse.clone_chunk_set(original, source_text, strategy))
+        else:
+            groups.setdefault(key, []).append((source_text, strategy))
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as cpu_pool, \
+            ProcessPoolExecutor(max_workers=1, initializer=_init_worker) as semantic_pool:
+        futures = {}
+        for group in groups.values():
+            source_text, strategy = group[0]
+            pool = semantic_pool if strategy.method_type == 'semantic' else cpu_pool
+            future = pool.submit(
+                _chunk_in_worker, strategy.name, strategy.method_type, strategy.parameters, contents[source_text.pk]
+            )
+            futures[future] = group
+
+        for future in as_completed(futures):
+            group = futures[future]
+            source_text, strategy = group[0]
+            try:
+                chunks_data, timings_data = future.result()
+                timings = StageTimings.from_dict(timings_data, f"Chunking '{strategy.name}' on '{source_text.title}'")
+                chunk_set = save_chunk_set(source_text, strategy, chunks_data, timings)
+            except Exception as e:
+                logger.error("ChunkingPipeline: '%s' failed on '%s': %s", strategy.name, source_text.title, e)
+                failures.extend((source_text.title, strategy.name, str(e)) for source_text, strategy in group)
+                continue
+            logger.info("ChunkingPipeline: ChunkSet %d created for '%s' / '%s'.", chunk_set.pk, source_text.title,
+                        strategy.name)
+            created.append(chunk_set)
+            for source_text, strategy in group[1:]:
+                created.append(chunk_reuse.clone_chunk_set(chunk_set, source_text, strategy))
+
+    return created, failures
@@ -0,0 +1,168 @@
+# experiments/service/embedding_registry.py
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from experiments.service.instrumentation import StageTimings, count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Default maximum number of texts per forward pass, overridable with settings.EMBEDDING_BATCH_SIZE
+DEFAULT_BATCH_SIZE = 256
+# Default padded tokens per forward pass (texts x longest text), overridable with
+# settings.EMBEDDING_TOKEN_BUDGET: 32 texts of 512 tokens, the worst case of fixed batches of 32
+DEFAULT_TOKEN_BUDGET = 16384
+# Token length of texts when the model does not say: longer texts are truncated to it
+DEFAULT_MAX_TOKENS = 512
+
+# Model names select their backend with a suffix: 'BAAI/bge-small-en-v1.5' runs on PyTorch
+# (HuggingFaceEmbedding), 'BAAI/bge-small-en-v1.5@onnx-int8' on ONNX Runtime (onnx_embedding.py)
+BACKEND_SEPARATOR = '@'
+BACKEND_TORCH = 'torch'
+BACKENDS = (BACKEND_TORCH, 'onnx', 'onnx-int8')
+
+# {model name: embedding model}; HuggingFace models are imported and loaded on first use only
+_models: Dict[str, Any] = {}
+_models_lock = threading.Lock()
+
+
+def get_batch_size(batch_size: Optional[int] = None) -> int:
+    return batch_size or getattr(settings, 'EMBEDDING_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+
+def get_token_budget(token_budget: Optional[int] = None) -> int:
+    return token_budget or getattr(settings, 'EMBEDDING_TOKEN_BUDGET', DEFAULT_TOKEN_BUDGET)
+
+
+def split_model_name(model_name: str) -> Tuple[str, str]:
+    """'BAAI/bge-small-en-v1.5@onnx-int8' -> ('BAAI/bge-small-en-v1.5', 'onnx-int8'); no suffix is PyTorch."""
+    base_name, _, backend = model_name.partition(BACKEND_SEPARATOR)
+    backend = backend or BACKEND_TORCH
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}' in '{model_name}' (expected one of {BACKENDS}).")
+    return base_name, backend
+
+
+def with_backend(model_name: str, backend: str) -> str:
+    """The name of the same model on another backend."""
+    base_name, _ = split_model_name(model_name)
+    return base_name if backend == BACKEND_TORCH else f'{base_name}{BACKEND_SEPARATOR}{backend}'
+
+
+def _load_model(model_name: str):
+    base_name, backend = split_model_name(model_name)
+    if backend == BACKEND_TORCH:
+        # Imported here: it pulls in torch and transformers, which only embedding work needs
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+        return HuggingFaceEmbedding(model_name=base_name, embed_batch_size=get_batch_size())
+    from experiments.service import onnx_embedding
+    return onnx_embedding.load_model(base_name, backend, get_batch_size())
+
+
+def get_embed_model(model_name: str):
+    """
+    Returns the process-wide instance of the embedding model, loading it on first use.
+    Every caller (semantic chunking, retrieval, scripts) shares the same weights.
+    """
+    model = _models.get(model_name)
+    if model is not None:
+        return model
+
+    with _models_lock:
+        model = _models.get(model_name)  # Another thread may have loaded it while we waited
+        if model is None:
+            logger.info("EmbeddingRegistry: loading embedding model '%s'...", model_name)
+            try:
+                model = _load_model(model_name)
+            except Exception as e:
+                logger.exception("EmbeddingRegistry: could not load embedding model '%s'.", model_name)
+                raise ValueError(f"Could not load embedding model: {model_name}. Details: {e}") from e
+            _models[model_name] = model
+            logger.info("EmbeddingRegistry: model '%s' loaded.", model_name)
+    return model
+
+
+def register_model(model_name: str, model) -> None:
+    """Registers an already built embedding model under the given name (e.g. a local stand-in)."""
+    with _models_lock:
+        _models[model_name] = model
+
+
+def _token_counter(model) -> Callable[[List[str]], List[int]]:
+    """
+    Token lengths with the model's own tokenizer: OnnxEmbedding.token_lengths, the fast tokenizer
+    of a sentence-transformers model, or whitespace tokens for models without one (stand-ins).
+    """
+    token_lengths = getattr(model, 'token_lengths', None)
+    if token_lengths is not None:
+        return token_lengths
+    tokenizer = getattr(getattr(getattr(model, '_model', None), 'tokenizer', None), 'backend_tokenizer', None)
+    if tokenizer is not None:
+        return lambda texts: [sum(encoding.attention_mask) for encoding in tokenizer.encode_batch(texts)]
+    return lambda texts: [count_tokens(text) for text in texts]
+
+
+def token_lengths(model, texts: List[str]) -> List[int]:
+    """Token length of each text for the model, capped at the length it truncates its inputs to."""
+    max_tokens = (getattr(model, 'max_length', None)
+                  or getattr(getattr(model, '_model', None), 'max_seq_length', None) or DEFAULT_MAX_TOKENS)
+    return [min(length, max_tokens) for length in _token_counter(model)(texts)]
+
+
+def plan_batches(lengths: Sequence[int], token_budget: int, max_batch_size: int) -> List[np.ndarray]:
+    """
+    Groups text indices into batches of similar length, longest first, so that each batch pads
+    to as few tokens as possible: a batch grows while (texts x its longest text) stays within
+    token_budget and it has fewer than max_batch_size texts. Every batch has at least one text.
+    """
+    order = np.argsort(-np.asarray(lengths, dtype=np.int64), kind='stable')
+    batches, start = [], 0
+    while start < len(order):
+        longest = max(1, int(lengths[order[start]]))
+        size = max(1, min(max_batch_size, token_budget // longest, len(order) - start))
+        batches.append(order[start: start + size])
+        start += size
+    return batches
+
+
+def embed_texts(model_name: str, texts: Sequence[str], batch_size: Optional[int] = None,
+                token_budget: Optional[int] = None, timings: Optional[StageTimings] = None) -> np.ndarray:
+    """
+    Embeds documents/chunks in length-sorted batches under a padded-token budget (plan_batches),
+    returning a (len(texts), dim) float32 matrix in the order of texts.
+    Tokens, padded tokens and batches are logged with the throughput and added to timings, when given.
+    """
+    model = get_embed_model(model_name)
+    texts = list(texts)
+    if not texts:
+        return np.asarray([], dtype=np.float32)
+    lengths = token_lengths(model, texts)
+    batches = plan_batches(lengths, get_token_budget(token_budget), get_batch_size(batch_size))
+
+    start = time.perf_counter()
+    vectors: List[Any] = [None] * len(texts)
+    padded_tokens = 0
+    for batch in batches:
+        for index, vector in zip(batch, model.get_text_embedding_batch([texts[i] for i in batch])):
+            vectors[index] = vector
+        padded_tokens += len(batch) * max(1, lengths[batch[0]])
+    elapsed = time.perf_counter() - start
+
+    tokens = sum(lengths)
+    logger.info("EmbeddingRegistry: %d texts, %d tokens in %d batches with '%s' (padding ratio %.2f, %.0f tokens/s).",
+                len(texts), tokens, len(batches), model_name, padded_tokens / max(1, tokens),
+                tokens / elapsed if elapsed else 0)
+    if timings is not None:
+        timings.count(embedded_texts=len(texts), embedded_tokens=tokens, padded_tokens=padded_tokens,
+                      embedding_batches=len(batches))
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def embed_queries(model_name: str, queries: Sequence[str]) -> np.ndarray:
+    """Embeds search queries (with the model's query instruction), returning a float32 matrix."""
+    model = get_embed_model(model_name)
+    return np.asarray([model.get_query_embedding(query) for query in queries], dtype=np.float32)
@@ -0,0 +1,79 @@
+# experiments/service/instrumentation.py
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Stage names in pipeline order; the timing report shows its columns in this order
+STAGES = ['model_load', 'node_build', 'embedding', 'index_build', 'query', 'scoring', 'db_write']
+
+
+def count_tokens(text: str) -> int:
+    """Whitespace-separated tokens: a model-independent size measure of a text."""
+    return len(text.split())
+
+
+class StageTimings:
+    """
+    Wall-clock durations of the stages of one run (chunking a document, one retrieval
+    simulation) plus the item counts it processed. Serialised with as_dict() into the
+    JSON `timings` field of ChunkSet and RetrievalSimulation.
+    """
+
+    def __init__(self, label: str = ''):
+        self.label = label
+        self.stages: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]], label: str = '') -> 'StageTimings':
+        """Rebuilds the timings of a run measured elsewhere (e.g. in a worker process)."""
+        timings = cls(label)
+        if data:
+            timings.stages.update(data.get('stages', {}))
+            timings.counts.update(data.get('counts', {}))
+        return timings
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Times the enclosed block; repeated stages of the same name are summed."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            logger.debug("%s: %s %.3fs", self.label, name, elapsed)
+
+    def count(self, **counts: int) -> None:
+        """Records item counts (chunks, tokens, sentences, ...) of the run."""
+        self.counts.update({name: int(value) for name, value in counts.items()})
+
+    def share(self, runs: int) -> 'StageTimings':
+        """
+        Per-run share of timings measured once for a group of runs (e.g. the simulations of a
+        ChunkSet, embedded and queried together): every stage is divided evenly, the counts are
+        kept and group_size records how many runs shared them.
+        """
+        shared = StageTimings(self.label)
+        shared.stages = {name: seconds / max(1, runs) for name, seconds in self.stages.items()}
+        shared.counts = {**self.counts, 'group_size': runs}
+        return shared
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.stages.values())
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'stages': {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            'counts': dict(self.counts),
+            'total_seconds': round(self.total_seconds, 6),
+        }
+
+    def log_summary(self) -> None:
+        stages = ', '.join(f"{name}={seconds:.3f}s" for name, seconds in self.stages.items())
+        counts = ', '.join(f"{name}={value}" for name, value in self.counts.items())
+        logger.info("%s: total %.3fs (%s) [%s]", self.label, self.total_seconds, stages, counts)
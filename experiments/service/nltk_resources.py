@@ -0,0 +1,46 @@
+# experiments/service/nltk_resources.py
+from django.conf import settings
+
+# Packages fetched by the download_nltk_data command (punkt for NLTK < 3.8.2)
+NLTK_PACKAGES = ['punkt_tab', 'punkt']
+
+_configured = False
+
+
+def configure_data_path() -> None:
+    """Puts settings.NLTK_DATA_DIR first in the NLTK search path (once per process)."""
+    global _configured
+    if _configured:
+        return
+    import nltk
+
+    data_dir = getattr(settings, 'NLTK_DATA_DIR', None)
+    if data_dir and data_dir not in nltk.data.path:
+        nltk.data.path.insert(0, data_dir)
+    _configured = True
+
+
+def require(resource_path: str) -> None:
+    """
+    Checks that an NLTK resource is available locally. It never downloads: a missing
+    resource is an error that points to the download_nltk_data command.
+    """
+    configure_data_path()
+    import nltk
+
+    try:
+        nltk.data.find(resource_path)
+    except LookupError:
+        raise LookupError(
+            f"NLTK resource '{resource_path}' not found in {getattr(settings, 'NLTK_DATA_DIR', None)} "
+            f"nor in the default NLTK paths. Run 'python manage.py download_nltk_data' once."
+        ) from None
+
+
+def download(packages=None) -> None:
+    """Downloads the NLTK packages into settings.NLTK_DATA_DIR (needs network)."""
+    import nltk
+
+    for package in packages or NLTK_PACKAGES:
+        if not nltk.download(package, download_dir=settings.NLTK_DATA_DIR, quiet=True):
+            raise RuntimeError(f"Download of NLTK package '{package}' failed.")
@@ -0,0 +1,223 @@
+# experiments/service/onnx_embedding.py
+"""
+ONNX Runtime backend for the sentence-transformers embedding models (e.g. BAAI/bge-small-en-v1.5).
+
+The transformer is exported once to an ONNX graph (export_model, which needs torch and
+sentence-transformers) and optionally quantised to int8 with dynamic quantisation. At run
+time only onnxruntime, tokenizers and numpy are needed: OnnxEmbedding is a LlamaIndex
+BaseEmbedding, so it can replace HuggingFaceEmbedding everywhere (semantic chunking,
+VectorStoreIndex, the embedding registry).
+
+The pooling, normalisation, maximum length and query/text instructions of the PyTorch model
+are recorded at export time in embedding_config.json, so both backends embed the same input
+the same way; check_embedding_parity compares their vectors and NDCG.
+"""
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from django.conf import settings
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+BACKEND_ONNX = 'onnx'
+BACKEND_ONNX_INT8 = 'onnx-int8'
+GRAPH_FILES = {BACKEND_ONNX: 'model.onnx', BACKEND_ONNX_INT8: 'model-int8.onnx'}
+CONFIG_FILE = 'embedding_config.json'
+TOKENIZER_FILE = 'tokenizer.json'
+ONNX_OPSET = 17
+
+
+def get_model_dir(model_name: str) -> str:
+    """Directory of the exported graphs of a model, under settings.ONNX_MODEL_ROOT."""
+    root = getattr(settings, 'ONNX_MODEL_ROOT', os.path.join(settings.CACHE_ROOT, 'onnx_models'))
+    return os.path.join(root, model_name.replace('/', '__'))
+
+
+def export_model(model_name: str, quantize: bool = True) -> str:
+    """
+    Exports the transformer of a sentence-transformers model to ONNX (dynamic batch and sequence
+    axes) with its tokenizer and embedding configuration, and writes the int8 dynamically
+    quantised graph next to it. Returns the model directory.
+    """
+    # Export-only dependencies: the ONNX backend itself runs without torch
+    import torch
+    from llama_index.embeddings.huggingface.utils import (
+        get_query_instruct_for_model_name, get_text_instruct_for_model_name,
+    )
+    from sentence_transformers import SentenceTransformer
+
+    model_dir = get_model_dir(model_name)
+    os.makedirs(model_dir, exist_ok=True)
+    sentence_model = SentenceTransformer(model_name, device='cpu')
+    transformer = sentence_model[0].auto_model.eval()
+    pooling = sentence_model[1]
+    tokenizer = sentence_model.tokenizer
+
+    class LastHiddenState(torch.nn.Module):
+        """The transformer with a plain tensor output, as torch.onnx.export expects."""
+
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask,
+                              token_type_ids=token_type_ids).last_hidden_state
+
+    sample = tokenizer(['An example sentence.'], return_tensors='pt', return_token_type_ids=True)
+    input_names = ['input_ids', 'attention_mask', 'token_type_ids']
+    graph_path = os.path.join(model_dir, GRAPH_FILES[BACKEND_ONNX])
+    with torch.no_grad():
+        torch.onnx.export(
+            LastHiddenState(transformer),
+            tuple(sample[name] for name in input_names),
+            graph_path,
+            input_names=input_names,
+            output_names=['last_hidden_state'],
+            dynamic_axes={name: {0: 'batch', 1: 'sequence'} for name in input_names + ['last_hidden_state']},
+            opset_version=ONNX_OPSET,
+        )
+    tokenizer.save_pretrained(model_dir)  # tokenizer.json, read back with the `tokenizers` library
+
+    config = {
+        'model_name': model_name,
+        'pooling': 'cls' if pooling.pooling_mode_cls_token else 'mean',
+        'normalize': any(type(module).__name__ == 'Normalize' for module in sentence_model),
+        'max_length': sentence_model.max_seq_length,
+        'pad_token_id': tokenizer.pad_token_id,
+        'pad_token': tokenizer.pad_token,
+        'query_instruction': get_query_instruct_for_model_name(model_name),
+        'text_instruction': get_text_instruct_for_model_name(model_name),
+    }
+    with open(os.path.join(model_dir, CONFIG_FILE), 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+    logger.info("OnnxEmbedding: '%s' exported to %s.", model_name, graph_path)
+
+    if quantize:
+        quantize_model(model_name)
+    return model_dir
+
+
+def quantize_model(model_name: str) -> str:
+    """Writes the int8 dynamically quantised copy of an exported graph (weights int8, activations at run time)."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    model_dir = get_model_dir(model_name)
+    int8_path = os.path.join(model_dir, GRAPH_FILES[BACKEND_ONNX_INT8])
+    quantize_dynamic(os.path.join(model_dir, GRAPH_FILES[BACKEND_ONNX]), int8_path, weight_type=QuantType.QInt8)
+    logger.info("OnnxEmbedding: '%s' quantised to %s.", model_name, int8_path)
+    return int8_path
+
+
+def get_intra_op_threads(threads: Optional[int] = None) -> int:
+    """Threads per ONNX Runtime session: settings.ONNX_INTRA_OP_THREADS (0 lets ONNX Runtime pick the physical cores)."""
+    if threads is not None:
+        return threads
+    return getattr(settings, 'ONNX_INTRA_OP_THREADS', 0) or 0
+
+
+class OnnxEmbedding(BaseEmbedding):
+    """Sentence-transformers embedding model run by ONNX Runtime on CPU (fp32 or int8 graph)."""
+
+    backend: str = BACKEND_ONNX
+    pooling: str = 'cls'
+    normalize: bool = True
+    max_length: int = 512
+    query_instruction: str = ''
+    text_instruction: str = ''
+
+    _session: Any = PrivateAttr()
+    _tokenizer: Any = PrivateAttr()
+    _input_names: List[str] = PrivateAttr()
+
+    def __init__(self, model_name: str, backend: str = BACKEND_ONNX, threads: Optional[int] = None, **kwargs: Any):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_dir = get_model_dir(model_name)
+        with open(os.path.join(model_dir, CONFIG_FILE), encoding='utf-8') as f:
+            config: Dict[str, Any] = json.load(f)
+        super().__init__(
+            model_name=model_name,
+            backend=backend,
+            pooling=config['pooling'],
+            normalize=config['normalize'],
+            max_length=config['max_length'],
+            query_instruction=config['query_instruction'] or '',
+            text_instruction=config['text_instruction'] or '',
+            **kwargs,
+        )
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = get_intra_op_threads(threads)
+        options.inter_op_num_threads = 1
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, GRAPH_FILES[backend]), sess_options=options, providers=['CPUExecutionProvider']
+        )
+        self._input_names = [graph_input.name for graph_input in self._session.get_inputs()]
+
+        tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        tokenizer.enable_truncation(max_length=self.max_length)
+        tokenizer.enable_padding(pad_id=config['pad_token_id'], pad_token=config['pad_token'])
+        self._tokenizer = tokenizer
+
+    @classmethod
+    def class_name(cls) -> str:
+        return 'OnnxEmbedding'
+
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        """Tokens of each text after truncation, without padding (used to plan length-sorted batches)."""
+        return [sum(encoding.attention_mask) for encoding in self._tokenizer.encode_batch(texts)]
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        encodings = self._tokenizer.encode_batch(texts)
+        features = {
+            'input_ids': np.array([e.ids for e in encodings], dtype=np.int64),
+            'attention_mask': np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            'token_type_ids': np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self._session.run(None, {name: features[name] for name in self._input_names})[0]
+        if self.pooling == 'cls':
+            vectors = hidden[:, 0]
+        else:
+            mask = features['attention_mask'][:, :, None].astype(hidden.dtype)
+            vectors = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors.astype(np.float32).tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed([self.query_instruction + query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed([self.text_instruction + text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed([self.text_instruction + text for text in texts])
+
+
+def ensure_exported(model_name: str, backend: str) -> None:
+    """Exports (and quantises) the graph of the backend when it was never exported."""
+    if os.path.exists(os.path.join(get_model_dir(model_name), GRAPH_FILES[backend])):
+        return
+    logger.info("OnnxEmbedding: no exported graph for '%s' (%s), exporting it now.", model_name, backend)
+    if not os.path.exists(os.path.join(get_model_dir(model_name), GRAPH_FILES[BACKEND_ONNX])):
+        export_model(model_name, quantize=backend == BACKEND_ONNX_INT8)
+    else:
+        quantize_model(model_name)
+
+
+def load_model(model_name: str, backend: str, batch_size: int) -> OnnxEmbedding:
+    """Loads the ONNX backend of a model, exporting it first when needed."""
+    ensure_exported(model_name, backend)
+    return OnnxEmbedding(model_name, backend=backend, embed_batch_size=batch_size)
@@ -0,0 +1,139 @@
+# experiments/service/semantic_chunking.py
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from experiments.service import embedding_registry, sentence_segmentation
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_CACHE_SUBDIR = 'sentence_embeddings'
+
+# (document, model) matrices kept in memory: the others are read back from their .npy file
+SENTENCE_EMBEDDINGS_CACHE_SIZE = 16
+
+# In-process LRU cache: {(model name, content hash): (n_sentences, dim) float32 matrix}, most recently used last
+_sentence_embeddings: 'OrderedDict[Tuple[str, str], np.ndarray]' = OrderedDict()
+_sentence_embeddings_lock = threading.Lock()
+
+
+def _cache_path(model_name: str, key: str) -> str:
+    model_dir = model_name.replace('/', '__')
+    return os.path.join(settings.CACHE_ROOT, EMBEDDINGS_CACHE_SUBDIR, model_dir, f'{key}.npy')
+
+
+def get_sentence_embeddings(content: str, model_name: str) -> np.ndarray:
+    """
+    Returns one embedding per sentence of the text (same order as the cached sentence
+    spans), computing them only the first time for a given (document, model) pair.
+    Vectors are stored in a .npy file under CACHE_ROOT/sentence_embeddings and, for the
+    SENTENCE_EMBEDDINGS_CACHE_SIZE most recent pairs, in memory.
+    """
+    key = sentence_segmentation.content_hash(content)
+    with _sentence_embeddings_lock:
+        cached = _sentence_embeddings.get((model_name, key))
+        if cached is not None:
+            _sentence_embeddings.move_to_end((model_name, key))
+            return cached
+
+    path = _cache_path(model_name, key)
+    if os.path.exists(path):
+        vectors = np.load(path)
+    else:
+        sentences = sentence_segmentation.get_sentences(content)
+        logger.info("SemanticChunking: embedding %d sentences with '%s'...", len(sentences), model_name)
+        vectors = embedding_registry.embed_texts(model_name, sentences)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, vectors)
+        os.replace(tmp_path, path)
+
+    with _sentence_embeddings_lock:
+        _sentence_embeddings[(model_name, key)] = vectors
+        while len(_sentence_embeddings) > SENTENCE_EMBEDDINGS_CACHE_SIZE:
+            _sentence_embeddings.popitem(last=False)
+    return vectors
+
+
+def buffered_embeddings(sentence_vectors: np.ndarray, buffer_size: int) -> np.ndarray:
+    """
+    Window vector of each sentence: the sum of the vectors of the sentences in
+    [i - buffer_size, i + buffer_size], computed with a cumulative sum, then L2-normalized.
+    This replaces re-embedding the concatenated window text for every buffer size.
+    """
+    n = sentence_vectors.shape[0]
+    prefix = np.vstack([np.zeros((1, sentence_vectors.shape[1]), dtype=np.float64),
+                        np.cumsum(sentence_vectors, axis=0, dtype=np.float64)])
+    lower = np.clip(np.arange(n) - buffer_size, 0, n)
+    upper = np.clip(np.arange(n) + buffer_size + 1, 0, n)
+    windows = prefix[upper] - prefix[lower]
+    norms = np.linalg.norm(windows, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return windows / norms
+
+
+def sentence_distances(window_vectors: np.ndarray) -> np.ndarray:
+    """Cosine distance between each window and the next one (length n - 1)."""
+    return 1.0 - np.einsum('ij,ij->i', window_vectors[:-1], window_vectors[1:])
+
+
+def _chunks_from_breakpoints(content: str, spans: np.ndarray, distances: np.ndarray,
+                             breakpoint_percentile_threshold: float, metadata: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Splits after every sentence whose distance to the next one is above the given
+    percentile of all distances (same rule as SemanticSplitterNodeParser).
+    """
+    if len(distances):
+        threshold = np.percentile(distances, breakpoint_percentile_threshold)
+        breakpoints = np.flatnonzero(distances > threshold)
+    else:
+        breakpoints = np.zeros(0, dtype=np.int64)
+
+    group_ends = np.append(breakpoints, len(spans) - 1)
+    group_starts = np.concatenate(([0], breakpoints + 1))
+
+    chunks_data_list = []
+    for first, last in zip(group_starts, group_ends):
+        start_char = int(spans[first][0])
+        end_char = int(spans[last][1])
+        chunks_data_list.append({
+            'text': content[start_char:end_char],
+            'start_char': start_char,
+            'end_char': end_char,
+            'metadata': dict(metadata),
+        })
+    return chunks_data_list
+
+
+def semantic_chunk(content: str, model_name: str, buffer_size: int = 1,
+                   breakpoint_percentile_threshold: float = 95) -> List[Dict[str, Any]]:
+    """Semantic chunking over cached sentence embeddings, with offsets into the original content."""
+    return sweep_thresholds(content, model_name, buffer_size, [breakpoint_percentile_threshold])[
+        breakpoint_percentile_threshold]
+
+
+def sweep_thresholds(content: str, model_name: str, buffer_size: int,
+                     thresholds: Iterable[float]) -> Dict[float, List[Dict[str, Any]]]:
+    """
+    Chunks the document for every breakpoint percentile threshold, embedding the
+    sentences at most once. Returns {threshold: chunks_data_list}.
+    """
+    spans = sentence_segmentation.get_sentence_spans(content)
+    if not len(spans):
+        return {threshold: [] for threshold in thresholds}
+
+    window_vectors = buffered_embeddings(get_sentence_embeddings(content, model_name), buffer_size)
+    distances = sentence_distances(window_vectors)
+    return {
+        threshold: _chunks_from_breakpoints(
+            content, spans, distances, threshold,
+            {'type': 'semantic', 'buffer_size': buffer_size, 'breakpoint_percentile_threshold': threshold},
+        )
+        for threshold in thresholds
+    }
@@ -0,0 +1,97 @@
+# experiments/service/sentence_segmentation.py
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+from django.conf import settings
+
+from experiments.service import nltk_resources
+
+SPANS_CACHE_SUBDIR = 'sentence_spans'
+LANGUAGE = 'english'
+
+# Documents whose spans are kept in memory: the others are read back from the .npy cache
+SPANS_CACHE_SIZE = 128
+
+# In-process LRU cache: {content hash: (n, 2) array of [start, end) offsets}, most recently used last
+_spans_by_hash: 'OrderedDict[str, np.ndarray]' = OrderedDict()
+_spans_by_hash_lock = threading.Lock()
+
+
+def content_hash(content: str) -> str:
+    """SHA-256 of the text, used as the cache key (equal to the hash of the UTF-8 file)."""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+@lru_cache(maxsize=1)
+def _get_tokenizer():
+    """Returns the same Punkt model used by nltk.sent_tokenize, loaded from the local NLTK data."""
+    try:
+        from nltk.tokenize.punkt import PunktTokenizer  # NLTK >= 3.8.2 (punkt_tab)
+    except ImportError:
+        import nltk
+        nltk_resources.require(f'tokenizers/punkt/{LANGUAGE}.pickle')
+        return nltk.data.load(f'tokenizers/punkt/{LANGUAGE}.pickle')
+    nltk_resources.require(f'tokenizers/punkt_tab/{LANGUAGE}/')
+    return PunktTokenizer(LANGUAGE)
+
+
+def _cache_path(key: str) -> str:
+    return os.path.join(settings.CACHE_ROOT, SPANS_CACHE_SUBDIR, f'{key}.npy')
+
+
+def get_sentence_spans(content: str) -> np.ndarray:
+    """
+    Returns the sentences of the text as an (n, 2) int64 array of [start, end) offsets.
+    content[start:end] is exactly the sentence nltk.sent_tokenize would return, so the
+    offsets never have to be recovered with str.find.
+    Spans are cached on disk and, for the SPANS_CACHE_SIZE most recent texts, in memory, keyed
+    by the content hash, so the text is tokenised once no matter how many sentence-based
+    strategies are applied to it.
+    """
+    key = content_hash(content)
+    with _spans_by_hash_lock:
+        spans = _spans_by_hash.get(key)
+        if spans is not None:
+            _spans_by_hash.move_to_end(key)
+            return spans
+
+    path = _cache_path(key)
+    if os.path.exists(path):
+        spans = np.load(path)
+    else:
+        spans = np.array(list(_get_tokenizer().span_tokenize(content)), dtype=np.int64).reshape(-1, 2)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, spans)
+        os.replace(tmp_path, path)  # Atomic, concurrent writers produce the same file
+
+    with _spans_by_hash_lock:
+        _spans_by_hash[key] = spans
+        while len(_spans_by_hash) > SPANS_CACHE_SIZE:
+            _spans_by_hash.popitem(last=False)
+    return spans
+
+
+def get_sentences(content: str) -> List[str]:
+    """The sentence texts, same output as nltk.sent_tokenize(content)."""
+    return [content[start:end] for start, end in get_sentence_spans(content)]
+
+
+def get_sentence_pieces(content: str) -> List[str]:
+    """
+    Splits the text at the sentence starts, keeping the whitespace between sentences
+    attached to the previous one, so that "".join(pieces) == content.
+    This is the shape LlamaIndex sentence splitters (e.g. SemanticSplitterNodeParser)
+    expect in order to find the chunk offsets in the original text.
+    """
+    spans = get_sentence_spans(content)
+    if not len(spans):
+        return [content] if content else []
+    boundaries = [0] + [int(start) for start in spans[1:, 0]] + [len(content)]
+    return [content[boundaries[i]:boundaries[i + 1]] for i in range(len(boundaries) - 1)]
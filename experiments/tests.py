@@ -1,3 +1,391 @@
-from django.test import TestCase
+import os
+import random
+import shutil
+import tempfile
+from unittest import SkipTest, mock
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from corpus.models import Question, SourceText
+from corpus.service import mapped_text
+from experiments.models import Chunk, ChunkingStrategy, ChunkSet, Experiment
+from experiments.service import (chunk_reuse, chunk_storage, chunking_pipeline, embedding_registry, nltk_resources,
+                                 semantic_chunking, sentence_segmentation, structure_utils)
+
+
+class LengthEmbedding:
+    """Stand-in model: the vector of a text is (its token count, its position in the input), batches are recorded."""
+
+    max_length = 64
+
+    def __init__(self, texts):
+        self.positions = {text: i for i, text in enumerate(texts)}
+        self.batches = []
+
+    def token_lengths(self, texts):
+        return [len(text.split()) for text in texts]
+
+    def get_text_embedding_batch(self, texts):
+        self.batches.append(list(texts))
+        return [[len(text.split()), self.positions[text]] for text in texts]
+
+
+class PlanBatchesTests(SimpleTestCase):
+
+    def test_batches_cover_every_text_once_within_bounds(self):
+        rng = random.Random(0)
+        for _ in range(50):
+            lengths = [rng.randint(0, 512) for _ in range(rng.randint(1, 300))]
+            token_budget, max_batch_size = rng.choice([512, 2048, 16384]), rng.choice([1, 8, 256])
+            batches = embedding_registry.plan_batches(lengths, token_budget, max_batch_size)
+
+            self.assertEqual(sorted(np.concatenate(batches).tolist()), list(range(len(lengths))))
+            longest = [max(lengths[i] for i in batch) for batch in batches]
+            self.assertEqual(longest, sorted(longest, reverse=True))  # Longest batches first
+            for batch in batches:
+                self.assertGreaterEqual(len(batch), 1)
+                self.assertLessEqual(len(batch), max_batch_size)
+                if len(batch) > 1:  # A single text longer than the budget still gets its own batch
+                    self.assertLessEqual(len(batch) * max(lengths[i] for i in batch), token_budget)
+
+    def test_text_longer_than_the_budget_is_alone(self):
+        batches = embedding_registry.plan_batches([1000, 10, 10], token_budget=100, max_batch_size=8)
+        self.assertEqual([batch.tolist() for batch in batches], [[0], [1, 2]])
+
+
+class EmbedTextsTests(SimpleTestCase):
+
+    def tearDown(self):
+        embedding_registry._models.pop('test-length-model', None)
+
+    def test_vectors_come_back_in_input_order(self):
+        rng = random.Random(1)
+        texts = [' '.join(f'w{i}' for _ in range(rng.randint(1, 60))) + f' t{i}' for i in range(200)]
+        model = LengthEmbedding(texts)
+        embedding_registry.register_model('test-length-model', model)
+
+        vectors = embedding_registry.embed_texts('test-length-model', texts, batch_size=16, token_budget=256)
+
+        self.assertEqual(vectors[:, 1].tolist(), list(range(len(texts))))
+        self.assertGreater(len(model.batches), 1)
+        self.assertNotEqual([text for batch in model.batches for text in batch], texts)  # Sorted by length
+
+
+class GetEmbedModelTests(SimpleTestCase):
+
+    def test_failed_load_is_logged_and_not_cached(self):
+        with mock.patch.object(embedding_registry, '_load_model', side_effect=OSError("no weights")):
+            with self.assertLogs('experiments.service.embedding_registry', level='ERROR'), \
+                    self.assertRaises(ValueError):
+                embedding_registry.get_embed_model('test-missing-model')
+        self.assertNotIn('test-missing-model', embedding_registry._models)
+
+
+class SourceFileTestCase(TestCase):
+    """Source text files and caches written in a temporary MEDIA_ROOT / CACHE_ROOT."""
+
+    def setUp(self):
+        self.media_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_dir, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_dir,
+                                              CACHE_ROOT=os.path.join(self.media_dir, 'cache'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create_source_text(self, content, title='Test document'):
+        source_text = SourceText.objects.create(title=title, file=f'source_texts/{title}.txt')
+        self.write_source_file(source_text, content)
+        return source_text
+
+    def write_source_file(self, source_text, content):
+        path = os.path.join(self.media_dir, source_text.file.name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+
+class AnnotatePageTests(SourceFileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        source_text = self.create_source_text("First sentence. Second one.")
+        question = Question.objects.create(source_text=source_text, text="Which sentence?")
+        self.experiment = Experiment.objects.create(source_text=source_text, question=question)
+        self.url = reverse('experiments:annotate_experiment', kwargs={'experiment_pk': self.experiment.pk})
+
+    def test_page_works_without_nltk_data(self):
+        with mock.patch.object(sentence_segmentation, 'get_sentence_spans', side_effect=LookupError("no punkt_tab")):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['sentence_spans_json'], '[]')
+        self.assertContains(response, 'id="snapToSentences" disabled')
+
+    def test_snapping_is_offered_with_sentence_spans(self):
+        with mock.patch.object(sentence_segmentation, 'get_sentence_spans', return_value=np.array([[0, 15], [16, 27]])):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['sentence_spans_json'], '[[0, 15], [16, 27]]')
+        self.assertNotContains(response, 'disabled')
+
+
+def old_n_sentence_chunks(content, sentences_per_chunk, sentence_overlap):
+    """The sent_tokenize + str.find implementation the span-based chunker replaced, as (text, start, end)."""
+    import nltk
+
+    sentences = nltk.sent_tokenize(content)
+    chunks, i = [], 0
+    while i < len(sentences):
+        chunk_sentences = sentences[i: i + sentences_per_chunk]
+        start = content.find(chunk_sentences[0])
+        last = content.find(chunk_sentences[-1], start + len(chunk_sentences[0]))
+        if last == -1:
+            last = content.find(chunk_sentences[-1], start)
+        chunks.append((" ".join(chunk_sentences), start, last + len(chunk_sentences[-1])))
+        # The old loop never advanced when overlap >= sentences_per_chunk: the new one moves one sentence
+        i += max(1, sentences_per_chunk - sentence_overlap)
+    return chunks
+
+
+def old_sentence_window_chunks(content, min_chars, max_chars, overlap_chars):
+    """The sent_tokenize + str.find implementation of the sentence window chunker, as (text, start, end)."""
+    import nltk
+
+    sentences = nltk.sent_tokenize(content)
+    chunks, i = [], 0
+    while i < len(sentences):
+        first, length = i, 0
+        while (length < min_chars or i == first) and i < len(sentences):
+            length += len(sentences[i]) + 1
+            i += 1
+        while length < max_chars and i < len(sentences) and length + len(sentences[i]) + 1 <= max_chars * 1.1:
+            length += len(sentences[i]) + 1
+            i += 1
+        chunk_sentences = sentences[first:i]
+        start = content.find(chunk_sentences[0])
+        last = content.find(chunk_sentences[-1], start + len(chunk_sentences[0]))
+        if last == -1:
+            last = content.find(chunk_sentences[-1], start)
+        chunks.append((" ".join(chunk_sentences), start, last + len(chunk_sentences[-1])))
+
+        overlap_count, overlap_length = 0, 0
+        for sentence in reversed(chunk_sentences):
+            if overlap_length + len(sentence) + 1 > overlap_chars:
+                break
+            overlap_length += len(sentence) + 1
+            overlap_count += 1
+        i = max(first + 1, first + len(chunk_sentences) - overlap_count)
+        if i >= len(sentences):
+            break
+    return chunks
+
+
+class SentenceSpansTests(SourceFileTestCase):
+    """Span-based sentence segmentation and chunkers against nltk.sent_tokenize and str.find."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        try:
+            sentence_segmentation._get_tokenizer()
+        except LookupError:
+            raise SkipTest("NLTK punkt data not downloaded (manage.py download_nltk_data)")
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(sentence_segmentation._spans_by_hash.clear)
+        rng = random.Random(0)
+        words = ['alpha', 'beta', 'gamma', 'Dr.', 'e.g.', 'U.S.', '3.5']
+        # Sentences separated by one space and with numbered words, so that every sentence Punkt finds
+        # (abbreviations split some) is unique and the old str.find offsets are the true ones
+        sentences = []
+        for i in range(120):
+            body = ' '.join(f'{rng.choice(words)} w{i}.{j}' for j in range(rng.randint(1, 12)))
+            sentences.append(f"Sentence {i} {body}{rng.choice('.?!')}")
+        self.content = ' '.join(sentences)
+
+    def test_spans_are_sent_tokenize_output(self):
+        import nltk
+
+        nltk_resources.configure_data_path()
+        content = "  Mr. Smith arrived.\n\nHe left at 3 p.m. yesterday!  Then? Nothing...\tDone "
+        for text in (content, self.content, '', '   '):
+            spans = sentence_segmentation.get_sentence_spans(text)
+            self.assertEqual([text[start:end] for start, end in spans], nltk.sent_tokenize(text))
+            self.assertEqual(sentence_segmentation.get_sentences(text), nltk.sent_tokenize(text))
+
+    def test_spans_survive_the_memory_cache(self):
+        spans = sentence_segmentation.get_sentence_spans(self.content)
+        sentence_segmentation._spans_by_hash.clear()  # Read back from the .npy cache
+        np.testing.assert_array_equal(sentence_segmentation.get_sentence_spans(self.content), spans)
+
+    def test_memory_cache_is_bounded(self):
+        with mock.patch.object(sentence_segmentation, 'SPANS_CACHE_SIZE', 3):
+            for i in range(10):
+                sentence_segmentation.get_sentence_spans(f"Text number {i}. Second sentence.")
+        self.assertEqual(len(sentence_segmentation._spans_by_hash), 3)
+
+    def test_n_sentence_chunking_matches_old_implementation(self):
+        for sentences_per_chunk, sentence_overlap in [(1, 0), (3, 0), (3, 1), (5, 4), (3, 3), (2, 5)]:
+            chunks = structure_utils._n_sentence_chunking(self.content, sentences_per_chunk, sentence_overlap)
+            self.assertEqual([(c['text'], c['start_char'], c['end_char']) for c in chunks],
+                             old_n_sentence_chunks(self.content, sentences_per_chunk, sentence_overlap))
+
+    def test_sentence_window_chunking_matches_old_implementation(self):
+        for min_chars, max_chars, overlap_chars in [(100, 300, 0), (200, 500, 80), (50, 120, 500), (1, 1, 0)]:
+            chunks = structure_utils._sentence_window_chunking(self.content, min_chars, max_chars, overlap_chars)
+            self.assertEqual([(c['text'], c['start_char'], c['end_char']) for c in chunks],
+                             old_sentence_window_chunks(self.content, min_chars, max_chars, overlap_chars))
+
+
+class ChunkStorageTests(SourceFileTestCase):
+    """Offsets-only chunks materialise the text the chunker returned, through conversion and verification."""
+
+    CONTENT = "Première partie — café ☕.\n\nSecond paragraph, 𝔲𝔫𝔦𝔠𝔬𝔡𝔢 too.\n\n\n  Third   one, spaced.  \n\nLast."
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(mapped_text._mapped_texts.clear)
+        self.addCleanup(chunk_storage._verified_sources.clear)
+        self.source_text = self.create_source_text(self.CONTENT)
+        self.strategy = ChunkingStrategy.objects.create(name='Paragraphs', method_type='structure',
+                                                        parameters={'structure_type': 'pure_paragraph'})
+        self.chunks_data = structure_utils._pure_paragraph_split(self.CONTENT, '\n\n')
+        # A chunker text that is not the exact source slice (whitespace normalised) must be stored
+        third = self.chunks_data[2]
+        third['text'] = ' '.join(third['text'].split())
+
+    def chunk_texts(self, chunk_set):
+        return [chunk.text for chunk in Chunk.objects.filter(chunk_set=chunk_set).order_by('chunk_index')]
+
+    def test_offsets_only_chunks_round_trip(self):
+        chunk_set = chunking_pipeline.save_chunk_set(self.source_text, self.strategy, self.chunks_data,
+                                                     storage_mode=ChunkSet.STORAGE_OFFSETS)
+        stored = list(chunk_set.chunks.order_by('chunk_index').values_list('stored_text', flat=True))
+        self.assertEqual([text is None for text in stored], [True, True, False, True])
+        self.assertEqual(self.chunk_texts(chunk_set), [data['text'] for data in self.chunks_data])
+        self.assertEqual([text for _, text in chunk_storage.chunk_texts(chunk_set.pk)],
+                         [data['text'] for data in self.chunks_data])
+
+    def test_conversion_keeps_the_texts(self):
+        chunk_set = chunking_pipeline.save_chunk_set(self.source_text, self.strategy, self.chunks_data,
+                                                     storage_mode=ChunkSet.STORAGE_INLINE)
+        expected = [data['text'] for data in self.chunks_data]
+
+        self.assertEqual(chunk_storage.convert_chunk_set(chunk_set, ChunkSet.STORAGE_OFFSETS), (3, 1))
+        self.assertEqual(self.chunk_texts(chunk_set), expected)
+        self.assertEqual(chunk_storage.verify_chunk_set(chunk_set), [])
+
+        self.assertEqual(chunk_storage.convert_chunk_set(chunk_set, ChunkSet.STORAGE_INLINE), (0, 4))
+        self.assertFalse(chunk_set.chunks.filter(stored_text__isnull=True).exists())
+        self.assertEqual(self.chunk_texts(chunk_set), expected)
+
+    def test_verify_with_rechunk_compares_with_the_chunker_output(self):
+        chunks_data = structure_utils._pure_paragraph_split(self.CONTENT, '\n\n')
+        chunk_set = chunking_pipeline.save_chunk_set(self.source_text, self.strategy, chunks_data,
+                                                     storage_mode=ChunkSet.STORAGE_OFFSETS)
+        self.assertEqual(chunk_storage.verify_chunk_set(chunk_set, rechunk=True), [])
+
+        Chunk.objects.filter(chunk_set=chunk_set, chunk_index=1).update(end_char=chunks_data[1]['end_char'] - 1)
+        self.assertEqual(chunk_storage.verify_chunk_set(chunk_set, rechunk=True),
+                         ["chunk 1: differs from the chunker output"])
+
+    def test_edited_source_is_refused(self):
+        chunk_set = chunking_pipeline.save_chunk_set(self.source_text, self.strategy, self.chunks_data,
+                                                     storage_mode=ChunkSet.STORAGE_OFFSETS)
+        self.chunk_texts(chunk_set)  # Source checked and cached in this process
+        self.write_source_file(self.source_text, "Something else entirely.")
+
+        with self.assertRaises(chunk_storage.ChunkStorageError):
+            self.chunk_texts(chunk_set)
+        self.assertEqual(len(chunk_storage.verify_chunk_set(chunk_set)), 1)
+        with self.assertRaises(chunk_storage.ChunkStorageError):
+            chunk_storage.convert_chunk_set(chunk_set, ChunkSet.STORAGE_INLINE)
+
+
+class SentenceEmbeddingsCacheTests(SourceFileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(semantic_chunking._sentence_embeddings.clear)
+        self.embedded = []
+
+    def embed_texts(self, model_name, texts):
+        self.embedded.append(list(texts))
+        return np.asarray([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+    def test_memory_cache_is_bounded_and_backed_by_files(self):
+        documents = [f"Document {i} has some text" for i in range(5)]
+        with mock.patch.object(semantic_chunking, 'SENTENCE_EMBEDDINGS_CACHE_SIZE', 2), \
+                mock.patch.object(sentence_segmentation, 'get_sentences', side_effect=str.split), \
+                mock.patch.object(embedding_registry, 'embed_texts', side_effect=self.embed_texts):
+            first = [semantic_chunking.get_sentence_embeddings(document, 'test-model') for document in documents]
+            self.assertEqual(len(semantic_chunking._sentence_embeddings), 2)
+
+            again = semantic_chunking.get_sentence_embeddings(documents[0], 'test-model')  # Evicted: read from disk
+        np.testing.assert_array_equal(again, first[0])
+        self.assertEqual(len(self.embedded), len(documents))  # Nothing embedded twice
+
+
+class StrategyFingerprintTests(TestCase):
+
+    def fingerprint(self, method_type, parameters, name='Strategy'):
+        strategy = ChunkingStrategy(name=name, method_type=method_type, parameters=parameters)
+        return chunk_reuse.strategy_fingerprint(strategy)
+
+    def test_equivalent_parameters_share_the_fingerprint(self):
+        reference = self.fingerprint('length', {'chunk_size': 512, 'chunk_overlap': 50, 'separator': ' '})
+        for parameters in ({}, {'chunk_overlap': 50, 'chunk_size': 512}, {'chunk_size': '512'},
+                           '{"separator": " ", "chunk_size": 512}', {'chunk_size': 512, 'unused': 'ignored'}):
+            self.assertEqual(self.fingerprint('length', parameters, name='Other name'), reference, parameters)
+
+    def test_different_effective_parameters_differ(self):
+        fingerprints = {
+            self.fingerprint('length', {}),
+            self.fingerprint('length', {'chunk_size': 256}),
+            self.fingerprint('length', {'chunk_overlap': 0}),
+            self.fingerprint('structure', {'structure_type': 'pure_paragraph'}),
+            self.fingerprint('structure', {'structure_type': 'n_sentence_chunking'}),
+            self.fingerprint('structure', {'structure_type': 'n_sentence_chunking', 'sentence_overlap': 2}),
+            self.fingerprint('structure', {}),
+        }
+        self.assertEqual(len(fingerprints), 7)
+
+
+class CloneChunkSetTests(SourceFileTestCase):
+
+    CONTENT = "First paragraph.\n\nSecond one, a bit longer.\n\n  Third.  "
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(mapped_text._mapped_texts.clear)
+        self.addCleanup(chunk_storage._verified_sources.clear)
+
+    def test_clone_reproduces_the_chunks(self):
+        original_text = self.create_source_text(self.CONTENT, 'Original')
+        strategy = ChunkingStrategy.objects.create(name='Paragraphs', method_type='structure',
+                                                   parameters={'structure_type': 'pure_paragraph'})
+        chunks_data = structure_utils._pure_paragraph_split(self.CONTENT, '\n\n')
+        original = chunking_pipeline.save_chunk_set(original_text, strategy, chunks_data,
+                                                    storage_mode=ChunkSet.STORAGE_OFFSETS)
+
+        copy_text = self.create_source_text(self.CONTENT, 'Same content')
+        equivalent = ChunkingStrategy.objects.create(name='Paragraphs again', method_type='structure',
+                                                     parameters={'paragraph_separator': '\n\n',
+                                                                 'structure_type': 'pure_paragraph'})
+        clone = chunk_reuse.clone_equivalent(copy_text, equivalent)
+
+        self.assertIsNotNone(clone)
+        self.assertEqual((clone.cloned_from_id, clone.source_text_id, clone.strategy_id),
+                         (original.pk, copy_text.pk, equivalent.pk))
+        self.assertEqual(
+            [(chunk.chunk_index, chunk.start_char, chunk.end_char, chunk.text) for chunk in clone.chunks.all()],
+            [(i, data['start_char'], data['end_char'], data['text']) for i, data in enumerate(chunks_data)],
+        )
+
+        different = ChunkingStrategy.objects.create(name='Lines', method_type='structure',
+                                                    parameters={'structure_type': 'pure_paragraph',
+                                                                'paragraph_separator': '\n'})
+        self.assertIsNone(chunk_reuse.clone_equivalent(copy_text, different))
+        edited_text = self.create_source_text(self.CONTENT + " More.", 'Edited')
+        self.assertIsNone(chunk_reuse.clone_equivalent(edited_text, equivalent))
@@ -8,9 +8,9 @@ from django.core.paginator import Paginator
 
 from experiments.models import Experiment, RelevantSentence, ChunkingStrategy, ChunkSet, Chunk
 from experiments.forms import ChunkingStrategyForm
+from experiments.service import chunk_reuse
 from corpus.models import SourceText
-from corpus.service import source_text_service
-from experiments.service import chunk_implementations
+from jobs.service import job_queue
 
 
 # --- ChunkingStrategy Views (CRUD) ---
@@ -48,11 +48,16 @@ def edit_strategy(request, pk):
     """Edit an existing chunking strategy."""
     strategy = get_object_or_404(ChunkingStrategy, pk=pk)
     if request.method == 'POST':
+        previous_fingerprint = _fingerprint_or_none(strategy)
         form = ChunkingStrategyForm(request.POST, instance=strategy)
         if form.is_valid():
             try:
                 form.save()
                 messages.success(request, f"Strategy '{strategy.name}' updated successfully.")
+                n_chunk_sets = ChunkSet.objects.filter(strategy=strategy).count()
+                if n_chunk_sets and _fingerprint_or_none(strategy) != previous_fingerprint:
+                    messages.warning(request, f"Parameters changed: {n_chunk_sets} chunk sets of this strategy and "
+                                              f"their analyses are now stale. Run 'manage.py recompute_stale' to update them.")
                 return redirect(reverse('experiments:list_strategies'))
             except IntegrityError:
                 form.add_error('name', "A strategy with this name already exists.")
@@ -70,6 +75,13 @@ def edit_strategy(request, pk):
     context = {'form': form, 'strategy': strategy, 'is_edit': True}
     return render(request, 'experiments/strategy_form.html', context)
 
+def _fingerprint_or_none(strategy):
+    """Fingerprint of the normalised strategy parameters, None when they are invalid."""
+    try:
+        return chunk_reuse.strategy_fingerprint(strategy)
+    except ValueError:
+        return None
+
 @require_POST
 def delete_strategy(request, pk):
     """Delete a chunking strategy (POST only)."""
@@ -97,18 +109,21 @@ def manage_document_chunking(request, source_text_pk):
     existing_chunk_sets = ChunkSet.objects.filter(source_text=source_text)
 
     applied_chunk_sets_map = {cs.strategy_id: cs.pk for cs in existing_chunk_sets}
+    active_jobs = job_queue.active_jobs('chunk', source_text_id=source_text.pk)
+    queued_strategy_jobs_map = {job.params['strategy_id']: job.pk for job in active_jobs}
 
     context = {
         'source_text': source_text,
         'available_strategies': available_strategies,
         'applied_chunk_sets_map': applied_chunk_sets_map,
+        'active_jobs': active_jobs,
+        'queued_strategy_jobs_map': queued_strategy_jobs_map,
     }
     return render(request, 'experiments/manage_document_chunking.html', context)
 
 @require_POST
-@transaction.atomic
 def apply_strategy_to_document(request, source_text_pk, strategy_pk):
-    """Apply a strategy to a document, creating a ChunkSet and its Chunks."""
+    """Queue a background job applying a strategy to a document (ChunkSet and its Chunks)."""
     source_text = get_object_or_404(SourceText, pk=source_text_pk)
     strategy = get_object_or_404(ChunkingStrategy, pk=strategy_pk)
 
@@ -116,33 +131,9 @@ def apply_strategy_to_document(request, source_text_pk, strategy_pk):
         messages.warning(request, f"Chunks for '{source_text.title}' using strategy '{strategy.name}' already exist.")
         return redirect(reverse('experiments:manage_document_chunking', kwargs={'source_text_pk': source_text_pk}))
 
-    content = source_text_service.get_full_text(source_text)
-
-    try:
-        chunks_data = chunk_implementations.apply_chunking_strategy(strategy, content)
-        chunk_set = ChunkSet.objects.create(source_text=source_text, strategy=strategy)
-
-        chunks_to_create = [
-            Chunk(
-                chunk_set=chunk_set,
-                text=data['text'],
-                chunk_index=i,
-                start_char=data['start_char'],
-                end_char=data['end_char']
-            )
-            for i, data in enumerate(chunks_data)
-        ]
-
-        if chunks_to_create:
-            Chunk.objects.bulk_create(chunks_to_create)
-            messages.success(request, f"{len(chunks_to_create)} chunks created for '{source_text.title}' using '{strategy.name}'.")
-        else:
-            messages.warning(request, f"No chunks generated for '{source_text.title}' with strategy '{strategy.name}'.")
-
-    except ValueError:
-        messages.error(request, f"Unsupported method type '{strategy.method_type}'.")
-    except Exception as e:
-        messages.error(request, f"Error applying strategy '{strategy.name}': {e}")
+    # Chunking (and, for semantic strategies, the model load) runs in the job worker, not in the request
+    job = job_queue.enqueue('chunk', {'source_text_id': source_text.pk, 'strategy_id': strategy.pk})
+    messages.info(request, f"Chunking of '{source_text.title}' with '{strategy.name}' queued (job #{job.pk}).")
 
     return redirect(reverse('experiments:manage_document_chunking', kwargs={'source_text_pk': source_text_pk}))
 
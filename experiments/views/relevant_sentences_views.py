@@ -5,6 +5,8 @@ from django.contrib import messages
 from django.db import transaction, IntegrityError  # For atomic operations and DB error handling
 
 from corpus.service import source_text_service
+from evaluation.service import relevant_chunks
+from experiments.service import annotations, sentence_segmentation
 from experiments.models import Experiment, RelevantSentence
 from corpus.models import SourceText  # Only import SourceText
 
@@ -36,13 +38,9 @@ def annotate_experiment_view(request, experiment_pk):
             if not isinstance(highlights_data, list):
                 raise ValueError("Highlights format is not a valid JSON list.")
 
-            # 1. Delete ALL previous annotations for this experiment
-            #    This is because the JS sends the COMPLETE desired state of highlights.
-            RelevantSentence.objects.filter(experiment=experiment).delete()
-
-            # 2. Create new annotations based on the received data
-            sentences_to_create = []
-            processed_ranges = set()  # Avoid exact duplicates in the input JSON
+            # 1. Collect the desired highlights: the JS sends the COMPLETE desired state,
+            #    which is then diffed against the stored annotations
+            highlights = {}  # {(start, end): text}, also avoids exact duplicates in the input JSON
 
             for item in highlights_data:
                 if not isinstance(item, dict) or 'start' not in item or 'end' not in item:
@@ -59,10 +57,9 @@ def annotate_experiment_view(request, experiment_pk):
                     continue
 
                 # Avoid duplicate entries in the input
-                if range_tuple in processed_ranges:
+                if range_tuple in highlights:
                     messages.warning(request, f"Ignored duplicate range in input: start={start}, end={end}")
                     continue
-                processed_ranges.add(range_tuple)
 
                 # Ensure indices don't exceed text length
                 if end > len(source_text_content):
@@ -70,25 +67,28 @@ def annotate_experiment_view(request, experiment_pk):
                     continue
 
                 # Extract the corresponding text
-                selected_text = source_text_content[start:end]
-
-                # Prepare objects for bulk insertion
-                sentences_to_create.append(
-                    RelevantSentence(
-                        experiment=experiment,
-                        text=selected_text,
-                        start_char=start,
-                        end_char=end
-                    )
-                )
-
-            # 3. Save all new annotations to the database in a single call
-            if sentences_to_create:
-                RelevantSentence.objects.bulk_create(sentences_to_create)
-                messages.success(request, f"{len(sentences_to_create)} highlights saved successfully.")
+                highlights[range_tuple] = source_text_content[start:end]
+
+            # 2. Write only the added and removed ranges
+            previous_hash = relevant_chunks.annotations_hash(
+                experiment.relevant_sentences.values_list('start_char', 'end_char')
+            )
+            added, removed = annotations.save_annotations(experiment, highlights)
+            if highlights:
+                messages.success(request, f"{len(highlights)} highlights saved successfully "
+                                          f"({len(added)} added, {len(removed)} removed).")
             else:
                 messages.info(request, "No highlights to save (or all previous ones were removed).")
 
+            # 3. Update the analyses of this experiment, only around the changed ranges
+            if added or removed:
+                n_incremental, n_full = relevant_chunks.update_experiment_analyses(
+                    experiment, added + removed, previous_hash
+                )
+                if n_incremental or n_full:
+                    messages.info(request, f"{n_incremental + n_full} analyses updated ({n_full} fully recomputed): "
+                                           f"run 'manage.py recompute_stale' to refresh their simulations.")
+
             # Redirect to the same page to show updated state
             return redirect(reverse('experiments:annotate_experiment', kwargs={'experiment_pk': experiment_pk}))
 
@@ -116,10 +116,20 @@ def annotate_experiment_view(request, experiment_pk):
             for sent in relevant_sentences
         ]
 
+        # Sentence boundaries (cached segmentation) used to snap selections to whole sentences.
+        # Snapping is optional: without the local NLTK data the page works and the option is disabled
+        try:
+            sentence_spans = sentence_segmentation.get_sentence_spans(source_text_content).tolist()
+            sentence_snapping_error = None
+        except LookupError as e:
+            sentence_spans, sentence_snapping_error = [], str(e)
+
         context = {
             'experiment': experiment,
             'source_text_content': source_text_content,
             # Pass JSON data to pre-load highlights with JS
             'existing_highlights_json': json.dumps(existing_highlights_data),
+            'sentence_spans_json': json.dumps(sentence_spans),
+            'sentence_snapping_error': sentence_snapping_error,
         }
         return render(request, 'experiments/annotate_experiment.html', context)
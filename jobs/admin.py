@@ -0,0 +1,9 @@
+from django.contrib import admin
+
+from jobs.models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'job_type', 'status', 'progress_current', 'progress_total', 'created_at', 'finished_at')
+    list_filter = ('job_type', 'status')
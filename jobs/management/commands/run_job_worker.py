@@ -0,0 +1,50 @@
+import os
+import socket
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from jobs.service import job_handlers, job_queue
+
+
+class Command(BaseCommand):
+    help = ("Runs a local worker that executes queued jobs (chunking, analysis initialisation, "
+            "simulations, property recalculation) from the DB-backed queue.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit as soon as the queue is empty.")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds between polls of an empty queue.")
+        parser.add_argument('--max-jobs', type=int, default=None, help="Exit after this many jobs.")
+        parser.add_argument(
+            '--requeue-stale-minutes', type=int, default=None,
+            help="At startup, re-queue jobs left running for longer than this (worker crashed).",
+        )
+        parser.add_argument('--name', default=None, help="Worker name recorded on claimed jobs.")
+
+    def handle(self, *args, **options):
+        worker_name = options['name'] or f"{socket.gethostname()}:{os.getpid()}"
+
+        if options['requeue_stale_minutes'] is not None:
+            n_requeued = job_queue.requeue_stale_jobs(timedelta(minutes=options['requeue_stale_minutes']))
+            self.stdout.write(f"{n_requeued} stale jobs re-queued.")
+
+        self.stdout.write(f"Worker '{worker_name}' started.")
+        n_done = 0
+        try:
+            while options['max_jobs'] is None or n_done < options['max_jobs']:
+                job = job_queue.claim_next_job(worker_name)
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                self.stdout.write(f"Running job {job.pk} ({job.job_type}, {job.params})...")
+                job = job_queue.run_job(job, job_handlers.HANDLERS)
+                style = self.style.SUCCESS if job.status == job.STATUS_SUCCEEDED else self.style.ERROR
+                self.stdout.write(style(f"Job {job.pk} {job.status} in {job.duration_seconds:.2f}s."))
+                n_done += 1
+        except KeyboardInterrupt:
+            self.stdout.write("Worker stopped.")
+        self.stdout.write(f"{n_done} jobs processed.")
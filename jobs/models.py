@@ -0,0 +1,62 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """A unit of background work, stored in the DB and executed by the run_job_worker command."""
+    TYPE_CHOICES = [
+        ('chunk', 'Apply chunking strategy'),
+        ('initialize_analysis', 'Initialise analysis'),
+        ('simulate', 'Retrieval simulation and NDCG'),
+        ('recompute_properties', 'Recompute chunk properties'),
+    ]
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+    job_type = models.CharField(max_length=30, choices=TYPE_CHOICES)
+    # Arguments of the job, e.g. {'source_text_id': 1, 'strategy_id': 3}
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    # Progress counters, updated by the worker while the job runs
+    progress_current = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(default=0)
+    progress_message = models.CharField(max_length=255, blank=True)
+    result = models.JSONField(null=True, blank=True, help_text="Summary returned by the job handler")
+    error = models.TextField(blank=True)
+    worker_name = models.CharField(max_length=100, blank=True, help_text="Worker that claimed the job")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Job {self.pk} ({self.job_type}, {self.status})"
+
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+    @property
+    def duration_seconds(self):
+        """Run time so far (or total run time once finished), None if not started."""
+        if self.started_at is None:
+            return None
+        end = self.finished_at or timezone.now()
+        return (end - self.started_at).total_seconds()
+
+    @property
+    def progress_percent(self):
+        if not self.progress_total:
+            return 0
+        return int(100 * self.progress_current / self.progress_total)
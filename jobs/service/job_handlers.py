@@ -0,0 +1,89 @@
+# jobs/service/job_handlers.py
+from typing import Any, Dict
+
+from django.db import IntegrityError
+
+from corpus.models import SourceText
+from corpus.service import source_text_service
+from evaluation.models import ExperimentChunkAnalysis
+from evaluation.service import chunk_properties, relevant_chunks, retrieval_simulation
+from experiments.models import ChunkingStrategy, ChunkSet
+from experiments.service import chunk_implementations, chunk_reuse, chunking_pipeline
+from experiments.service.instrumentation import StageTimings
+from jobs.models import Job
+from jobs.service.job_queue import ProgressCallback
+
+
+def chunk(job: Job, progress: ProgressCallback) -> Dict[str, Any]:
+    """Applies a strategy to a document (params: source_text_id, strategy_id)."""
+    source_text = SourceText.objects.get(pk=job.params['source_text_id'])
+    strategy = ChunkingStrategy.objects.get(pk=job.params['strategy_id'])
+
+    existing = ChunkSet.objects.filter(source_text=source_text, strategy=strategy).first()
+    if existing is not None:
+        return {'chunk_set_id': existing.pk, 'n_chunks': existing.chunks.count(), 'already_existed': True}
+
+    progress(0, 2, f"Chunking '{source_text.title}' with '{strategy.name}'")
+    content = source_text_service.get_full_text(source_text)
+    # Same content already chunked with an equivalent strategy: copy its chunks instead
+    try:
+        chunk_set = chunk_reuse.clone_equivalent(source_text, strategy, content)
+    except IntegrityError:
+        chunk_set = None  # Saved meanwhile by another worker: reported below by save_chunk_set
+    if chunk_set is not None:
+        return {'chunk_set_id': chunk_set.pk, 'n_chunks': chunk_set.chunks.count(), 'cloned_from': chunk_set.cloned_from_id}
+
+    timings = StageTimings(f"Chunking '{strategy.name}' on '{source_text.title}'")
+    chunks_data = chunk_implementations.apply_chunking_strategy(strategy, content, timings=timings)
+
+    progress(1, 2, f"Saving {len(chunks_data)} chunks")
+    try:
+        chunk_set = chunking_pipeline.save_chunk_set(source_text, strategy, chunks_data, timings)
+    except IntegrityError:
+        # Another worker saved the same pair while this one was chunking
+        existing = ChunkSet.objects.get(source_text=source_text, strategy=strategy)
+        return {'chunk_set_id': existing.pk, 'n_chunks': existing.chunks.count(), 'already_existed': True}
+    return {'chunk_set_id': chunk_set.pk, 'n_chunks': len(chunks_data)}
+
+
+def initialize_analysis(job: Job, progress: ProgressCallback) -> Dict[str, Any]:
+    """Finds the relevant chunks of an analysis (params: analysis_id)."""
+    analysis = ExperimentChunkAnalysis.objects.get(pk=job.params['analysis_id'])
+    progress(0, 1, "Finding relevant chunks")
+    relevant_chunks.initialize_analysis(analysis)
+    analysis.refresh_from_db()
+    return {'k_relevant': analysis.k_relevant}
+
+
+def simulate(job: Job, progress: ProgressCallback) -> Dict[str, Any]:
+    """
+    Runs a retrieval simulation and its RDSG/NDCG scoring
+    (params: analysis_id, retriever_name, embedding_model_name).
+    """
+    analysis = ExperimentChunkAnalysis.objects.select_related('experiment__question', 'chunk_set').get(
+        pk=job.params['analysis_id']
+    )
+    retriever_name = job.params.get('retriever_name') or retrieval_simulation.LLAMA_INDEX_RETRIEVER_NAME
+    model_name = job.params.get('embedding_model_name') or retrieval_simulation.GLOBAL_EMBED_MODEL_NAME
+
+    # Computed on a snapshot first, then written in one short transaction
+    progress(0, 1, f"Retrieving with {retriever_name} ({model_name}) and scoring")
+    simulation = retrieval_simulation.simulate_and_score(analysis, retriever_name=retriever_name,
+                                                         embedding_model_name=model_name)
+    return {'simulation_id': simulation.pk, 'k_retrieved': simulation.k_retrieved, 'ndcg_score': simulation.ndcg_score}
+
+
+def recompute_properties(job: Job, progress: ProgressCallback) -> Dict[str, Any]:
+    """Recalculates w, Density and w' of the ranked chunks of an analysis (params: analysis_id)."""
+    analysis = ExperimentChunkAnalysis.objects.get(pk=job.params['analysis_id'])
+    progress(0, 1, "Calculating chunk properties")
+    chunk_properties.calculate_chunk_properties(analysis)
+    return {'analysis_id': analysis.pk}
+
+
+HANDLERS = {
+    'chunk': chunk,
+    'initialize_analysis': initialize_analysis,
+    'simulate': simulate,
+    'recompute_properties': recompute_properties,
+}
@@ -0,0 +1,112 @@
+# jobs/service/job_queue.py
+import logging
+import traceback
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from django.utils import timezone
+
+from jobs.models import Job
+
+logger = logging.getLogger(__name__)
+
+# A handler receives the Job and a progress callback progress(current, total, message)
+# and returns a JSON-serialisable summary, stored in Job.result.
+ProgressCallback = Callable[[int, int, str], None]
+JobHandler = Callable[[Job, ProgressCallback], Optional[Dict[str, Any]]]
+
+
+def enqueue(job_type: str, params: Optional[Dict[str, Any]] = None) -> Job:
+    """
+    Queues a job. If an identical job (same type and params) is still queued or running,
+    that job is returned instead, so a double submit does not run the work twice.
+    """
+    params = params or {}
+    for job in Job.objects.filter(job_type=job_type, status__in=Job.ACTIVE_STATUSES):
+        if job.params == params:
+            return job
+    job = Job.objects.create(job_type=job_type, params=params)
+    logger.info("JobQueue: queued job %d (%s, %s).", job.pk, job_type, params)
+    return job
+
+
+def active_jobs(job_type: str, **params) -> List[Job]:
+    """Queued/running jobs of the given type whose params contain the given values (for status banners)."""
+    return [
+        job for job in Job.objects.filter(job_type=job_type, status__in=Job.ACTIVE_STATUSES).order_by('created_at')
+        if all(job.params.get(key) == value for key, value in params.items())
+    ]
+
+
+def claim_next_job(worker_name: str) -> Optional[Job]:
+    """
+    Claims the oldest queued job for this worker. The claim is a conditional UPDATE
+    (status still 'queued'), so two workers can never take the same job, even on SQLite.
+    """
+    while True:
+        job = Job.objects.filter(status=Job.STATUS_QUEUED).order_by('created_at', 'pk').first()
+        if job is None:
+            return None
+        claimed = Job.objects.filter(pk=job.pk, status=Job.STATUS_QUEUED).update(
+            status=Job.STATUS_RUNNING, worker_name=worker_name, started_at=timezone.now()
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+        # Another worker claimed it in the meantime: try the next one
+
+
+def update_progress(job: Job, current: int, total: int, message: str = '') -> None:
+    """Stores the progress counters of a running job (single UPDATE, other fields untouched)."""
+    job.progress_current, job.progress_total, job.progress_message = current, total, message[:255]
+    Job.objects.filter(pk=job.pk).update(
+        progress_current=job.progress_current, progress_total=job.progress_total,
+        progress_message=job.progress_message,
+    )
+
+
+def run_job(job: Job, handlers: Dict[str, JobHandler]) -> Job:
+    """Executes a claimed job with its handler and records the outcome (result or traceback) and timing."""
+    handler = handlers.get(job.job_type)
+    try:
+        if handler is None:
+            raise ValueError(f"No handler registered for job type '{job.job_type}'.")
+        result = handler(job, lambda current, total, message='': update_progress(job, current, total, message))
+        job.status = Job.STATUS_SUCCEEDED
+        job.result = result
+        if job.progress_total:
+            job.progress_current = job.progress_total
+    except Exception:
+        job.status = Job.STATUS_FAILED
+        job.error = traceback.format_exc()
+        logger.exception("JobQueue: job %d (%s) failed.", job.pk, job.job_type)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'progress_current', 'finished_at'])
+    logger.info("JobQueue: job %d %s in %.2fs.", job.pk, job.status, job.duration_seconds or 0.0)
+    return job
+
+
+def requeue_stale_jobs(older_than: timedelta) -> int:
+    """Puts back in the queue the jobs left 'running' by a worker that died. Returns how many."""
+    return Job.objects.filter(
+        status=Job.STATUS_RUNNING, started_at__lt=timezone.now() - older_than
+    ).update(status=Job.STATUS_QUEUED, worker_name='', started_at=None)
+
+
+def job_status_payload(job: Job) -> Dict[str, Any]:
+    """JSON representation of a job, returned by the polling endpoint."""
+    return {
+        'id': job.pk,
+        'job_type': job.job_type,
+        'status': job.status,
+        'progress_current': job.progress_current,
+        'progress_total': job.progress_total,
+        'progress_percent': job.progress_percent,
+        'progress_message': job.progress_message,
+        'result': job.result,
+        'error': job.error.strip().splitlines()[-1] if job.error else '',
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'duration_seconds': job.duration_seconds,
+    }
@@ -0,0 +1,120 @@
+from unittest import mock
+
+from django.db.models.query import QuerySet
+from django.test import TestCase
+from django.urls import reverse
+
+from corpus.models import Question, SourceText
+from evaluation.models import ExperimentChunkAnalysis
+from experiments.models import ChunkingStrategy, ChunkSet, Experiment
+from jobs.models import Job
+from jobs.service import job_queue
+
+
+class ClaimNextJobTests(TestCase):
+
+    def test_claims_oldest_queued_job(self):
+        first, second = job_queue.enqueue('chunk', {'n': 1}), job_queue.enqueue('chunk', {'n': 2})
+
+        self.assertEqual(job_queue.claim_next_job('worker-a').pk, first.pk)
+        job = job_queue.claim_next_job('worker-b')
+        self.assertEqual((job.pk, job.status, job.worker_name), (second.pk, Job.STATUS_RUNNING, 'worker-b'))
+        self.assertIsNone(job_queue.claim_next_job('worker-c'))
+
+    def test_job_claimed_by_another_worker_meanwhile_is_skipped(self):
+        first, second = job_queue.enqueue('chunk', {'n': 1}), job_queue.enqueue('chunk', {'n': 2})
+        original_first = QuerySet.first
+        reads = []
+
+        def first_then_claimed_elsewhere(queryset):
+            job = original_first(queryset)
+            if not reads and job is not None:
+                # Worker A claims the job between worker B's read and its conditional UPDATE
+                Job.objects.filter(pk=job.pk).update(status=Job.STATUS_RUNNING, worker_name='worker-a')
+            reads.append(job)
+            return job
+
+        with mock.patch.object(QuerySet, 'first', first_then_claimed_elsewhere):
+            job = job_queue.claim_next_job('worker-b')
+
+        self.assertEqual(job.pk, second.pk)
+        self.assertEqual(Job.objects.get(pk=first.pk).worker_name, 'worker-a')
+        self.assertEqual(Job.objects.filter(worker_name='worker-b').count(), 1)
+
+
+class RunJobTests(TestCase):
+
+    def run_claimed(self, handler):
+        job_queue.enqueue('chunk', {'n': 1})
+        job = job_queue.run_job(job_queue.claim_next_job('worker'), {'chunk': handler})
+        job.refresh_from_db()
+        return job
+
+    def test_success_stores_result_and_completes_progress(self):
+        def handler(job, progress):
+            progress(1, 4, 'working')
+            return {'chunks': 12}
+
+        job = self.run_claimed(handler)
+        self.assertEqual(job.status, Job.STATUS_SUCCEEDED)
+        self.assertEqual(job.result, {'chunks': 12})
+        self.assertEqual((job.progress_current, job.progress_total), (4, 4))
+        self.assertEqual(job.error, '')
+        self.assertIsNotNone(job.finished_at)
+
+    def test_failure_stores_the_traceback(self):
+        def handler(job, progress):
+            raise RuntimeError("chunking exploded")
+
+        with self.assertLogs('jobs.service.job_queue', level='ERROR'):
+            job = self.run_claimed(handler)
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertIn("RuntimeError: chunking exploded", job.error)
+        self.assertEqual(job_queue.job_status_payload(job)['error'], "RuntimeError: chunking exploded")
+        self.assertIsNotNone(job.finished_at)
+
+    def test_missing_handler_fails_the_job(self):
+        job_queue.enqueue('simulate', {'analysis_id': 1})
+        with self.assertLogs('jobs.service.job_queue', level='ERROR'):
+            job = job_queue.run_job(job_queue.claim_next_job('worker'), {})
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertIn("No handler registered for job type 'simulate'", job.error)
+
+
+class EnqueueViewTests(TestCase):
+
+    def setUp(self):
+        self.source_text = SourceText.objects.create(title='Test document', file='source_texts/Test document.txt')
+        self.strategy = ChunkingStrategy.objects.create(name='Length 128', method_type='length',
+                                                        parameters={'chunk_size': 128, 'chunk_overlap': 10})
+
+    def test_apply_strategy_queues_one_chunk_job(self):
+        url = reverse('experiments:apply_strategy_to_document',
+                      kwargs={'source_text_pk': self.source_text.pk, 'strategy_pk': self.strategy.pk})
+        self.client.post(url)
+        self.client.post(url)  # Double submit: the queued job is reused
+
+        job = Job.objects.get()
+        self.assertEqual((job.job_type, job.status), ('chunk', Job.STATUS_QUEUED))
+        self.assertEqual(job.params, {'source_text_id': self.source_text.pk, 'strategy_id': self.strategy.pk})
+
+    def test_apply_strategy_does_not_queue_an_existing_chunk_set(self):
+        ChunkSet.objects.create(source_text=self.source_text, strategy=self.strategy)
+        self.client.post(reverse('experiments:apply_strategy_to_document',
+                                 kwargs={'source_text_pk': self.source_text.pk, 'strategy_pk': self.strategy.pk}))
+        self.assertFalse(Job.objects.exists())
+
+    def test_run_simulation_queues_a_simulate_job(self):
+        question = Question.objects.create(source_text=self.source_text, text='What is it about?')
+        experiment = Experiment.objects.create(source_text=self.source_text, question=question)
+        chunk_set = ChunkSet.objects.create(source_text=self.source_text, strategy=self.strategy)
+        analysis = ExperimentChunkAnalysis.objects.create(experiment=experiment, chunk_set=chunk_set, k_relevant=0)
+        url = reverse('evaluation:detail', kwargs={'experiment_pk': experiment.pk, 'chunk_set_pk': chunk_set.pk})
+
+        self.client.post(url, {'action': 'run_simulation_and_calculate_rdsg', 'retriever_name': 'NoSuchRetriever'})
+        self.assertFalse(Job.objects.exists())
+
+        self.client.post(url, {'action': 'run_simulation_and_calculate_rdsg'})
+        job = Job.objects.get()
+        self.assertEqual(job.job_type, 'simulate')
+        self.assertEqual(job.params['analysis_id'], analysis.pk)
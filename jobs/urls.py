@@ -0,0 +1,10 @@
+# jobs/urls.py
+from django.urls import path
+from . import views
+
+app_name = 'jobs'
+
+urlpatterns = [
+    path('', views.list_jobs, name='list_jobs'),
+    path('<int:pk>/status/', views.job_status, name='job_status'),
+]
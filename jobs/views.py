@@ -0,0 +1,17 @@
+from django.http import JsonResponse
+from django.shortcuts import render, get_object_or_404
+
+from jobs.models import Job
+from jobs.service import job_queue
+
+
+def list_jobs(request):
+    """Shows the most recent background jobs with their status, progress and timing."""
+    jobs = Job.objects.all()[:100]
+    return render(request, 'jobs/list_jobs.html', {'jobs': jobs})
+
+
+def job_status(request, pk):
+    """Polling endpoint: JSON status and progress of a job."""
+    job = get_object_or_404(Job, pk=pk)
+    return JsonResponse(job_queue.job_status_payload(job))